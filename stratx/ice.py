@@ -27,6 +27,8 @@ import pandas as pd
 import matplotlib.pyplot as plt
 from  matplotlib.collections import LineCollection
 import time
+import os
+from concurrent.futures import ThreadPoolExecutor
 from stratx.partdep import getcats
 
 """
@@ -34,7 +36,7 @@ This code was built just to generate ICE plots for comparison in the paper.
 We just hacked it together.
 """
 
-def friedman_partial_dependences(model,X,numx=100,mean_centered=True):
+def friedman_partial_dependences(model,X,numx=100,mean_centered=True,n_jobs=1):
     """
     Plot with stuff like:
 
@@ -46,73 +48,143 @@ def friedman_partial_dependences(model,X,numx=100,mean_centered=True):
     ax.plot(uniq_x2, pdpy[1], '.', markersize=1, label=f"x2 area={np.mean(np.abs(pdpy2))*3:2f}")
     plt.legend()
     plt.show()
+
+    Columns are computed by n_jobs threads (-1 means all cores); that only
+    helps if model.predict() releases the GIL, such as LightGBM or sklearn
+    forests with n_jobs>1. Each thread works on its own copy of X. The x values
+    of every column are drawn up front in this thread, so results for a given
+    np.random seed do not depend on n_jobs.
     """
-    pdpxs = []
-    pdpys = []
-    for i, colname in enumerate(X.columns):
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = os.cpu_count()
+    uniq_xs = {colname:_friedman_x(X, colname, numx) for colname in X.columns}
+    def column_pdp(colname):
         print(colname)
-        pdpx, pdpy = friedman_partial_dependence(model,X,colname,numx=numx,mean_centered=mean_centered)
-        pdpxs.append(pdpx)
-        pdpys.append(pdpy)
+        return friedman_partial_dependence(model,X,colname,mean_centered=mean_centered,
+                                           uniq_x=uniq_xs[colname])
+    if n_jobs==1:
+        results = [column_pdp(colname) for colname in X.columns]
+    else:
+        with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+            results = list(pool.map(column_pdp, X.columns))
+    pdpxs = [pdpx for pdpx, pdpy in results]
+    pdpys = [pdpy for pdpx, pdpy in results]
     return pdpxs, pdpys
 
 
-def friedman_partial_dependence(model,X,colname,numx=100,mean_centered=True):
+def friedman_partial_dependence(model,X,colname,numx=100,mean_centered=True,uniq_x=None):
     """
     Return the partial dependence curve for y on X[colname] using all
     unique x values. For each unique x, replace entire X[colname] with
     it then compute average prediction. That is PDP for that x.
+    Pass uniq_x to use those x values instead of drawing numx of them.
+
+    X is not modified: X[colname] is overwritten in a private copy of X
+    (see _override_buffer()) reused across x values, so it is safe to call this
+    from multiple threads at once on the same X.
     """
-    save_x = X[colname].copy()
-    if numx is not None:
-        uniq_x = np.random.choice(X[colname], numx)
-    else:
-        uniq_x = np.unique(X[colname])
+    if uniq_x is None:
+        uniq_x = _friedman_x(X, colname, numx)
     pdpx = uniq_x
     pdpy = np.empty(shape=(len(uniq_x),))
+    X_scratch = _override_buffer(X)
     for i,x in enumerate(uniq_x):
-        X[colname] = x
-    #     print(X)
-        y_pred = model.predict(X)
+        _override_column(X_scratch, colname, np.full(len(X_scratch), x))
+        y_pred = model.predict(X_scratch)
         pdpy[i] = y_pred.mean()
-    X[colname] = save_x
     if mean_centered:
         pdpy = pdpy - np.mean(pdpy)
     return pdpx, pdpy
 
 
-def original_pdp(model, X, colname):
+def _friedman_x(X, colname, numx):
+    "numx random values of X[colname] or, if numx is None, all unique values"
+    if numx is not None:
+        return np.random.choice(X[colname], numx)
+    return np.unique(X[colname])
+
+
+def original_pdp(model, X, colname, numx=50, chunk_size=1_000_000, tol=None):
     """
     Return an ndarray with relative partial dependence line (average of ICE lines).
-    Attempt is made to get first pdp y to 0.
+    Attempt is made to get first pdp y to 0. The ICE lines are never materialized;
+    see streaming_pdp() for chunk_size and tol.
     """
-    ice = predict_ice(model, X, colname)
-    #  Row 0 is actually the sorted unique X[colname] values used to get predictions.
-    pdp_curve = np.mean(ice[1:], axis=0)
+    linex = np.linspace(np.min(X[colname]), np.max(X[colname]), numx, endpoint=True)
+    pdp_curve, _, _ = streaming_pdp(model, X, colname, linex, chunk_size=chunk_size, tol=tol)
     min_pdp_y = pdp_curve[0]
     # if 0 is in x feature and not on left/right edge, get y at 0
     # and shift so that is x,y 0 point.
-    linex = ice.iloc[0, :]  # get unique x values from first row
     nx = len(linex)
     if linex[int(nx * 0.05)] < 0 or linex[-int(nx * 0.05)] > 0:
-        closest_x_to_0 = np.argmin(
-            np.abs(np.array(linex - 0.0)))  # do argmin w/o depr warning
+        closest_x_to_0 = np.argmin(np.abs(linex - 0.0))
         min_pdp_y = pdp_curve[closest_x_to_0]
 
     pdp_curve -= min_pdp_y
-    return pdp_curve.values
+    return pdp_curve
 
 
-def original_catpdp(model, X, colname):
+def original_catpdp(model, X, colname, chunk_size=1_000_000, tol=None):
     """
-    Return an ndarray with relative partial dependence line (average of ICE lines).
-    Attempt is made to get first pdp y to 0.
+    Return an ndarray with relative partial dependence line (average of ICE lines)
+    at each unique X[colname] category code. See streaming_pdp().
     """
-    ice = predict_catice(model, X, colname)
-    #  Row 0 is actually the sorted unique X[colname] values used to get predictions.
-    pdp_curve = np.mean(ice[1:], axis=0)
+    pdp_curve, _, _ = streaming_pdp(model, X, colname, np.unique(X[colname]),
+                                    chunk_size=chunk_size, tol=tol)
+    return pdp_curve
 
-    return pdp_curve.values
+
+def streaming_pdp(model, X:pd.DataFrame, colname:str, linex, chunk_size=1_000_000,
+                  tol=None, min_rows=1000, random_state=None):
+    """
+    Friedman's partial dependence at each value in linex, the mean over all rows of
+    X of the model's prediction with X[colname] set to that value, without ever
+    holding the (len(X), len(linex)) ICE matrix. Rows are predicted in chunks of
+    about chunk_size / len(linex) rows using ice_matrix() and only a running count,
+    mean, and sum of squared deviations per x value are kept.
+
+    If tol is not None, rows are visited in random order (np.random.default_rng
+    (random_state)) and an x value stops getting predictions once at least
+    min_rows rows have been averaged and the standard error of its mean is <= tol.
+    Chunks then only tile the x values still going.
+
+    Returns pdpy, the standard error of each pdpy value, and how many rows were
+    averaged for each.
+    """
+    linex = np.asarray(linex)
+    n, numx = len(X), len(linex)
+    counts = np.zeros(numx, dtype=np.int64)
+    means = np.zeros(numx)
+    m2 = np.zeros(numx) # sum of squared deviations from the mean
+    going = np.ones(numx, dtype=bool)
+    order = np.random.default_rng(random_state).permutation(n) if tol is not None else None
+    row_block = max(1, chunk_size // max(numx, 1))
+    for r in range(0, n, row_block):
+        rows = np.arange(r, min(r + row_block, n)) if order is None else order[r:r+row_block]
+        xi = np.flatnonzero(going)
+        preds = ice_matrix(model, X.iloc[rows], colname, linex[xi], dtype=np.float64,
+                           chunk_size=chunk_size)
+        # merge this chunk's count, mean, and m2 into the running ones (Chan et al.)
+        nb = len(preds)
+        mean_b = preds.mean(axis=0)
+        m2_b = ((preds - mean_b)**2).sum(axis=0)
+        na = counts[xi]
+        delta = mean_b - means[xi]
+        means[xi] += delta * nb / (na + nb)
+        m2[xi] += m2_b + delta**2 * na * nb / (na + nb)
+        counts[xi] += nb
+        if tol is not None:
+            done = (counts[xi] >= min_rows) & (_stderr(m2[xi], counts[xi]) <= tol)
+            going[xi[done]] = False
+            if not going.any():
+                break
+    return means, _stderr(m2, counts), counts
+
+
+def _stderr(m2, counts):
+    "Standard error of the mean given sums of squared deviations and counts"
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.sqrt(m2 / (counts - 1) / counts)
 
 
 def predict_catice(model, X:pd.DataFrame, colname:str, targetname="target", cats=None, ncats=None):
@@ -122,7 +194,8 @@ def predict_catice(model, X:pd.DataFrame, colname:str, targetname="target", cats
                        cats=cats, nlines=ncats)
 
 
-def predict_ice(model, X:pd.DataFrame, colname:str, targetname="target", cats=None, numx=50, nlines=None):
+def predict_ice(model, X:pd.DataFrame, colname:str, targetname="target", cats=None, numx=50, nlines=None,
+                as_frame=True, dtype=np.float32, chunk_size=1_000_000):
     """
     Return dataframe with one row per observation in X and one column
     per unique value of column identified by colname.
@@ -135,9 +208,14 @@ def predict_ice(model, X:pd.DataFrame, colname:str, targetname="target", cats=No
     	height=62.3638789416112	  height=62.78667197542318 ...
     0	62.786672	              70.595222                ... unique X[colname] values
     1	109.270644	              161.270843               ...
+
+    Predictions are written into one preallocated (nlines+1, numx) array of dtype
+    by ice_matrix(), which calls model.predict() on tiled blocks of at most
+    chunk_size rows rather than once per x value. X is not modified. If nlines
+    is not None, only that many randomly-chosen observations are predicted.
+    With as_frame=False, return that array rather than wrapping it in a DataFrame.
     """
     start = time.time()
-    save = X[colname].copy()
 
     if nlines is not None and nlines > len(X):
         nlines = len(X)
@@ -148,32 +226,73 @@ def predict_ice(model, X:pd.DataFrame, colname:str, targetname="target", cats=No
     elif numx is not None:
         linex = np.linspace(np.min(X[colname]), np.max(X[colname]), numx, endpoint=True)
     else:
-        linex = sorted(X[colname].unique())
+        linex = np.array(sorted(X[colname].unique()))
 
-    lines = np.zeros(shape=(len(X) + 1, len(linex)))
+    rows = None
+    if nlines is not None:
+        rows = np.random.choice(len(X), size=nlines, replace=False)
+
+    nobs = len(X) if rows is None else len(rows)
+    lines = np.empty(shape=(nobs + 1, len(linex)), dtype=dtype)
     lines[0, :] = linex
-    i = 0
-    for v in linex:
-        X[colname] = v
-        y_pred = model.predict(X)
-        lines[1:, i] = y_pred.flatten()
-        i += 1
-    X[colname] = save
+    ice_matrix(model, X, colname, linex, rows=rows, out=lines[1:], chunk_size=chunk_size)
+
+    stop = time.time()
+    print(f"ICE_predict {stop - start:.3f}s")
+    if not as_frame:
+        return lines
     columns = [f"predicted {targetname}\n{colname}={str(v)}"
                for v in linex]
-    df = pd.DataFrame(lines, columns=columns)
+    return pd.DataFrame(lines, columns=columns, copy=False)
 
-    if nlines is not None:
-        # sample lines (first row is special: linex)
-        df_ = pd.DataFrame(lines)
-        df_ = df_.sample(n=nlines, axis=0, replace=False)
-        lines = df_.values
-        lines = np.concatenate([linex.reshape(1,-1),lines], axis=0)
-        df = pd.DataFrame(lines, columns=columns)
 
-    stop = time.time()
-    print(f"ICE_predict {stop - start:.3f}s")
-    return df
+def ice_matrix(model, X:pd.DataFrame, colname:str, linex, rows=None, out=None, dtype=np.float32,
+               chunk_size=1_000_000) -> np.ndarray:
+    """
+    Return the (len(rows), len(linex)) matrix of model predictions for the rows
+    of X (all rows if rows is None) with X[colname] set to each value of linex.
+    The matrix is filled block by block: a block of X rows is tiled once per
+    value in a block of linex, X[colname] is overwritten in the tiled copy, and
+    model.predict() is called once on the whole tile. chunk_size bounds the number
+    of rows in a tile and so the memory used. out is an optional preallocated
+    matrix to fill. X itself is never modified.
+    """
+    linex = np.asarray(linex)
+    X_rows = _override_buffer(X, rows=rows)
+    n, numx = len(X_rows), len(linex)
+    if out is None:
+        out = np.empty(shape=(n, numx), dtype=dtype)
+    row_block = max(1, min(n, chunk_size))
+    x_block = max(1, min(numx, chunk_size // row_block))
+    for r in range(0, n, row_block):
+        X_block = X_rows.iloc[r:r+row_block]
+        nrows = len(X_block)
+        for g in range(0, numx, x_block):
+            values = linex[g:g+x_block]
+            tile = X_block.iloc[np.tile(np.arange(nrows), len(values))].reset_index(drop=True)
+            _override_column(tile, colname, np.repeat(values, nrows))
+            y_pred = model.predict(tile)
+            out[r:r+nrows, g:g+len(values)] = np.asarray(y_pred).reshape(len(values), nrows).T
+    return out
+
+
+def _override_buffer(X:pd.DataFrame, rows=None) -> pd.DataFrame:
+    """
+    Return a copy of X (only the given rows if not None) with a fresh index.
+    Callers overwrite a column in that scratch frame with _override_column()
+    instead of assigning to X[colname], so X never changes. The copy keeps each
+    column's dtype (int, bool, category, ...) as the model saw during training.
+    """
+    X_scratch = X.copy() if rows is None else X.iloc[rows].copy()
+    return X_scratch.reset_index(drop=True)
+
+
+def _override_column(X_scratch:pd.DataFrame, colname:str, values:np.ndarray):
+    "Set X_scratch[colname] to values, keeping a categorical column categorical"
+    dtype = X_scratch[colname].dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        values = pd.Categorical(values, dtype=dtype)
+    X_scratch[colname] = values
 
 
 def ice2lines(ice:np.ndarray) -> np.ndarray:
@@ -33,29 +33,570 @@ import warnings
 from sklearn.utils import resample
 from collections import defaultdict
 from typing import Sequence
+import os
+import hashlib
+import pickle
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 from numba import jit, prange
+import scipy.sparse as sp
+from scipy.sparse.linalg import lsqr
 
 
-def leaf_samples(rf, X_not_col:np.ndarray) -> Sequence:
+class LeafIndex:
     """
-    Return a list of arrays where each array is the set of X sample indexes
-    residing in a single leaf of some tree in rf forest. For example, if there
-    are 4 leaves (in one or multiple trees), we might return:
+    A compact, CSR-style grouping of X sample indexes by leaf for all trees of
+    a forest. The sample indexes in leaf i are:
 
-        array([array([0, 1, 2, 3, 4, 5, 6, 7, 8, 9]),
-           array([10, 11, 12, 13, 14, 15]), array([16, 17, 18, 19, 20]),
-           array([21, 22, 23, 24, 25, 26, 27, 28, 29]))
+        indices[indptr[i]:indptr[i+1]]
+
+    Leaves are ordered by tree then by leaf id within a tree and sample indexes
+    are sorted within each leaf. E.g., for 4 leaves we might have:
+
+        indices = [0 1 2 3 4 5 6 7 8 9 10 11 12 13 14 15 16 17 18 19 20 21 ...]
+        indptr  = [0 10 16 21 30]
+
+    Building the index costs one counting sort per tree, O(n + number of nodes),
+    for the usual small non-negative integer node ids; other ids (e.g., floats
+    or huge ids) fall back to a stable argsort, O(n log n). Either way it
+    allocates just the two arrays rather than a list of arrays, one per leaf.
+    """
+    def __init__(self, indices:np.ndarray, indptr:np.ndarray):
+        self.indices = indices
+        self.indptr = indptr
+
+    @staticmethod
+    def from_leaf_ids(leaf_ids:np.ndarray) -> 'LeafIndex':
+        """
+        Build index from the (n_samples, n_trees) matrix of leaf ids returned
+        from rf.apply().
+        """
+        if leaf_ids.ndim==1:
+            leaf_ids = leaf_ids.reshape(-1,1)
+        n, n_trees = leaf_ids.shape
+        indices = np.empty(shape=(n * n_trees,), dtype=np.int32)
+        indptr = [np.zeros(shape=(1,), dtype=np.int64)]
+        for t in range(n_trees):
+            ids = leaf_ids[:,t]
+            if n>0 and np.issubdtype(ids.dtype, np.integer) and \
+               ids.min()>=0 and ids.max()<=4*n: # typical tree node ids
+                order = _counting_argsort(ids.astype(np.int64), int(ids.max())+1)
+            else:
+                order = np.argsort(ids, kind='stable')
+            indices[t*n:(t+1)*n] = order
+            sorted_ids = ids[order]
+            # leaf boundaries are where the sorted leaf id changes
+            ends = np.flatnonzero(sorted_ids[1:] != sorted_ids[:-1]) + 1
+            ends = np.append(ends, n) if n>0 else ends
+            indptr.append(ends.astype(np.int64) + t*n)
+        return LeafIndex(indices, np.concatenate(indptr))
+
+    def leaf_sizes(self) -> np.ndarray:
+        return np.diff(self.indptr)
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def __getitem__(self, i):
+        return self.indices[self.indptr[i]:self.indptr[i+1]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+@jit(nopython=True, nogil=True)
+def _counting_argsort(ids, nbins):
+    "Same as np.argsort(ids, kind='stable') for ids in [0,nbins) but O(n + nbins)"
+    start = np.zeros(nbins+1, dtype=np.int64)
+    for i in range(len(ids)):
+        start[ids[i]+1] += 1
+    for b in range(nbins):
+        start[b+1] += start[b]
+    order = np.empty(len(ids), dtype=np.int64)
+    for i in range(len(ids)):
+        order[start[ids[i]]] = i
+        start[ids[i]] += 1
+    return order
+
+
+def _sklearn_trees(model):
+    "Return the list of sklearn tree_ structures in model or None if model isn't a tree ensemble"
+    if hasattr(model, 'tree_'):
+        return [model.tree_]
+    estimators = getattr(model, 'estimators_', None)
+    if estimators is None:
+        return None
+    estimators = np.asarray(estimators, dtype=object).ravel()
+    if len(estimators)==0 or not all(hasattr(e, 'tree_') for e in estimators):
+        return None
+    return [e.tree_ for e in estimators]
+
+
+def apply_trees(model, X_not_col:np.ndarray, chunk_size=65536, parallel_jit=True) -> np.ndarray:
+    """
+    Same as model.apply(X_not_col) for a fitted sklearn tree or tree ensemble but
+    traverse the trees with a compiled, parallel loop over rows rather than
+    calling apply() per tree. The tree structure arrays are read once and X_not_col
+    is converted to float32, as sklearn does, chunk_size rows at a time so we
+    never copy all of X. Returns an (n_samples, n_trees) matrix of leaf (node)
+    ids; for other models or X with missing values, defer to model.apply().
+    Callers running in multiple threads at once must pass parallel_jit=False as
+    numba's workqueue threading layer aborts on concurrent parallel kernels.
+    """
+    trees = _sklearn_trees(model)
+    X = np.asarray(X_not_col)
+    if trees is None or X.dtype.kind not in 'biuf' or np.isnan(X).any():
+        return model.apply(X_not_col)
+    node_offset = np.cumsum([0] + [t.node_count for t in trees]).astype(np.int64)
+    left = np.concatenate([t.children_left for t in trees]).astype(np.int32)
+    right = np.concatenate([t.children_right for t in trees]).astype(np.int32)
+    feature = np.concatenate([t.feature for t in trees]).astype(np.int32)
+    threshold = np.concatenate([t.threshold for t in trees]).astype(np.float64)
+    n = len(X)
+    leaf_ids = np.empty(shape=(n, len(trees)), dtype=np.int64)
+    traverse = _apply_trees if parallel_jit else _apply_trees_nonparallel
+    for start in range(0, n, chunk_size):
+        chunk = np.ascontiguousarray(X[start:start+chunk_size], dtype=np.float32)
+        traverse(chunk, left, right, feature, threshold, node_offset,
+                 leaf_ids[start:start+chunk_size])
+    if hasattr(model, 'tree_'):
+        return leaf_ids[:,0]
+    return leaf_ids
+
+
+def _traverse_trees(X, left, right, feature, threshold, node_offset, out):
+    "Set out[i, t] to the leaf of tree t that row i of X lands in"
+    n_trees = len(node_offset) - 1
+    for i in prange(X.shape[0]):
+        for t in range(n_trees):
+            base = node_offset[t]
+            node = base
+            while left[node]!=-1: # -1 means leaf
+                if X[i, feature[node]] <= threshold[node]:
+                    node = base + left[node]
+                else:
+                    node = base + right[node]
+            out[i, t] = node - base
+
+
+_apply_trees = jit(nopython=True, parallel=True, nogil=True)(_traverse_trees)
+# prange() is just range() without parallel=True; safe to call from many threads
+_apply_trees_nonparallel = jit(nopython=True, nogil=True)(_traverse_trees)
+
+
+def _leaf_ids(rf, X_not_col:np.ndarray, parallel_jit=True) -> np.ndarray:
+    "Return the (n_samples, n_trees) leaf ids for X_not_col; see leaf_samples()"
+    if isinstance(rf, np.ndarray):
+        leaf_ids = rf
+    elif isinstance(rf, (Stratifier, HistStratifier)):
+        leaf_ids = rf.apply(X_not_col, parallel_jit=parallel_jit)
+    else:
+        leaf_ids = apply_trees(rf, X_not_col, parallel_jit=parallel_jit)  # which leaf does each X_i go to for each tree?
+    if leaf_ids.ndim==1:
+        leaf_ids = leaf_ids.reshape(-1,1)
+    if leaf_ids.ndim>2: # e.g., gradient boosting gives (n_samples, n_estimators, n_classes)
+        leaf_ids = leaf_ids.reshape(len(leaf_ids), -1)
+    if len(leaf_ids)!=len(X_not_col):
+        raise ValueError(f"Leaf ids are for {len(leaf_ids)} samples but X has {len(X_not_col)}")
+    return leaf_ids
+
+
+def leaf_samples(rf, X_not_col:np.ndarray, parallel_jit=True) -> LeafIndex:
+    """
+    Return a LeafIndex that groups X sample indexes by the leaf they reside
+    in for each tree in rf forest. For example, if there are 4 leaves
+    (in one or multiple trees), leaves[i] gives:
+
+        array([0, 1, 2, 3, 4, 5, 6, 7, 8, 9]),
+        array([10, 11, 12, 13, 14, 15]), array([16, 17, 18, 19, 20]),
+        array([21, 22, 23, 24, 25, 26, 27, 28, 29])
+
+    rf can be any fitted model with an apply() method returning leaf ids, such
+    as a sklearn forest, tree, gradient boosting model, or a Stratifier. rf can
+    also be a precomputed (n_samples, n_trees) matrix of leaf ids for X_not_col,
+    in which case no model is consulted at all. sklearn tree ensembles are
+    traversed with apply_trees(). Grouping samples by leaf uses a counting sort
+    on the node ids. Pass parallel_jit=False when calling from multiple threads.
+    """
+    return LeafIndex.from_leaf_ids(_leaf_ids(rf, X_not_col, parallel_jit=parallel_jit))
+
+
+class Stratifier:
+    """
+    The random forest that partitions x_not_colname space into leaves for
+    StratPD and CatStratPD. In supervised mode, the forest is a regressor
+    fit to (X_not_col, y); in unsupervised mode, it is a classifier
+    distinguishing X_not_col from a scrambled copy (Breiman's trick). fit()
+    fits the forest exactly once so a fitted Stratifier can be passed as
+    stratifier to cat_partial_dependence() and reused across calls, such as
+    plotting trials on the same data.
+    """
+    def __init__(self, n_trees=1, min_samples_leaf=10, max_features=1.0, bootstrap=False,
+                 supervised=True):
+        self.n_trees = n_trees
+        self.min_samples_leaf = min_samples_leaf
+        self.max_features = max_features
+        self.bootstrap = bootstrap
+        self.supervised = supervised
+        self.rf = None
+
+    def fit(self, X_not_col:np.ndarray, y:np.ndarray, random_state=None) -> 'Stratifier':
+        """
+        Fit the forest to X_not_col, y (y is ignored if unsupervised). random_state
+        is None, an int seed, or a np.random.Generator; None means use global
+        np.random state.
+        """
+        rng = _as_rng(random_state)
+        if self.supervised:
+            rf = RandomForestRegressor(n_estimators=self.n_trees,
+                                       min_samples_leaf=self.min_samples_leaf,
+                                       bootstrap=self.bootstrap,
+                                       max_features=self.max_features,
+                                       random_state=_rf_seed(rng))
+            rf.fit(X_not_col, y)
+        else:
+            """
+            Wow. Breiman's trick works in most cases. Falls apart on Boston housing MEDV target vs AGE
+            """
+            X_synth, y_synth = permuted_twoclass(X_not_col, rng=rng)
+            rf = RandomForestClassifier(n_estimators=self.n_trees,
+                                        min_samples_leaf=self.min_samples_leaf,
+                                        bootstrap=self.bootstrap,
+                                        max_features=self.max_features,
+                                        oob_score=False,
+                                        random_state=_rf_seed(rng))
+            rf.fit(X_synth, y_synth)
+            del X_synth
+        self.rf = rf
+        return self
+
+    def apply(self, X_not_col:np.ndarray, parallel_jit=True) -> np.ndarray:
+        "Return the (n_samples, n_trees) matrix of leaf ids for X_not_col"
+        if self.rf is None:
+            raise ValueError("Stratifier must be fit before use")
+        return apply_trees(self.rf, X_not_col, parallel_jit=parallel_jit)
+
+    def leaves(self, X_not_col:np.ndarray) -> LeafIndex:
+        "Group X_not_col sample indexes by leaf; see leaf_samples()"
+        return LeafIndex.from_leaf_ids(self.apply(X_not_col))
+
+
+class HistStratifier:
+    """
+    A lighter-weight alternative to Stratifier for large data. StratPD only
+    needs the partition of x_not_colname space, never predictions, so rather
+    than sklearn's exact-split forest, grow trees on each feature pre-binned
+    into at most max_bins (<=256) quantile bins stored as uint8 codes. Split
+    search is then a scan over per-node histograms of y sums and counts
+    instead of sorting at each node and the working matrix is 8x smaller
+    than float64 X. Leaves honor min_samples_leaf as with sklearn. Only leaf
+    assignments are kept. Pass a fitted HistStratifier as the stratifier
+    argument of partial_dependence() or cat_partial_dependence().
+
+    Supervised trees minimize the squared error of y; unsupervised trees
+    separate X_not_col from a scrambled copy (Breiman's trick) by treating the
+    0/1 class as y. As in sklearn, impure nodes are split while both
+    children can have min_samples_leaf samples. As with sklearn forests, bootstrap resamples rows and
+    max_features is the fraction of features considered at each node.
+    """
+    def __init__(self, n_trees=1, min_samples_leaf=10, max_features=1.0, bootstrap=False,
+                 supervised=True, max_bins=256, max_depth=None):
+        if not 2 <= max_bins <= 256:
+            raise ValueError(f"max_bins must be in 2..256 not {max_bins}")
+        self.n_trees = n_trees
+        self.min_samples_leaf = min_samples_leaf
+        self.max_features = max_features
+        self.bootstrap = bootstrap
+        self.supervised = supervised
+        self.max_bins = max_bins
+        self.max_depth = max_depth
+        self.bin_edges = None
+        self.trees = None
+
+    def fit(self, X_not_col:np.ndarray, y:np.ndarray, random_state=None) -> 'HistStratifier':
+        "Bin X_not_col and grow n_trees trees; random_state as for Stratifier.fit()"
+        rng = _as_rng(random_state)
+        X_not_col = np.asarray(X_not_col)
+        p = X_not_col.shape[1]
+        # Scrambling doesn't change column marginals so bin edges are the same either way
+        self.bin_edges = [self._edges(X_not_col[:,j]) for j in range(p)]
+        codes = self._bin(X_not_col)
+        if not self.supervised:
+            # Scramble the 1-byte bin codes rather than X_not_col itself
+            codes, y = permuted_twoclass(codes, rng=rng, dtype=codes.dtype)
+        y = np.asarray(y, dtype=np.float64)
+        n = len(codes)
+        n_split_features = max(1, int(self.max_features * p)) if isinstance(self.max_features, float) \
+                           else int(self.max_features)
+        max_depth = -1 if self.max_depth is None else self.max_depth
+        self.trees = []
+        for t in range(self.n_trees):
+            if self.bootstrap:
+                samples = rng.integers(0, n, size=n) if rng is not None else np.random.randint(0, n, size=n)
+            else:
+                samples = np.arange(n)
+            seed = _rf_seed(rng) if rng is not None else np.random.randint(0, 2**31 - 1)
+            self.trees.append(_grow_hist_tree(codes, y, samples.astype(np.int64), self.max_bins,
+                                              max(1, self.min_samples_leaf), max_depth,
+                                              n_split_features, seed))
+        return self
+
+    def _edges(self, x):
+        uniq = np.unique(x)
+        if len(uniq) <= self.max_bins: # one bin per unique value
+            return uniq[1:]
+        qs = np.quantile(x, np.linspace(0, 1, self.max_bins + 1)[1:-1])
+        return np.unique(qs)
+
+    def _bin(self, X:np.ndarray) -> np.ndarray:
+        "Map X to uint8 bin codes; code j means bin_edges[j-1] <= x < bin_edges[j]"
+        codes = np.empty(shape=X.shape, dtype=np.uint8)
+        for j, edges in enumerate(self.bin_edges):
+            codes[:,j] = np.searchsorted(edges, X[:,j], side='right')
+        return codes
+
+    def apply(self, X_not_col:np.ndarray, chunk_size=65536, parallel_jit=True) -> np.ndarray:
+        "Return the (n_samples, n_trees) matrix of leaf (node) ids for X_not_col"
+        if self.trees is None:
+            raise ValueError("HistStratifier must be fit before use")
+        X_not_col = np.asarray(X_not_col)
+        node_offset = np.cumsum([0] + [len(t[0]) for t in self.trees]).astype(np.int64)
+        left, right, feature, threshold = [np.concatenate(a) for a in zip(*self.trees)]
+        n = len(X_not_col)
+        leaf_ids = np.empty(shape=(n, len(self.trees)), dtype=np.int64)
+        traverse = _apply_trees if parallel_jit else _apply_trees_nonparallel
+        for start in range(0, n, chunk_size):
+            codes = self._bin(X_not_col[start:start+chunk_size]).astype(np.float32)
+            traverse(codes, left, right, feature, threshold, node_offset,
+                     leaf_ids[start:start+chunk_size])
+        return leaf_ids
+
+    def leaves(self, X_not_col:np.ndarray) -> LeafIndex:
+        "Group X_not_col sample indexes by leaf; see leaf_samples()"
+        return LeafIndex.from_leaf_ids(self.apply(X_not_col))
+
+
+@jit(nopython=True)
+def _grow_hist_tree(codes, y, samples, n_bins, min_samples_leaf, max_depth, n_split_features, seed):
+    """
+    Grow one tree over the rows in samples (may repeat) of the uint8 bin codes.
+    Returns node arrays (left, right, feature, threshold) in the layout of
+    sklearn's tree_ so _apply_trees() can traverse them; a row goes left if its
+    code <= threshold and left[node]==-1 marks a leaf.
+    """
+    np.random.seed(seed)
+    p = codes.shape[1]
+    m = len(samples)
+    max_nodes = 2 * (m // min_samples_leaf) + 3
+    left = np.full(max_nodes, -1, dtype=np.int32)
+    right = np.full(max_nodes, -1, dtype=np.int32)
+    feature = np.full(max_nodes, -2, dtype=np.int32)
+    threshold = np.full(max_nodes, -2.0)
+    idx = samples.copy()
+    buf = np.empty_like(idx)
+    hist_sum = np.zeros((p, n_bins))
+    hist_count = np.zeros((p, n_bins), dtype=np.int64)
+    stack = np.empty((max_nodes, 4), dtype=np.int64) # start, end, node, depth
+    stack[0] = (0, m, 0, 0)
+    top = 1
+    node_count = 1
+    while top>0:
+        top -= 1
+        start, end, node, depth = stack[top]
+        n = end - start
+        if n < 2 * min_samples_leaf or (max_depth>=0 and depth>=max_depth):
+            continue
+        if n_split_features < p:
+            features = np.random.permutation(p)[:n_split_features]
+        else:
+            features = np.arange(p)
+        hist_sum[:] = 0.0
+        hist_count[:] = 0
+        total = 0.0
+        y_min, y_max = np.inf, -np.inf
+        for k in range(start, end):
+            i = idx[k]
+            total += y[i]
+            y_min, y_max = min(y_min, y[i]), max(y_max, y[i])
+            for f in features:
+                hist_sum[f, codes[i, f]] += y[i]
+                hist_count[f, codes[i, f]] += 1
+        if y_min==y_max: # pure node
+            continue
+        # like sklearn, split impure nodes on the best valid split even if gain is 0
+        parent_score = total * total / n
+        best_gain = -np.inf
+        best_f, best_b = -1, -1
+        for f in features:
+            s_left, n_left = 0.0, 0
+            for b in range(n_bins - 1):
+                s_left += hist_sum[f, b]
+                n_left += hist_count[f, b]
+                if n_left < min_samples_leaf:
+                    continue
+                n_right = n - n_left
+                if n_right < min_samples_leaf:
+                    break
+                s_right = total - s_left
+                gain = s_left * s_left / n_left + s_right * s_right / n_right - parent_score
+                if gain > best_gain:
+                    best_gain, best_f, best_b = gain, f, b
+        if best_f<0: # no split leaves min_samples_leaf on both sides
+            continue
+        # stable partition of idx[start:end] into rows going left then right
+        nl, nr = start, 0
+        for k in range(start, end):
+            i = idx[k]
+            if codes[i, best_f] <= best_b:
+                idx[nl] = i
+                nl += 1
+            else:
+                buf[nr] = i
+                nr += 1
+        idx[nl:end] = buf[:nr]
+        left[node], right[node] = node_count, node_count + 1
+        feature[node], threshold[node] = best_f, best_b + 0.5
+        stack[top] = (nl, end, node_count + 1, depth + 1)
+        stack[top+1] = (start, nl, node_count, depth + 1)
+        top += 2
+        node_count += 2
+    return left[:node_count], right[:node_count], feature[:node_count], threshold[:node_count]
+
+
+class LeafCache:
+    """
+    Opt-in on-disk cache of stratification leaf ids so rerunning a PD or plot on
+    the same data with the same hyperparameters skips fitting the forest and
+    calling apply(). Each entry is an (n_samples, n_trees) int32 .npy file in
+    cache_dir that is memory-mapped on a hit plus a pickled .state file holding
+    the random generator state after the fit. Keys hash the content of
+    X_not_col, y (supervised mode only), colname, the forest hyperparameters,
+    and the random generator state; only calls given a random_state are cached
+    as global np.random state can't be keyed. The random generator is left in
+    the same state after a hit as after a fit so later random choices match.
+    When the cache grows beyond max_bytes, least recently used entries are
+    evicted.
+
+    Example:
+
+        cache = LeafCache("/tmp/stratx-cache")
+        plot_stratpd(X, y, 'x1', 'y', random_state=1, cache=cache)
+    """
+    def __init__(self, cache_dir, max_bytes=1_000_000_000):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(X_not_col:np.ndarray, y:np.ndarray, colname:str, rng:np.random.Generator,
+            n_trees, min_samples_leaf, max_features, bootstrap, supervised) -> str:
+        h = hashlib.blake2b(digest_size=20)
+        X_not_col = np.ascontiguousarray(X_not_col)
+        h.update(f"{X_not_col.shape}{X_not_col.dtype}".encode())
+        h.update(memoryview(X_not_col).cast('B'))
+        if supervised:
+            y = np.ascontiguousarray(y)
+            h.update(f"{y.shape}{y.dtype}".encode())
+            h.update(memoryview(y).cast('B'))
+        params = (colname, n_trees, min_samples_leaf, max_features, bootstrap, supervised)
+        h.update(repr(params).encode())
+        # pickle not repr as the state of e.g. MT19937 holds an array repr() would elide
+        h.update(pickle.dumps(rng.bit_generator.state))
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".npy")
+
+    def get(self, key, rng:np.random.Generator):
+        "Return memory-mapped leaf ids for key and restore rng's post-fit state, or None if missing"
+        path = self._path(key)
+        try:
+            leaf_ids = np.load(path, mmap_mode='r')
+            with open(path[:-4] + ".state", "rb") as f:
+                rng.bit_generator.state = pickle.load(f)
+            os.utime(path) # mark as recently used
+        except (FileNotFoundError, ValueError, pickle.UnpicklingError, EOFError):
+            return None
+        return leaf_ids
+
+    def put(self, key, leaf_ids:np.ndarray, rng:np.random.Generator):
+        "Store leaf ids and rng's post-fit state for key, then evict to max_bytes"
+        path = self._path(key)
+        tmp = f"{path[:-4]}.{os.getpid()}.{id(leaf_ids)}.tmp"
+        # Bit generator states are dicts that can hold arrays (e.g., MT19937) so pickle
+        with open(tmp + ".state", "wb") as f:
+            pickle.dump(rng.bit_generator.state, f)
+        os.replace(tmp + ".state", path[:-4] + ".state")
+        with open(tmp, "wb") as f:
+            np.save(f, leaf_ids.astype(np.int32))
+        os.replace(tmp, path)
+        self._evict(keep=path)
+
+    def _evict(self, keep):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".npy"):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError: # evicted by another thread
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path==keep:
+                continue
+            for p in (path, path[:-4] + ".state"):
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".npy") or name.endswith(".state"):
+                os.remove(os.path.join(self.cache_dir, name))
+
+
+def _fit_stratification(X_not_col, y, colname, n_trees, min_samples_leaf, max_features,
+                        bootstrap, supervised, cache=None, rng=None, parallel_jit=True,
+                        verbose=False):
+    """
+    Fit a Stratifier for X_not_col, y or, if cache (a LeafCache) has the leaf ids
+    from an identical earlier fit, return those leaf ids instead. Either result
+    works as the stratifier argument of leaf_samples().
     """
-    n_trees = len(rf.estimators_)
-    leaf_samples = []
-    leaf_ids = rf.apply(X_not_col)  # which leaf does each X_i go to for sole tree?
-    for t in range(n_trees):
-        # Group by id and return sample indexes
-        uniq_ids = np.unique(leaf_ids[:,t])
-        sample_idxs_in_leaves = [np.where(leaf_ids[:, t] == id)[0] for id in uniq_ids]
-        leaf_samples.extend(sample_idxs_in_leaves)
-    return leaf_samples
+    key = None
+    if cache is not None and rng is not None:
+        key = LeafCache.key(X_not_col, y, colname, rng, n_trees, min_samples_leaf,
+                            max_features, bootstrap, supervised)
+        leaf_ids = cache.get(key, rng)
+        if leaf_ids is not None:
+            if verbose: print(f"Using cached partition of 'x not {colname}'")
+            return leaf_ids
+    stratifier = Stratifier(n_trees=n_trees, min_samples_leaf=min_samples_leaf,
+                            max_features=max_features, bootstrap=bootstrap,
+                            supervised=supervised).fit(X_not_col, y, random_state=rng)
+    rf = stratifier.rf
+    if verbose:
+        if supervised:
+            print(f"Partition RF: dropping {colname} training R^2 {rf.score(X_not_col, y):.2f}")
+        else:
+            print("USING UNSUPERVISED MODE")
+        nnodes = rf.estimators_[0].tree_.node_count
+        print(f"Partitioning 'x not {colname}': {nnodes} nodes in (first) tree, "
+              f"{len(rf.estimators_)} trees")
+    if key is not None:
+        leaf_ids = stratifier.apply(X_not_col, parallel_jit=parallel_jit)
+        cache.put(key, leaf_ids, rng)
+        return leaf_ids
+    return stratifier
 
 
 def partial_dependence(X:pd.DataFrame, y:pd.Series, colname:str,
@@ -63,6 +604,13 @@ def partial_dependence(X:pd.DataFrame, y:pd.Series, colname:str,
                        parallel_jit=True,
                        n_trees=1, min_samples_leaf=10, bootstrap=False, max_features=1.0,
                        supervised=True,
+                       n_leaf_bootstraps=0,
+                       bootstrap_percentiles=(2.5, 97.5),
+                       x_grid=None,
+                       stratifier=None,
+                       cache=None,
+                       column_index=None,
+                       random_state=None,
                        verbose=False):
     """
     Internal computation of partial dependence information about X[colname]'s effect on y.
@@ -74,6 +622,25 @@ def partial_dependence(X:pd.DataFrame, y:pd.Series, colname:str,
     :param min_slopes_per_x: ignore pdp y values derived from too few slopes; this is
            same count across all features (tried percentage of max slope count but was
            too variable). Important for getting good starting point of PD.
+    :param n_leaf_bootstraps: if > 0, also compute this many leaf-bootstrap replicates
+           of pdpy using the single fitted forest; see leaf_bootstrap_pdpy().
+    :param bootstrap_percentiles: which percentiles of the replicates to return
+    :param x_grid: to bound the number of x locations for high-cardinality columns,
+           snap each X[colname] value to the nearest point of this sorted array of grid
+           points or, if an int K, of K quantiles of X[colname] before collecting slopes.
+           pdpx is then a subset of the grid. See snap_to_grid().
+    :param stratifier: use an existing partition of X.drop(colname, axis=1) rather than
+           fitting a forest: a fitted Stratifier, any fitted model with an apply()
+           method returning leaf ids (e.g., a sklearn forest), or an (n_samples, n_trees)
+           matrix of leaf ids. n_trees, min_samples_leaf, bootstrap, max_features, and
+           supervised are then ignored.
+    :param cache: optional LeafCache; reuse the partition from an earlier identical
+           call with the same random_state rather than fitting a forest.
+    :param column_index: optional ColumnIndex of X[colname] so repeated calls on the
+           same column (or, via ColumnIndex.take(), on subsamples of it) don't re-sort
+           X[colname]. Ignored if x_grid is not None.
+    :param random_state: None, int seed, or np.random.Generator used for all randomness
+           (forest and unsupervised scrambling); None means use global np.random state.
 
     Returns:
         leaf_xranges    The ranges of X[colname] partitions
@@ -96,47 +663,121 @@ def partial_dependence(X:pd.DataFrame, y:pd.Series, colname:str,
         ignored         How many samples from len(X) total records did we have to
                         ignore because samples in leaves had identical X[colname]
                         values.
+
+        pdpy_bands      Only returned if n_leaf_bootstraps>0. Array with one row of
+                        pdpy values per bootstrap_percentiles value, aligned with pdpx.
+
+        x_snap_error    Only returned if x_grid is not None. Mean absolute distance
+                        X[colname] values moved when snapped to the grid.
   """
     X_not_col = X.drop(colname, axis=1).values
-    X_col = X[colname]
-    if supervised:
-        rf = RandomForestRegressor(n_estimators=n_trees,
-                                   min_samples_leaf=min_samples_leaf,
-                                   bootstrap=bootstrap,
-                                   max_features=max_features)
-        rf.fit(X_not_col, y)
-        if verbose:
-            print(f"Strat Partition RF: dropping {colname} training R^2 {rf.score(X_not_col, y):.2f}")
+    X_col = X[colname].values
+    return _partial_dependence(X_not_col, X_col, np.asarray(y, dtype=float), colname,
+                               min_slopes_per_x=min_slopes_per_x,
+                               parallel_jit=parallel_jit,
+                               n_trees=n_trees, min_samples_leaf=min_samples_leaf,
+                               bootstrap=bootstrap, max_features=max_features,
+                               supervised=supervised,
+                               n_leaf_bootstraps=n_leaf_bootstraps,
+                               bootstrap_percentiles=bootstrap_percentiles,
+                               x_grid=x_grid,
+                               stratifier=stratifier,
+                               cache=cache,
+                               column_index=column_index,
+                               rng=_as_rng(random_state),
+                               verbose=verbose)
 
-    else:
-        """
-        Wow. Breiman's trick works in most cases. Falls apart on Boston housing MEDV target vs AGE
-        """
-        if verbose: print("USING UNSUPERVISED MODE")
-        X_synth, y_synth = conjure_twoclass(X)
-        rf = RandomForestClassifier(n_estimators=n_trees,
-                                    min_samples_leaf=min_samples_leaf,
-                                    bootstrap=bootstrap,
-                                    max_features=max_features,
-                                    oob_score=False)
-        rf.fit(X_synth.drop(colname, axis=1), y_synth)
 
+def _partial_dependence(X_not_col:np.ndarray, X_col:np.ndarray, y:np.ndarray, colname:str,
+                        min_slopes_per_x=5,
+                        parallel_jit=True,
+                        n_trees=1, min_samples_leaf=10, bootstrap=False, max_features=1.0,
+                        supervised=True,
+                        n_leaf_bootstraps=0,
+                        bootstrap_percentiles=(2.5, 97.5),
+                        x_grid=None,
+                        stratifier=None,
+                        cache=None,
+                        column_index=None,
+                        rng=None,
+                        verbose=False):
+    """
+    Same as partial_dependence() but X is already split into X_not_col and X_col
+    arrays so callers such as partial_dependences() avoid DataFrame copies.
+    colname is used only for messages. rng is a np.random.Generator or None.
+    """
+    if stratifier is None:
+        stratifier = _fit_stratification(X_not_col, y, colname, n_trees, min_samples_leaf,
+                                         max_features, bootstrap, supervised,
+                                         cache=cache, rng=rng, parallel_jit=parallel_jit,
+                                         verbose=verbose)
+
+    leaves = leaf_samples(stratifier, X_not_col, parallel_jit=parallel_jit)
     if verbose:
-        leaves = leaf_samples(rf, X_not_col)
-        nnodes = rf.estimators_[0].tree_.node_count
-        print(f"Partitioning 'x not {colname}': {nnodes} nodes in (first) tree, "
-              f"{len(rf.estimators_)} trees, {len(leaves)} total leaves")
+        print(f"Partitioning 'x not {colname}': {len(leaves)} total leaves")
+
+    if x_grid is not None:
+        snapped_x = snap_to_grid(X_col, x_grid)
+        snap_error = np.abs(snapped_x - X_col)
+        x_snap_error = np.mean(snap_error)
+        if verbose:
+            print(f"Snapped {colname} to {len(np.unique(snapped_x))} grid points; "
+                  f"mean abs error {x_snap_error:.4g}, max {np.max(snap_error):.4g}")
+        X_col = snapped_x
+        column_index = None
+    if column_index is None:
+        column_index = ColumnIndex.from_column(X_col)
 
-    leaf_xranges, leaf_slopes, ignored = \
-        collect_discrete_slopes(rf, X, y, colname)
+    leaf_xranges, leaf_slopes, slope_leaves, ignored = \
+        discrete_xc_space(leaves, X_col, y, column_index=column_index)
 
     # print('leaf_xranges', leaf_xranges)
     # print('leaf_slopes', leaf_slopes)
 
-    real_uniq_x = np.unique(X_col) # comes back sorted
+    real_uniq_x = column_index.uniq_x # sorted
     if verbose:
-        print(f"discrete StratPD num samples ignored {ignored}/{len(X)} for {colname}")
+        print(f"discrete StratPD num samples ignored {ignored}/{len(X_col)} for {colname}")
+
+    slope_counts_at_x, dx, slope_at_x, pdpx, pdpy, idx = \
+        _pdp_from_slopes(real_uniq_x, leaf_xranges, leaf_slopes, min_slopes_per_x, parallel_jit)
+
+    results = [leaf_xranges, leaf_slopes, slope_counts_at_x, dx, slope_at_x, pdpx, pdpy, ignored]
+    if n_leaf_bootstraps>0:
+        pdpy_bands = leaf_bootstrap_pdpy(real_uniq_x, leaf_xranges, leaf_slopes, slope_leaves,
+                                         idx, n_leaf_bootstraps,
+                                         percentiles=bootstrap_percentiles,
+                                         rng=rng)
+        results.append(pdpy_bands)
+    if x_grid is not None:
+        results.append(x_snap_error)
+    return tuple(results)
 
+
+def snap_to_grid(X_col:np.ndarray, x_grid) -> np.ndarray:
+    """
+    Return X_col with each value replaced by the nearest point of x_grid, an
+    array of grid points or, if an int K, the K quantiles of X_col from 0 to 1
+    inclusive. Ties go to the lower grid point.
+    """
+    X_col = np.asarray(X_col, dtype=float)
+    if isinstance(x_grid, (int, np.integer)):
+        if x_grid < 2:
+            raise ValueError(f"Need at least 2 quantiles not {x_grid}")
+        x_grid = np.quantile(X_col, np.linspace(0, 1, x_grid))
+    grid = np.unique(np.asarray(x_grid, dtype=float))
+    if len(grid)==1:
+        return np.full(len(X_col), grid[0])
+    i = np.clip(np.searchsorted(grid, X_col), 1, len(grid)-1)
+    below, above = grid[i-1], grid[i]
+    return np.where(X_col - below <= above - X_col, below, above)
+
+
+def _pdp_from_slopes(real_uniq_x, leaf_xranges, leaf_slopes, min_slopes_per_x=5, parallel_jit=True):
+    """
+    Average the leaf slopes at each unique x, drop x with too few slopes, and
+    integrate. Returns slope_counts_at_x, dx, slope_at_x, pdpx, pdpy as in
+    partial_dependence() plus idx, the mask of real_uniq_x values kept in pdpx.
+    """
     #print("uniq x =", len(real_uniq_x), "slopes.shape =", leaf_slopes.shape, "x ranges.shape", leaf_xranges.shape)
     if parallel_jit:
         slope_at_x, slope_counts_at_x = \
@@ -144,7 +785,11 @@ def partial_dependence(X:pd.DataFrame, y:pd.Series, colname:str,
     else:
         slope_at_x, slope_counts_at_x = \
             avg_values_at_x_nonparallel_jit(real_uniq_x, leaf_xranges, leaf_slopes)
+    return _integrate_slopes(real_uniq_x, slope_at_x, slope_counts_at_x, min_slopes_per_x)
 
+
+def _integrate_slopes(real_uniq_x, slope_at_x, slope_counts_at_x, min_slopes_per_x=5):
+    "Tail of _pdp_from_slopes() given the avg slope and slope count at each unique x"
     # Drop any nan slopes; implies we have no reliable data for that range
     # Last slope is nan since no data after last x value so that will get dropped too
     # Also cut out any pdp x for which we don't have enough support (num slopes avg'd together)
@@ -175,10 +820,323 @@ def partial_dependence(X:pd.DataFrame, y:pd.Series, colname:str,
     y_deltas = dydx * dx   # change in y from dx[i] to dx[i+1]
     pdpy = np.cumsum(y_deltas)                    # we lose one value from np.diff(pdpx)
     pdpy = np.concatenate([np.array([0]), pdpy])  # add back the 0 we lost
-
+    return slope_counts_at_x, dx, slope_at_x, pdpx, pdpy, idx
+
+
+def streaming_partial_dependence(source, colname, targetname,
+                                 sample_size=100_000,
+                                 chunk_size=500_000,
+                                 min_slopes_per_x=5,
+                                 parallel_jit=True,
+                                 n_trees=1, min_samples_leaf=10, bootstrap=False, max_features=1.0,
+                                 supervised=True,
+                                 stratifier=None,
+                                 random_state=None,
+                                 verbose=False):
+    """
+    Out-of-core version of partial_dependence() for data sets bigger than memory.
+    source is the path of a 2D .npy file (memory-mapped; colname and targetname
+    are then integer column indexes), of an Arrow IPC/Feather v2 file (memory-mapped
+    via pyarrow; colname and targetname are column names), or a 2D array such as
+    an np.memmap.
+
+    The stratifier is fit to a uniform random sample of sample_size rows,
+    unless a fitted stratifier is passed in. Then chunk_size rows at a time are
+    partitioned and reduced to additive per-(leaf, x) y sums and counts (see
+    LeafXStats), so only one chunk of raw rows is ever in memory. pdpx/pdpy
+    are computed from the merged stats at the end. Returns the same values
+    as partial_dependence() but without leaf bootstraps.
+    """
+    rng = _as_rng(random_state)
+    table = _ChunkedTable(source)
+    col = table.column_index(colname)
+    target = table.column_index(targetname)
+    not_col = [j for j in range(table.n_columns) if j not in (col, target)]
+
+    if stratifier is None:
+        n = table.n_rows
+        if sample_size < n:
+            sample = np.random.choice(n, size=sample_size, replace=False) if rng is None \
+                     else rng.choice(n, size=sample_size, replace=False)
+            rows = table.take(np.sort(sample))
+        else:
+            rows = table.read(0, n)
+        stratifier = Stratifier(n_trees=n_trees, min_samples_leaf=min_samples_leaf,
+                                max_features=max_features, bootstrap=bootstrap,
+                                supervised=supervised).fit(rows[:,not_col], rows[:,target],
+                                                           random_state=rng)
+        del rows
+
+    stats = LeafXStats.from_arrays(np.empty(0, dtype=np.int64), np.empty(0), np.empty(0))
+    for start in range(0, table.n_rows, chunk_size):
+        rows = table.read(start, start + chunk_size)
+        leaf_ids = np.asarray(stratifier.apply(rows[:,not_col])).reshape(len(rows), -1)
+        n_rows, n_tree_cols = leaf_ids.shape
+        # make leaf ids unique across trees then flatten tree-major
+        leaf = (leaf_ids.astype(np.int64) + (np.arange(n_tree_cols, dtype=np.int64) << 32)).T.ravel()
+        chunk_stats = LeafXStats.from_arrays(leaf, np.tile(rows[:,col], n_tree_cols),
+                                             np.tile(rows[:,target], n_tree_cols))
+        stats = stats.merge(chunk_stats)
+        if verbose: print(f"Streamed rows {start}..{start+n_rows}; {len(stats.x)} (leaf, x) groups")
+
+    leaf_xranges, leaf_slopes, slope_leaves, ignored = stats.slopes()
+    slope_counts_at_x, dx, slope_at_x, pdpx, pdpy, idx = \
+        _pdp_from_slopes(stats.uniq_x(), leaf_xranges, leaf_slopes, min_slopes_per_x, parallel_jit)
     return leaf_xranges, leaf_slopes, slope_counts_at_x, dx, slope_at_x, pdpx, pdpy, ignored
 
 
+class _ChunkedTable:
+    "Row-range and row-index access to a .npy file, Arrow/Feather file, or 2D array as float64"
+    def __init__(self, source):
+        self.columns = None
+        self.table = None
+        if isinstance(source, (str, os.PathLike)) and str(source).endswith('.npy'):
+            source = np.load(source, mmap_mode='r')
+        if isinstance(source, (str, os.PathLike)):
+            try:
+                import pyarrow as pa
+            except ImportError:
+                raise ImportError("Reading Arrow/Feather files requires pyarrow")
+            self.table = pa.ipc.open_file(pa.memory_map(str(source), 'r')).read_all()
+            self.columns = self.table.column_names
+            self.n_rows, self.n_columns = self.table.num_rows, self.table.num_columns
+        else:
+            if source.ndim!=2:
+                raise ValueError(f"Expecting 2D array not shape {source.shape}")
+            self.array = source
+            self.n_rows, self.n_columns = source.shape
+
+    def column_index(self, colname):
+        if self.columns is None:
+            return int(colname)
+        return self.columns.index(colname)
+
+    def _to_numpy(self, table):
+        return np.column_stack([np.asarray(table.column(j).to_numpy(), dtype=np.float64)
+                                for j in range(self.n_columns)])
+
+    def read(self, start, stop):
+        if self.table is not None:
+            return self._to_numpy(self.table.slice(start, max(0, min(stop, self.n_rows) - start)))
+        return np.asarray(self.array[start:stop], dtype=np.float64)
+
+    def take(self, idx):
+        if self.table is not None:
+            return self._to_numpy(self.table.take(idx))
+        return np.asarray(self.array[idx], dtype=np.float64)
+
+
+class PDAggregate:
+    """
+    Mergeable partial state of StratPD for X[colname] so partial dependence can be
+    computed map-reduce style over row shards, in a process pool or across
+    machines via files, without moving raw rows. A shard's leaf slopes are kept
+    in difference form: each slope over [x_lo, x_hi) adds (slope, 1) to the
+    event at x_lo and subtracts it at x_hi. Summing the events at or before
+    each unique x gives the slope sum and count there, as in avg_values_at_x_jit().
+    Events and unique x values from different shards combine by key so merge()
+    is associative and commutative; finalize() gives the PD. Each shard
+    partitions its own rows (or applies a shared stratifier), so the merged
+    result is like StratPD with one forest per shard.
+
+    The state is a few arrays of size O(unique x), which pickle as is or
+    save()/load() with np.savez_compressed.
+    """
+    def __init__(self, uniq_x, event_x, event_sum, event_count, ignored=0):
+        self.uniq_x = uniq_x
+        self.event_x = event_x
+        self.event_sum = event_sum
+        self.event_count = event_count
+        self.ignored = ignored
+
+    @staticmethod
+    def from_slopes(uniq_x, leaf_xranges, leaf_slopes, ignored=0) -> 'PDAggregate':
+        "Build from unique X[colname] values and leaf slopes such as partial_dependence() returns"
+        ok = ~np.isnan(leaf_slopes)
+        leaf_xranges, leaf_slopes = leaf_xranges[ok], leaf_slopes[ok]
+        event_x = np.concatenate([leaf_xranges[:,0], leaf_xranges[:,1]])
+        event_sum = np.concatenate([leaf_slopes, -leaf_slopes])
+        event_count = np.concatenate([np.ones(len(leaf_slopes), dtype=np.int64),
+                                      -np.ones(len(leaf_slopes), dtype=np.int64)])
+        return PDAggregate(np.unique(uniq_x), *_sum_by_key(event_x, event_sum, event_count),
+                           ignored=int(ignored))
+
+    @staticmethod
+    def from_data(X:pd.DataFrame, y:pd.Series, colname:str, **kwargs) -> 'PDAggregate':
+        """
+        Run partial_dependence(X, y, colname, **kwargs) on a shard and keep its leaf
+        slopes. With x_grid in kwargs, the slopes are between snapped x values so
+        uniq_x comes from the snapped column too. Pass an array of grid points
+        rather than a quantile count so all shards snap to the same grid.
+        """
+        result = partial_dependence(X, y, colname, **kwargs)
+        leaf_xranges, leaf_slopes, ignored = result[0], result[1], result[7]
+        X_col = X[colname].values
+        if kwargs.get('x_grid') is not None:
+            X_col = snap_to_grid(X_col, kwargs['x_grid'])
+        return PDAggregate.from_slopes(X_col, leaf_xranges, leaf_slopes, ignored)
+
+    def merge(self, other:'PDAggregate') -> 'PDAggregate':
+        return PDAggregate(np.union1d(self.uniq_x, other.uniq_x),
+                           *_sum_by_key(np.concatenate([self.event_x, other.event_x]),
+                                        np.concatenate([self.event_sum, other.event_sum]),
+                                        np.concatenate([self.event_count, other.event_count])),
+                           ignored=self.ignored + other.ignored)
+
+    def finalize(self, min_slopes_per_x=5):
+        """
+        Return slope_counts_at_x, dx, slope_at_x, pdpx, pdpy, ignored as in
+        partial_dependence().
+        """
+        nx = len(self.uniq_x)
+        where = np.searchsorted(self.uniq_x, self.event_x)
+        slope_sums = np.cumsum(np.bincount(where, weights=self.event_sum, minlength=nx+1))[:nx]
+        slope_counts_at_x = np.cumsum(np.bincount(where, weights=self.event_count, minlength=nx+1))[:nx]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            slope_at_x = np.where(slope_counts_at_x==0, np.nan, slope_sums / slope_counts_at_x)
+        slope_counts_at_x, dx, slope_at_x, pdpx, pdpy, _ = \
+            _integrate_slopes(self.uniq_x, slope_at_x, slope_counts_at_x, min_slopes_per_x)
+        return slope_counts_at_x, dx, slope_at_x, pdpx, pdpy, self.ignored
+
+    def save(self, path):
+        np.savez_compressed(path, uniq_x=self.uniq_x, event_x=self.event_x, event_sum=self.event_sum,
+                            event_count=self.event_count, ignored=self.ignored)
+
+    @staticmethod
+    def load(path) -> 'PDAggregate':
+        with np.load(path) as f:
+            return PDAggregate(f['uniq_x'], f['event_x'], f['event_sum'], f['event_count'],
+                               int(f['ignored']))
+
+
+def _sum_by_key(keys, *values):
+    "Return sorted unique keys and the sum of each values array per key"
+    uniq, inverse = np.unique(keys, return_inverse=True)
+    sums = [np.bincount(inverse, weights=v, minlength=len(uniq)).astype(v.dtype) for v in values]
+    return (uniq, *sums)
+
+
+def leaf_bootstrap_pdpy(uniq_x, leaf_xranges, leaf_slopes, slope_leaves, idx,
+                        n_leaf_bootstraps=200,
+                        percentiles=(2.5, 97.5),
+                        rng=None) -> np.ndarray:
+    """
+    Estimate uncertainty in pdpy without refitting the stratification forest.
+    Each bootstrap replicate resamples, with replacement, the leaves that
+    contributed slopes and weights each leaf's slopes by how many times the leaf
+    was drawn. The weighted average slope at each uniq_x[idx] (the pdpx of the
+    point estimate) is then integrated just like pdpy. If a replicate has no
+    slopes at some pdpx, the point estimate slope is used there.
+
+    All replicates share leaf_xranges/leaf_slopes and the searchsorted endpoints,
+    so each costs one O(nx + nslopes) weighted sweep rather than a forest fit.
+
+    Returns array with shape (len(percentiles), len(pdpx)): one pdpy curve per
+    requested percentile of the replicates.
+    """
+    if rng is None:
+        rng = np.random.default_rng(np.random.randint(0, 2**31 - 1))
+    nx = len(uniq_x)
+    lo = np.searchsorted(uniq_x, leaf_xranges[:,0]) if len(leaf_slopes)>0 else np.empty(0, dtype=np.int64)
+    hi = np.searchsorted(uniq_x, leaf_xranges[:,1]) if len(leaf_slopes)>0 else np.empty(0, dtype=np.int64)
+    uniq_leaves, slope_leaf_idx = np.unique(slope_leaves, return_inverse=True)
+    n_leaves = len(uniq_leaves)
+
+    point_slope_at_x, _ = _sweep_slopes(nx, lo, hi, leaf_slopes, np.ones(len(leaf_slopes)))
+    point_slope_at_x = point_slope_at_x[idx]
+    dx = np.diff(uniq_x[idx])
+
+    replicates = np.empty(shape=(n_leaf_bootstraps, len(dx)+1))
+    for b in range(n_leaf_bootstraps):
+        leaf_weights = np.bincount(rng.integers(0, n_leaves, size=n_leaves), minlength=n_leaves)
+        slope_at_x, _ = _sweep_slopes(nx, lo, hi, leaf_slopes,
+                                      leaf_weights[slope_leaf_idx].astype(np.float64))
+        slope_at_x = slope_at_x[idx]
+        slope_at_x = np.where(np.isnan(slope_at_x), point_slope_at_x, slope_at_x)
+        replicates[b, 0] = 0
+        replicates[b, 1:] = np.cumsum(slope_at_x[:-1] * dx)
+
+    return np.percentile(replicates, percentiles, axis=0)
+
+
+def stratpd_trials(X:pd.DataFrame, y:pd.Series, colname:str,
+                   n_trials=1,
+                   bootstrap=False,
+                   subsample_size=.75,
+                   n_jobs=1,
+                   column_index=None,
+                   random_state=None,
+                   **kwargs) -> list:
+    """
+    Run partial_dependence() n_trials times, each on a bootstrapped or subsampled
+    version of X,y (or X,y itself if n_trials==1), and return the list of
+    partial_dependence() result tuples in trial order. No plotting is done.
+
+    Each trial draws all of its randomness (resampling, forest, scrambling)
+    from its own np.random.Generator seeded from SeedSequence(random_state).spawn(),
+    so results are identical regardless of n_jobs. If random_state is None,
+    the seed is drawn from global np.random state so np.random.seed() still works.
+
+    :param n_jobs: how many threads to use; -1 means all cores. Trials run
+                   concurrently so they use the serial (not parallel) jit'd code.
+    :param column_index: optional ColumnIndex of X[colname]; each trial uses
+                         ColumnIndex.take() on it rather than re-sorting X[colname].
+    :param kwargs: passed to partial_dependence()
+    """
+    n_jobs = _n_workers(n_jobs, n_trials)
+    if n_jobs>1:
+        # numba's parallel threading layer can't be entered from multiple threads at once
+        kwargs['parallel_jit'] = False
+
+    def trial(seed):
+        rng = np.random.default_rng(seed)
+        X_, y_, idxs = _resample_trial(X, y, n_trials, bootstrap, subsample_size, rng)
+        column_index_ = column_index
+        if idxs is not None and column_index is not None:
+            column_index_ = column_index.take(idxs)
+        return partial_dependence(X=X_, y=y_, colname=colname,
+                                  bootstrap=bootstrap,
+                                  column_index=column_index_,
+                                  random_state=rng,
+                                  **kwargs)
+
+    return _run_trials(trial, n_trials, n_jobs, random_state)
+
+
+def _n_workers(n_jobs, n_tasks):
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = os.cpu_count()
+    return max(1, min(n_jobs, n_tasks))
+
+
+def _run_trials(trial, n_trials, n_jobs, random_state):
+    "Call trial(seed) for n_trials seeds spawned from random_state using n_jobs threads"
+    if random_state is None:
+        random_state = np.random.randint(0, 2**31 - 1)
+    elif isinstance(random_state, np.random.Generator):
+        random_state = random_state.integers(0, 2**31 - 1)
+    seeds = np.random.SeedSequence(random_state).spawn(n_trials)
+    if n_jobs<=1:
+        return [trial(seed) for seed in seeds]
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        return list(pool.map(trial, seeds))
+
+
+def _resample_trial(X, y, n_trials, bootstrap, subsample_size, rng):
+    """
+    Bootstrap or subsample X,y using rng if n_trials>1 else return X,y.
+    Also returns the row indexes used, or None if X,y are returned as is.
+    """
+    if n_trials<=1:
+        return X, y, None
+    n = len(X)
+    if bootstrap:
+        idxs = rng.choice(n, size=n, replace=True)
+    else: # subsample
+        idxs = rng.choice(n, size=int(n*subsample_size), replace=False)
+    return X.iloc[idxs], y.iloc[idxs], idxs
+
+
 def plot_stratpd(X:pd.DataFrame, y:pd.Series, colname:str, targetname:str,
                  min_slopes_per_x=5,
                  n_trials=1,
@@ -222,6 +1180,11 @@ def plot_stratpd(X:pd.DataFrame, y:pd.Series, colname:str, targetname:str,
                  barchart_size=0.20,
                  barchar_alpha=1.0, # if show_slope_counts, what ratio of vertical space should barchart use at bottom?
                  barchar_color='#BABABA',
+                 x_grid=None,
+                 stratifier=None,
+                 cache=None,
+                 n_jobs=1,
+                 random_state=None,
                  verbose=False,
                  figsize=None
                  ):
@@ -269,6 +1232,23 @@ def plot_stratpd(X:pd.DataFrame, y:pd.Series, colname:str, targetname:str,
                              curve. This presents a problem when there are few samples with X[colname]
                              values at the extreme left. Default is 5.
 
+    :param x_grid: snap X[colname] to this array of grid points or, if an int K, to K
+                   quantiles before computing slopes; bounds the number of x locations
+                   for high-cardinality columns. See partial_dependence().
+
+    :param stratifier: optional fitted Stratifier or other model with apply(); every
+                       trial then reuses its partition instead of fitting a
+                       forest. See partial_dependence(). A leaf id matrix
+                       only works with n_trials=1 as trials resample X.
+
+    :param cache: optional LeafCache so reruns with the same random_state skip
+                  fitting forests; see LeafCache.
+
+    :param n_jobs: how many threads to use for running trials; see stratpd_trials()
+
+    :param random_state: int seed or np.random.Generator; trials are reproducible
+                         for a given seed regardless of n_jobs.
+
     Returns:
 
         pdpx            The non-NaN unique X[colname] values
@@ -300,27 +1280,31 @@ def plot_stratpd(X:pd.DataFrame, y:pd.Series, colname:str, targetname:str,
             pdpy[i] = m[x]
         return pdpx, pdpy
 
+    X_col = X[colname].values
+    if x_grid is not None:
+        X_col = snap_to_grid(X_col, x_grid) # so x counts line up with snapped pdpx
+    column_index = ColumnIndex.from_column(X_col)
+
     all_pdpx = []
     all_pdpy = []
-    n = len(X)
     ignored = 0
-    for i in range(n_trials):
-        if n_trials>1:
-            if bootstrap:
-                idxs = resample(range(n), n_samples=n, replace=True) # bootstrap
-            else: # subsample
-                idxs = resample(range(n), n_samples=int(n*subsample_size), replace=False)
-            X_, y_ = X.iloc[idxs], y.iloc[idxs]
-        else:
-            X_, y_ = X, y
-
-        leaf_xranges, leaf_slopes, slope_counts_at_x, dx, slope_at_x, pdpx, pdpy, ignored_ = \
-            partial_dependence(X=X_, y=y_, colname=colname,
-                               min_slopes_per_x=min_slopes_per_x,
-                               n_trees=n_trees, min_samples_leaf=min_samples_leaf,
-                               bootstrap=bootstrap, max_features=max_features,
-                               supervised=supervised,
-                               verbose=verbose)
+    trials = stratpd_trials(X, y, colname,
+                            n_trials=n_trials,
+                            bootstrap=bootstrap,
+                            subsample_size=subsample_size,
+                            n_jobs=n_jobs,
+                            random_state=random_state,
+                            min_slopes_per_x=min_slopes_per_x,
+                            n_trees=n_trees, min_samples_leaf=min_samples_leaf,
+                            max_features=max_features,
+                            supervised=supervised,
+                            x_grid=x_grid,
+                            stratifier=stratifier,
+                            cache=cache,
+                            column_index=column_index if x_grid is None else None,
+                            verbose=verbose)
+    for result in trials:
+        leaf_xranges, leaf_slopes, slope_counts_at_x, dx, slope_at_x, pdpx, pdpy, ignored_ = result[:8]
         ignored += ignored_
         # print("ignored", ignored_, "pdpy", pdpy)
         all_pdpx.append(pdpx)
@@ -351,7 +1335,7 @@ def plot_stratpd(X:pd.DataFrame, y:pd.Series, colname:str, targetname:str,
     if show_pdp_line:
         ax.plot(pdpx, pdpy, lw=pdp_line_width, c=pdp_line_color)
 
-    domain = (np.min(X[colname]), np.max(X[colname]))  # ignores any max(x) points as no slope info after that
+    domain = (column_index.uniq_x[0], column_index.uniq_x[-1])  # ignores any max(x) points as no slope info after that
 
     if len(pdpy)==0:
         raise ValueError("No partial dependence y values, often due to value of min_samples_leaf that is too small or min_slopes_per_x that is too large")
@@ -386,8 +1370,7 @@ def plot_stratpd(X:pd.DataFrame, y:pd.Series, colname:str, targetname:str,
     else:
         ax.set_ylim(min_y, max_y)
 
-    X_col = X[colname]
-    _, pdpx_counts = np.unique(X_col[np.isin(X_col, pdpx)], return_counts=True)
+    pdpx_counts = column_index.counts_at(pdpx)
 
     leave_room_scaler = 1.3
     x_width = max(pdpx) - min(pdpx) + 1
@@ -483,11 +1466,11 @@ def plot_stratpd(X:pd.DataFrame, y:pd.Series, colname:str, targetname:str,
     return pdpx, pdpy, ignored
 
 
-@jit(nopython=True)
-def discrete_xc_space(x: np.ndarray, y: np.ndarray):
+def discrete_xc_space(leaves:LeafIndex, X_col:np.ndarray, y:np.ndarray,
+                      column_index=None, use_bincount=True):
     """
-    Use the unique x values within a leaf to dynamically compute the "bins,"
-    rather then using a fixed nbins hyper parameter. Group the leaf x,y by x
+    Use the unique x values within each leaf to dynamically compute the "bins,"
+    rather then using a fixed nbins hyper parameter. Group each leaf's x,y by x
     and collect the average y.  The unique x and y averages are the new x and y pairs.
     The slope for each x is:
 
@@ -498,26 +1481,203 @@ def discrete_xc_space(x: np.ndarray, y: np.ndarray):
     E.g., if x is [1,3,4] and y is [9,8,10] then the x=2 coordinate is spanned as part
     of 1 to 3. The two slopes are [(8-9)/(3-1), (10-8)/(4-3)] and bin widths are [2,1].
 
-    If there is exactly one unique x value in the leaf, the leaf provides no information
-    about how X[colname] contributes to changes in y. We have to ignore this leaf.
+    If there is exactly one unique x value in a leaf, the leaf provides no information
+    about how X[colname] contributes to changes in y. We have to ignore that leaf.
+
+    All leaves are processed at once on the int32 rank codes of X_col from a
+    ColumnIndex (built if column_index is None): sort the (leaf, code) pairs of all
+    leaf samples with a single lexsort, average y within each (leaf, code) group using
+    np.add.reduceat(), then take differences between neighboring groups of the
+    same leaf. Slopes come back ordered by leaf then by x within the leaf.
+    Also returns the index of the leaf that produced each slope.
+
+    If there are few enough (leaf, code) cells, as with small-range integer columns
+    like YearMade, skip the sort: use leaf * num unique x + code as a cell index and
+    get per-cell sums and counts with np.bincount. Set use_bincount=False to always sort.
+
+    y can also be an (n, k) matrix of k targets sharing the partition, in which case
+    leaf_slopes is (num slopes, k); see multi_target_partial_dependence().
     """
-    ignored = 0
+    if column_index is None:
+        column_index = ColumnIndex.from_column(X_col)
+    nx = len(column_index.uniq_x)
+    leaf_of_sample = np.repeat(np.arange(len(leaves), dtype=np.int64), leaves.leaf_sizes())
+    codes = column_index.codes[leaves.indices]
+    y = y[leaves.indices]
+
+    n_cells = len(leaves) * nx
+    if use_bincount and n_cells <= max(4 * len(codes), 2**22):
+        cell = leaf_of_sample * nx + codes
+        counts = np.bincount(cell, minlength=n_cells)
+        if y.ndim==1:
+            sum_y = np.bincount(cell, weights=y, minlength=n_cells)
+        else:
+            sum_y = np.column_stack([np.bincount(cell, weights=y[:,t], minlength=n_cells)
+                                     for t in range(y.shape[1])])
+        cells = np.flatnonzero(counts)
+        group_leaf, group_code, sum_y, group_counts = cells // nx, cells % nx, sum_y[cells], counts[cells]
+    else:
+        order = np.lexsort((codes, leaf_of_sample)) # sort by leaf then x within leaf
+        # Group by (leaf, x), take mean of all y with same x value in each leaf
+        group_leaf, group_code, sum_y, group_counts = \
+            _group_sorted(leaf_of_sample[order], codes[order], y[order])
+    avg_y = sum_y / (group_counts if sum_y.ndim==1 else group_counts[:,np.newaxis])
+    return _slopes_from_groups(group_leaf, column_index.uniq_x[group_code], avg_y, group_counts)
 
-    # Group by x, take mean of all y with same x value (they come back sorted too)
-    uniq_x = np.unique(x)
-    avg_y = np.array([y[x==ux].mean() for ux in uniq_x])
 
-    if len(uniq_x)==1:
-        # print(f"ignore {len(x)} in discrete_xc_space")
-        ignored += len(x)
-        return np.array([[0]],dtype=x.dtype), np.array([0.0]), ignored
+class ColumnIndex:
+    """
+    Sort/rank index of one column X[colname], built once with from_column() and
+    shared by partial_dependence(), discrete_xc_space(), and plot_stratpd():
+    uniq_x holds the sorted unique values (as from np.unique()), codes the int32
+    rank of each X[colname] value in uniq_x, and counts how many times each
+    unique value occurs. take() gives the index of a subsample or bootstrap of
+    the rows without sorting again.
+    """
+    def __init__(self, uniq_x:np.ndarray, codes:np.ndarray, counts:np.ndarray):
+        self.uniq_x = uniq_x
+        self.codes = codes
+        self.counts = counts
+
+    @staticmethod
+    def from_column(X_col:np.ndarray) -> 'ColumnIndex':
+        "Index X_col; small-range integer columns use np.bincount instead of a sort"
+        X_col = np.asarray(X_col)
+        int_range = _small_int_range(X_col)
+        if int_range is None:
+            uniq_x, codes, counts = np.unique(X_col, return_inverse=True, return_counts=True)
+            return ColumnIndex(uniq_x, codes.reshape(-1).astype(np.int32), counts)
+        xmin, nx = int_range
+        offset = (X_col - xmin).astype(np.int64)
+        counts = np.bincount(offset, minlength=nx)
+        present = counts > 0
+        rank = (np.cumsum(present) - 1).astype(np.int32)
+        uniq_x = (np.flatnonzero(present) + xmin).astype(X_col.dtype)
+        return ColumnIndex(uniq_x, rank[offset], counts[present])
+
+    def take(self, rows:np.ndarray) -> 'ColumnIndex':
+        "Return the index of X_col[rows]; rows can repeat as with bootstrapping"
+        codes = self.codes[rows]
+        counts = np.bincount(codes, minlength=len(self.uniq_x))
+        present = counts > 0
+        rank = (np.cumsum(present) - 1).astype(np.int32)
+        return ColumnIndex(self.uniq_x[present], rank[codes], counts[present])
+
+    def counts_at(self, x:np.ndarray) -> np.ndarray:
+        "Return how many times each value in x occurs in the column (0 if absent)"
+        x = np.asarray(x)
+        if len(self.uniq_x)==0:
+            return np.zeros(len(x), dtype=int)
+        i = np.minimum(np.searchsorted(self.uniq_x, x), len(self.uniq_x) - 1)
+        return np.where(self.uniq_x[i]==x, self.counts[i], 0)
+
+    def __len__(self):
+        return len(self.codes)
+
+
+def _small_int_range(X_col:np.ndarray, max_range=100_000):
+    """
+    If X_col holds only integer values (of int or float dtype) spanning at most
+    max_range values, return (min, max-min+1) else None. Such columns, like
+    YearMade or MONTH, can use dense arrays indexed by x - min instead of sorting.
+    """
+    if len(X_col)==0 or X_col.dtype.kind not in 'iuf':
+        return None
+    xmin, xmax = np.min(X_col), np.max(X_col)
+    if not np.isfinite(xmin) or not np.isfinite(xmax) or xmax - xmin >= max_range:
+        return None
+    if X_col.dtype.kind=='f' and not np.array_equal(X_col, np.floor(X_col)):
+        return None
+    return xmin, int(xmax - xmin) + 1
+
 
-    bin_deltas = np.diff(uniq_x)
-    y_deltas = np.diff(avg_y)
+def _group_sorted(leaf, x, y, count=None):
+    """
+    Sum y and count samples per (leaf, x) group given samples sorted by leaf then x.
+    If count is not None, y and count are already sums and counts to add up.
+    """
+    if len(x)==0:
+        return leaf, x, np.empty(0), np.empty(0, dtype=int)
+    group_starts = np.flatnonzero(np.concatenate([[True],
+                                                  (leaf[1:] != leaf[:-1]) |
+                                                  (x[1:] != x[:-1])]))
+    if count is None:
+        group_counts = np.diff(np.append(group_starts, len(x)))
+    else:
+        group_counts = np.add.reduceat(count, group_starts)
+    sum_y = np.add.reduceat(y, group_starts)
+    return leaf[group_starts], x[group_starts], sum_y, group_counts
+
+
+def _slopes_from_groups(group_leaf, uniq_x, avg_y, group_counts):
+    """
+    Given avg y and counts per (leaf, unique x) group, sorted by leaf then x,
+    return the leaf_xranges, leaf_slopes, slope_leaves, ignored of discrete_xc_space().
+    slope_leaves holds the position of each slope's leaf in group_leaf order.
+    avg_y may have one column per target, giving one column of slopes per target.
+    """
+    if len(group_leaf)==0: # no samples, such as an empty streaming chunk
+        return np.empty((0, 2), dtype=uniq_x.dtype), np.empty((0,) + avg_y.shape[1:]), \
+               np.empty(0, dtype=np.int64), 0
+    is_leaf_start = np.concatenate([[True], group_leaf[1:] != group_leaf[:-1]])
+    leaf_starts = np.flatnonzero(is_leaf_start)
+    leaf_of_group = np.cumsum(is_leaf_start) - 1
+
+    # Leaves with (effectively) a single x value tell us nothing about slope
+    leaf_min_x = uniq_x[leaf_starts]
+    leaf_max_x = uniq_x[np.append(leaf_starts[1:], len(uniq_x)) - 1]
+    ignored_leaves = np.abs(leaf_min_x - leaf_max_x) < 1.e-8 # faster than np.isclose()
+    ignored = np.sum(np.add.reduceat(group_counts, leaf_starts)[ignored_leaves]) \
+              if len(leaf_starts)>0 else 0
+
+    # Slopes are between neighboring groups within the same (non-ignored) leaf
+    same_leaf = ~is_leaf_start[1:] & ~ignored_leaves[leaf_of_group[:-1]]
+    bin_deltas = (uniq_x[1:] - uniq_x[:-1])[same_leaf]
+    y_deltas = (avg_y[1:] - avg_y[:-1])[same_leaf]
+    if y_deltas.ndim==2:
+        bin_deltas = bin_deltas[:,np.newaxis]
     leaf_slopes = y_deltas / bin_deltas  # "rise over run"
-    leaf_xranges = np.array(list(zip(uniq_x, uniq_x[1:])))
+    leaf_xranges = np.column_stack([uniq_x[:-1][same_leaf], uniq_x[1:][same_leaf]])
+    slope_leaves = leaf_of_group[:-1][same_leaf]
 
-    return leaf_xranges, leaf_slopes, ignored
+    return leaf_xranges, leaf_slopes, slope_leaves, int(ignored)
+
+
+class LeafXStats:
+    """
+    Additive per-(leaf, x) statistics for StratPD: the sum of y and the number
+    of samples for each unique x value within each leaf, sorted by leaf key then
+    x. Leaf keys are any int64 ids unique across trees. Stats for disjoint sets
+    of rows partitioned by the same stratifier merge by adding, so they can be
+    accumulated chunk by chunk; slopes() then gives the same result as
+    discrete_xc_space() on all rows at once.
+    """
+    def __init__(self, leaf, x, sum_y, count):
+        self.leaf = leaf
+        self.x = x
+        self.sum_y = sum_y
+        self.count = count
+
+    @staticmethod
+    def from_arrays(leaf:np.ndarray, x:np.ndarray, y:np.ndarray) -> 'LeafXStats':
+        "Compute stats for samples with leaf keys leaf, X[colname] values x, and target y"
+        order = np.lexsort((x, leaf))
+        return LeafXStats(*_group_sorted(leaf[order], x[order], y[order]))
+
+    def merge(self, other:'LeafXStats') -> 'LeafXStats':
+        leaf = np.concatenate([self.leaf, other.leaf])
+        x = np.concatenate([self.x, other.x])
+        order = np.lexsort((x, leaf))
+        sum_y = np.concatenate([self.sum_y, other.sum_y])[order]
+        count = np.concatenate([self.count, other.count])[order]
+        return LeafXStats(*_group_sorted(leaf[order], x[order], sum_y, count))
+
+    def uniq_x(self) -> np.ndarray:
+        return np.unique(self.x)
+
+    def slopes(self):
+        "Return leaf_xranges, leaf_slopes, slope_leaves, ignored as in discrete_xc_space()"
+        return _slopes_from_groups(self.leaf, self.x, self.sum_y / self.count, self.count)
 
 
 def collect_discrete_slopes(rf, X, y, colname):
@@ -533,48 +1693,16 @@ def collect_discrete_slopes(rf, X, y, colname):
     Return for each leaf, the ranges of X[colname] partitions,
     associated slope for each range, and number of ignored samples.
     """
-    # start = timer()
-    leaf_slopes = []   # drop or rise between discrete x values
-    leaf_xranges = []  # drop is from one discrete value to next
-
-    ignored = 0
-
     X_col = X[colname].values
     X_not_col = X.drop(colname, axis=1)
     leaves = leaf_samples(rf, X_not_col)
-    y = y.values
-
-    if False:
-        nnodes = rf.estimators_[0].tree_.node_count
-        print(f"Partitioning 'x not {colname}': {nnodes} nodes in (first) tree, "
-              f"{len(rf.estimators_)} trees, {len(leaves)} total leaves")
-
-    for samples in leaves:
-        leaf_x = X_col[samples]
-        # leaf_x = one_leaf_samples[]#.reshape(-1,1)
-        leaf_y = y[samples]
-
-        if np.abs(np.min(leaf_x) - np.max(leaf_x)) < 1.e-8: # faster than np.isclose()
-            # print(f"ignoring xleft=xright @ {r[0]}")
-            ignored += len(leaf_x)
-            continue
-
-        leaf_xranges_, leaf_slopes_, ignored_ = \
-            discrete_xc_space(leaf_x, leaf_y)
 
-        leaf_slopes.extend(leaf_slopes_)
-        leaf_xranges.extend(leaf_xranges_)
-        ignored += ignored_
+    leaf_xranges, leaf_slopes, _, ignored = \
+        discrete_xc_space(leaves, X_col, np.asarray(y, dtype=float))
 
     if len(leaf_xranges)==0:
         # make sure empty list has same shape (jit complains)
         leaf_xranges = np.array([]).reshape(0, 0)
-    else:
-        leaf_xranges = np.array(leaf_xranges)
-    leaf_slopes = np.array(leaf_slopes)
-
-    # stop = timer()
-    # if verbose: print(f"collect_discrete_slopes {stop - start:.3f}s")
     return leaf_xranges, leaf_slopes, ignored
 
 
@@ -589,36 +1717,21 @@ def avg_values_at_x_jit(uniq_x, leaf_ranges, leaf_slopes):
 
     Value at max(x) is NaN since we have no data beyond that point and so there is
     no forward difference.
+
+    Each slope covers the half-open range [xr[0], xr[1]) of uniq_x, which is a
+    contiguous run of uniq_x indexes [lo, hi). Rather than filling a dense
+    (nx, nslopes) matrix, add slope at lo and subtract it at hi in a difference
+    array; a prefix sum then gives the sum of slopes at each x. Same for counts.
+    That is O((nx + nslopes) log nx) time and O(nx) space.
     """
     nx = uniq_x.shape[0]
     nslopes = leaf_slopes.shape[0]
-    slopes = np.empty(shape=(nx, nslopes), dtype=np.double)
+    lo = np.empty(shape=nslopes, dtype=np.int64)
+    hi = np.empty(shape=nslopes, dtype=np.int64)
     for i in prange(nslopes):
-        xr, slope = leaf_ranges[i], leaf_slopes[i]
-        # Compute slope all the way across uniq_x but then trim line so
-        # slope is only valid in range xr; don't set slope on right edge
-        slopes[:, i] = np.where( (uniq_x < xr[0]) | (uniq_x >= xr[1]), np.nan, slope)
-
-    # Slope values could be genuinely zero so we use nan not 0 for out-of-range.
-
-    # Now average horiz across the matrix, averaging within each range
-    # It's possible that some some rows would be purely NaN, indicating there are no
-    # slopes for that X[colname] value. This can happen when we ignore some leaves,
-    # when they have a single unique X[colname] value.
-
-    # Compute:
-    #   avg_value_at_x = np.mean(slopes[good], axis=1)  (numba doesn't allow axis arg)
-    #   slope_counts_at_x = nslopes - np.isnan(slopes).sum(axis=1)
-    avg_value_at_x = np.zeros(shape=nx)
-    slope_counts_at_x = np.zeros(shape=nx)
-    for i in prange(nx):
-        row = slopes[i, :]
-        n_nan = np.sum(np.isnan(row))
-        avg_value_at_x[i] = np.nan if n_nan==nslopes else np.nanmean(row)
-        slope_counts_at_x[i] = nslopes - n_nan
-
-    # return average slope at each unique x value and how many slopes included in avg at each x
-    return avg_value_at_x, slope_counts_at_x
+        lo[i] = np.searchsorted(uniq_x, leaf_ranges[i,0])
+        hi[i] = np.searchsorted(uniq_x, leaf_ranges[i,1])
+    return _sweep_slopes(nx, lo, hi, leaf_slopes, np.ones(nslopes))
 
 
 # Hideous copying of avg_values_at_x_jit() to get different kinds of jit'ing. This is slower by 20%
@@ -633,30 +1746,46 @@ def avg_values_at_x_nonparallel_jit(uniq_x, leaf_ranges, leaf_slopes):
     """
     nx = len(uniq_x)
     nslopes = len(leaf_slopes)
-    slopes = np.zeros(shape=(nx, nslopes))
+    lo = np.empty(shape=nslopes, dtype=np.int64)
+    hi = np.empty(shape=nslopes, dtype=np.int64)
     for i in range(nslopes):
-        xr, slope = leaf_ranges[i], leaf_slopes[i]
-        # Compute slope all the way across uniq_x but then trim line so
-        # slope is only valid in range xr; don't set slope on right edge
-        slopes[:, i] = np.where( (uniq_x < xr[0]) | (uniq_x >= xr[1]), np.nan, slope)
+        lo[i] = np.searchsorted(uniq_x, leaf_ranges[i,0])
+        hi[i] = np.searchsorted(uniq_x, leaf_ranges[i,1])
+    return _sweep_slopes(nx, lo, hi, leaf_slopes, np.ones(nslopes))
 
-    # Slope values could be genuinely zero so we use nan not 0 for out-of-range.
 
-    # Now average horiz across the matrix, averaging within each range
-    # It's possible that some some rows would be purely NaN, indicating there are no
-    # slopes for that X[colname] value. This can happen when we ignore some leaves,
-    # when they have a single unique X[colname] value.
+@jit(nopython=True)
+def _sweep_slopes(nx, lo, hi, leaf_slopes, weights):
+    """
+    Given slope i covers uniq_x indexes [lo[i], hi[i]), return the weighted average
+    slope and total weight (number of slopes if weights are 1) at each of nx x
+    locations. Slope values could be genuinely zero so x locations w/o any slopes
+    get nan not 0. NaN and 0-weight slopes are skipped.
+    """
+    sum_deltas = np.zeros(shape=nx+1)
+    count_deltas = np.zeros(shape=nx+1)
+    for i in range(len(leaf_slopes)):
+        slope = leaf_slopes[i]
+        w = weights[i]
+        if np.isnan(slope) or w==0 or lo[i]>=hi[i]:
+            continue
+        sum_deltas[lo[i]] += w * slope
+        sum_deltas[hi[i]] -= w * slope
+        count_deltas[lo[i]] += w
+        count_deltas[hi[i]] -= w
 
-    # Compute:
-    #   avg_value_at_x = np.mean(slopes[good], axis=1)  (numba doesn't allow axis arg)
-    #   slope_counts_at_x = nslopes - np.isnan(slopes).sum(axis=1)
-    avg_value_at_x = np.zeros(shape=nx)
-    slope_counts_at_x = np.zeros(shape=nx)
+    # It's possible that some x have no slopes, indicating there is no data for that
+    # X[colname] value. This can happen when we ignore some leaves,
+    # when they have a single unique X[colname] value.
+    avg_value_at_x = np.empty(shape=nx)
+    slope_counts_at_x = np.empty(shape=nx)
+    running_sum = 0.0
+    running_count = 0.0
     for i in range(nx):
-        row = slopes[i, :]
-        n_nan = np.sum(np.isnan(row))
-        avg_value_at_x[i] = np.nan if n_nan==nslopes else np.nanmean(row)
-        slope_counts_at_x[i] = nslopes - n_nan
+        running_sum += sum_deltas[i]
+        running_count += count_deltas[i]
+        slope_counts_at_x[i] = running_count
+        avg_value_at_x[i] = np.nan if running_count==0 else running_sum / running_count
 
     # return average slope at each unique x value and how many slopes included in avg at each x
     return avg_value_at_x, slope_counts_at_x
@@ -802,7 +1931,65 @@ def plot_catstratpd_gridsearch(X, y, colname, targetname,
         col += 1
 
 
-def catwise_leaves(rf, X_not_col, X_col, y, max_catcode):
+class CatLeafDeltas:
+    """
+    Sparse (CSR-style) version of the leaf_deltas and leaf_counts matrices from
+    catwise_leaves(). Only the categories present in a leaf are stored so memory
+    is proportional to the number of non-empty (cat, leaf) cells rather than
+    (max_catcode+1) * num leaves. For leaf i, the sorted category codes, their
+    avg y deltas from the leaf's refcat, and their counts are:
+
+        cats[indptr[i]:indptr[i+1]]
+        deltas[indptr[i]:indptr[i+1]]
+        counts[indptr[i]:indptr[i+1]]
+
+    refcats[i] is the reference category of leaf i.
+    """
+    def __init__(self, indptr, cats, deltas, counts, refcats, max_catcode):
+        self.indptr = indptr
+        self.cats = cats
+        self.deltas = deltas
+        self.counts = counts
+        self.refcats = refcats
+        self.max_catcode = max_catcode
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def leaf(self, i):
+        "Return (cats, deltas, counts) for leaf i"
+        s = slice(self.indptr[i], self.indptr[i+1])
+        return self.cats[s], self.deltas[s], self.counts[s]
+
+    def take(self, leaves) -> 'CatLeafDeltas':
+        "Return a CatLeafDeltas with just the leaves indexed by leaves, in that order"
+        leaves = np.asarray(leaves)
+        starts, sizes = self.indptr[leaves], np.diff(self.indptr)[leaves]
+        indptr = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+        idx = np.repeat(starts - indptr[:-1], sizes) + np.arange(indptr[-1])
+        return CatLeafDeltas(indptr, self.cats[idx], self.deltas[idx], self.counts[idx],
+                             self.refcats[leaves], self.max_catcode)
+
+    @staticmethod
+    def fromdense(leaf_deltas, leaf_counts, refcats) -> 'CatLeafDeltas':
+        "Build from (max_catcode+1, num leaves) leaf_deltas and leaf_counts matrices"
+        leaf_of, cats = np.nonzero(~np.isnan(leaf_deltas.T)) # ordered by leaf then cat
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(leaf_of, minlength=leaf_deltas.shape[1]))])
+        return CatLeafDeltas(indptr.astype(np.int64), cats, leaf_deltas[cats, leaf_of],
+                             leaf_counts[cats, leaf_of], np.asarray(refcats),
+                             leaf_deltas.shape[0] - 1)
+
+    def todense(self):
+        "Return the (max_catcode+1, num leaves) leaf_deltas and leaf_counts matrices"
+        leaf_of = np.repeat(np.arange(len(self)), np.diff(self.indptr))
+        leaf_deltas = np.full(shape=(self.max_catcode+1, len(self)), fill_value=np.nan)
+        leaf_counts = np.zeros(shape=(self.max_catcode+1, len(self)), dtype=int)
+        leaf_deltas[self.cats, leaf_of] = self.deltas
+        leaf_counts[self.cats, leaf_of] = self.counts
+        return leaf_deltas, leaf_counts
+
+
+def catwise_leaves(rf, X_not_col, X_col, y, max_catcode, rng=None, parallel_jit=True):
     """
     Return a 2D array with the average y value for each category in each leaf
     normalized by subtracting the the avg y value for a randomly-chosen
@@ -820,47 +2007,120 @@ def catwise_leaves(rf, X_not_col, X_col, y, max_catcode):
     a leaf have values.  Shape is (max cat + 1, num leaves).
 
     Within a single leaf, there will typically only be a few categories represented.
-    """
-    leaves = leaf_samples(rf, X_not_col)
+    For high-cardinality categoricals, use sparse_catwise_leaves() instead.
 
-    leaf_deltas = np.full(shape=(max_catcode+1, len(leaves)), fill_value=np.nan)
-    leaf_counts = np.zeros(shape=(max_catcode+1, len(leaves)), dtype=int)
-    refcats = np.empty(shape=(len(leaves),), dtype=int)
+    Reference categories are chosen with np.random.Generator rng or, if None,
+    global np.random state. Pass parallel_jit=False when calling from multiple
+    threads at once.
+    """
+    cat_leaves, ignored = sparse_catwise_leaves(rf, X_not_col, X_col, y, max_catcode, rng=rng,
+                                                parallel_jit=parallel_jit)
+    leaf_deltas, leaf_counts = cat_leaves.todense()
+    return leaf_deltas, leaf_counts, cat_leaves.refcats, ignored
 
-    ignored = 0
-    for leaf_i in range(len(leaves)):
-        sample = leaves[leaf_i]
-        leaf_cats = X_col[sample]
-        leaf_y = y[sample]
-        # perform a groupby(catname).mean()
-        uniq_leaf_cats, count_leaf_cats = np.unique(leaf_cats, return_counts=True) # comes back sorted
-        avg_y_per_cat = np.array([leaf_y[leaf_cats==cat].mean() for cat in uniq_leaf_cats])
-        # print("uniq_leaf_cats",uniq_leaf_cats,"count_y_per_cat",count_leaf_cats)
-
-        if len(uniq_leaf_cats) < 2:
-            # print(f"ignoring {len(sample)} obs for {len(avg_y_per_cat)} cat(s) in leaf")
-            ignored += len(sample)
-            refcats[leaf_i] = -1 # cat codes are assumed to be positive integers
-            continue
 
-        # Use random cat code as refcat
-        idx_of_random_cat_in_leaf = np.random.randint(0, len(uniq_leaf_cats), size=1)
-        refcats[leaf_i] = uniq_leaf_cats[idx_of_random_cat_in_leaf]
-        delta_y_per_cat = avg_y_per_cat - avg_y_per_cat[idx_of_random_cat_in_leaf]
-        # print("delta_y_per_cat",delta_y_per_cat)
+def sparse_catwise_leaves(rf, X_not_col, X_col, y, max_catcode, rng=None, parallel_jit=True):
+    """
+    Same as catwise_leaves() but return a CatLeafDeltas, which holds just the
+    non-empty (cat, leaf) cells, and the number of ignored samples.
+    Leaves with fewer than 2 categories are ignored and not stored.
+
+    Samples are sorted by (leaf, cat) once and then two jitted passes over the
+    leaves, in parallel, count the categories in each leaf and compute each
+    leaf's per-category avg y deltas and counts. The random refcat indexes are
+    drawn in one vectorized call between the passes, which gives the same
+    stream as drawing one per leaf.
+    """
+    cat_leaves, ignored = _multi_catwise_leaves(leaf_samples(rf, X_not_col, parallel_jit=parallel_jit),
+                                                X_col, y.reshape(-1, 1), max_catcode, rng=rng,
+                                                parallel_jit=parallel_jit)
+    return cat_leaves[0], ignored
 
-        # Store into leaf i vector just those deltas we have data for
-        # leave cats w/o representation as nan
-        leaf_deltas[uniq_leaf_cats, leaf_i] = delta_y_per_cat
-        leaf_counts[uniq_leaf_cats, leaf_i] = count_leaf_cats
 
-    # refcat[i]=-1 for all leaves i we ignored so remove those and return
-    # See unit test test_catwise_leaves:test_two_leaves_with_2nd_ignored()
-    keep_leaves_idxs = np.where(refcats>=0)[0]
-    leaf_deltas = leaf_deltas[:,keep_leaves_idxs]
-    leaf_counts = leaf_counts[:,keep_leaves_idxs]
-    refcats = refcats[keep_leaves_idxs]
-    return leaf_deltas, leaf_counts, refcats, ignored
+def _multi_catwise_leaves(leaves:LeafIndex, X_col, Y, max_catcode, rng=None, parallel_jit=True):
+    """
+    sparse_catwise_leaves() for each column of the (n, k) target matrix Y given
+    the leaves of a partition they share. Sorting, category counting, and refcats
+    are done once; only the avg y deltas are computed per target. Returns a list
+    of k CatLeafDeltas and the number of ignored samples.
+    """
+    leaf_of = np.repeat(np.arange(len(leaves)), leaves.leaf_sizes())
+    leaf_cats = X_col[leaves.indices]
+    order = np.lexsort((leaf_cats, leaf_of))
+    sorted_cats = leaf_cats[order].astype(np.int64)
+    sorted_Y = Y[leaves.indices[order]].astype(np.float64)
+
+    count_cats, catwise_deltas = (_catwise_count_cats, _catwise_deltas) if parallel_jit else \
+                                 (_catwise_count_cats_nonparallel, _catwise_deltas_nonparallel)
+    n_uniq = count_cats(sorted_cats, leaves.indptr)
+    kept = n_uniq >= 2
+    ignored = int(np.sum(leaves.leaf_sizes()[~kept]))
+    cat_indptr = np.concatenate([[0], np.cumsum(n_uniq[kept])]).astype(np.int64)
+
+    # Use random cat code in each kept leaf as refcat
+    if rng is None:
+        refidx = np.random.randint(0, n_uniq[kept])
+    else:
+        refidx = rng.integers(0, n_uniq[kept])
+
+    cat_leaves = []
+    for t in range(sorted_Y.shape[1]):
+        cats, deltas, counts, refcats = \
+            catwise_deltas(sorted_cats, np.ascontiguousarray(sorted_Y[:,t]), leaves.indptr,
+                            np.where(kept)[0], cat_indptr, refidx.astype(np.int64))
+        cat_leaves.append(CatLeafDeltas(cat_indptr, cats, deltas, counts, refcats, max_catcode))
+    return cat_leaves, ignored
+
+
+def _count_cats(sorted_cats, indptr):
+    "Number of unique cats in each leaf given cats sorted within each leaf"
+    n_leaves = len(indptr) - 1
+    n_uniq = np.zeros(n_leaves, dtype=np.int64)
+    for i in prange(n_leaves):
+        n = 0
+        for k in range(indptr[i], indptr[i+1]):
+            if k==indptr[i] or sorted_cats[k]!=sorted_cats[k-1]:
+                n += 1
+        n_uniq[i] = n
+    return n_uniq
+
+
+def _leaf_cat_deltas(sorted_cats, sorted_y, indptr, kept_leaves, cat_indptr, refidx):
+    """
+    For each kept leaf (position j in kept_leaves), fill cells cat_indptr[j]:cat_indptr[j+1]
+    with the leaf's sorted unique cats, their count, and their avg y minus the
+    avg y of the refidx[j]-th cat.
+    """
+    ncells = cat_indptr[-1]
+    cats = np.empty(ncells, dtype=np.int64)
+    deltas = np.zeros(ncells, dtype=np.float64)
+    counts = np.zeros(ncells, dtype=np.int64)
+    refcats = np.empty(len(kept_leaves), dtype=np.int64)
+    for j in prange(len(kept_leaves)):
+        i = kept_leaves[j]
+        cell = cat_indptr[j] - 1
+        for k in range(indptr[i], indptr[i+1]):
+            if k==indptr[i] or sorted_cats[k]!=sorted_cats[k-1]:
+                cell += 1
+                cats[cell] = sorted_cats[k]
+            deltas[cell] += sorted_y[k]
+            counts[cell] += 1
+        for cell in range(cat_indptr[j], cat_indptr[j+1]):
+            deltas[cell] /= counts[cell]
+        ref = cat_indptr[j] + refidx[j]
+        refcats[j] = cats[ref]
+        ref_avg = deltas[ref]
+        for cell in range(cat_indptr[j], cat_indptr[j+1]):
+            deltas[cell] -= ref_avg
+    return cats, deltas, counts, refcats
+
+
+# Parallel versions for single callers; threaded callers (e.g., catstratpd_trials()
+# with n_jobs>1) need the others as numba's workqueue layer aborts on concurrent use.
+_catwise_count_cats = jit(nopython=True, parallel=True)(_count_cats)
+_catwise_deltas = jit(nopython=True, parallel=True)(_leaf_cat_deltas)
+_catwise_count_cats_nonparallel = jit(nopython=True)(_count_cats)
+_catwise_deltas_nonparallel = jit(nopython=True)(_leaf_cat_deltas)
 
 
 def cat_partial_dependence(X, y,
@@ -871,36 +2131,93 @@ def cat_partial_dependence(X, y,
                            max_features=1.0,
                            bootstrap=False,
                            supervised=True,
+                           sparse=False,
+                           solver='merge',
+                           merge_components=False,
+                           merge_n_jobs=1,
+                           stratifier=None,
+                           cache=None,
+                           parallel_jit=True,
+                           random_state=None,
                            verbose=False):
+    """
+    Compute the partial dependence of y on categorical X[colname] (label-encoded
+    non-negative integer codes). Returns leaf_deltas, leaf_counts, avg_per_cat,
+    count_per_cat, ignored, merge_ignored. With sparse=True, the leaf stage never
+    allocates (max_catcode+1, num leaves) matrices; leaf_deltas is then a
+    CatLeafDeltas and leaf_counts is None. Use that for high-cardinality columns.
+    solver is 'merge' or 'lsqr'; see avg_values_at_cat(). To reuse one partition of
+    x_not_colname space across calls, pass as stratifier a Stratifier already fit
+    to X.drop(colname, axis=1).values, any fitted model with an apply() method
+    returning leaf ids, or an (n_samples, n_trees) matrix of leaf ids; n_trees,
+    min_samples_leaf, max_features, bootstrap, and supervised are then ignored.
+    Pass a LeafCache as cache to reuse partitions across calls given random_state.
+    With merge_components=True, categories not connected to the first leaf are not
+    dropped; every connected component is merged on its own by
+    merge_cat_components() using merge_n_jobs processes (solver is then ignored).
+    avg_per_cat values are then only comparable within a component.
+    Pass parallel_jit=False when calling from multiple threads at once.
+    """
     X_not_col = X.drop(colname, axis=1).values
     X_col = X[colname].values
+    return _cat_partial_dependence(X_not_col, X_col, np.asarray(y, dtype=float), colname,
+                                   max_catcode=max_catcode,
+                                   n_trees=n_trees,
+                                   min_samples_leaf=min_samples_leaf,
+                                   max_features=max_features,
+                                   bootstrap=bootstrap,
+                                   supervised=supervised,
+                                   sparse=sparse,
+                                   solver=solver,
+                                   merge_components=merge_components,
+                                   merge_n_jobs=merge_n_jobs,
+                                   stratifier=stratifier,
+                                   cache=cache,
+                                   parallel_jit=parallel_jit,
+                                   rng=_as_rng(random_state),
+                                   verbose=verbose)
+
+
+def _cat_partial_dependence(X_not_col:np.ndarray, X_col:np.ndarray, y:np.ndarray, colname:str,
+                            max_catcode=None,
+                            n_trees=1,
+                            min_samples_leaf=5,
+                            max_features=1.0,
+                            bootstrap=False,
+                            supervised=True,
+                            sparse=False,
+                            solver='merge',
+                            merge_components=False,
+                            merge_n_jobs=1,
+                            stratifier=None,
+                            cache=None,
+                            parallel_jit=True,
+                            rng=None,
+                            verbose=False):
+    """
+    Same as cat_partial_dependence() but X is already split into X_not_col and
+    X_col arrays. colname is used only for messages. rng is a np.random.Generator
+    or None.
+    """
     if (X_col<0).any():
         raise ValueError(f"Category codes must be > 0 in column {colname}")
     if max_catcode is None:
         max_catcode = np.max(X_col)
-    if supervised:
-        rf = RandomForestRegressor(n_estimators=n_trees,
-                                   min_samples_leaf=min_samples_leaf,
-                                   bootstrap = bootstrap,
-                                   max_features = max_features,
-                                   oob_score=False)
-        rf.fit(X_not_col, y)
-        if verbose:
-            print(f"CatStrat Partition RF: dropping {colname} training R^2 {rf.score(X_not_col, y):.2f}")
+    if stratifier is None:
+        stratifier = _fit_stratification(X_not_col, y, colname, n_trees, min_samples_leaf,
+                                         max_features, bootstrap, supervised,
+                                         cache=cache, rng=rng, parallel_jit=parallel_jit,
+                                         verbose=verbose)
+
+    if sparse:
+        leaf_deltas, ignored = \
+            sparse_catwise_leaves(stratifier, X_not_col, X_col, y, max_catcode, rng=rng,
+                                  parallel_jit=parallel_jit)
+        leaf_counts, refcats = None, leaf_deltas.refcats
     else:
-        print("USING UNSUPERVISED MODE")
-        X_synth, y_synth = conjure_twoclass(X)
-        rf = RandomForestClassifier(n_estimators=n_trees,
-                                    min_samples_leaf=min_samples_leaf,# * 2, # there are 2x as many samples (X,X') so must double leaf size
-                                    bootstrap=bootstrap,
-                                    max_features=max_features,
-                                    oob_score=False)
-        rf.fit(X_synth.drop(colname,axis=1), y_synth)
-
-    rf.fit(X_not_col, y)
-
-    leaf_deltas, leaf_counts, refcats, ignored = \
-        catwise_leaves(rf, X_not_col, X_col, y.values, max_catcode)
+        leaf_deltas, leaf_counts, refcats, ignored = \
+            catwise_leaves(stratifier, X_not_col, X_col, y, max_catcode, rng=rng,
+                           parallel_jit=parallel_jit)
 
     USE_MEAN_Y=False
     if USE_MEAN_Y:
@@ -910,9 +2227,15 @@ def cat_partial_dependence(X, y,
             avg_per_cat = np.nanmean(leaf_deltas, axis=1)
             merge_ignored = 0
             # slope_counts_at_cat = leaf_histos.shape[1] - np.isnan(leaf_histos).sum(axis=1)
+    elif merge_components:
+        cat_leaves = leaf_deltas if sparse else CatLeafDeltas.fromdense(leaf_deltas, leaf_counts, refcats)
+        avg_per_cat, count_per_cat, _, merge_ignored = \
+            merge_cat_components(cat_leaves, n_jobs=merge_n_jobs,
+                                 random_state=rng)
     else:
         avg_per_cat, count_per_cat, merge_ignored = \
-            avg_values_at_cat(leaf_deltas, leaf_counts, refcats, verbose=verbose)
+            avg_values_at_cat(leaf_deltas, leaf_counts, refcats, rng=rng, solver=solver,
+                              verbose=verbose)
 
     if verbose:
         print(f"CatStratPD Num samples ignored {ignored} for {colname}")
@@ -920,7 +2243,275 @@ def cat_partial_dependence(X, y,
     return leaf_deltas, leaf_counts, avg_per_cat, count_per_cat, ignored, merge_ignored
 
 
-def avg_values_at_cat(leaf_deltas, leaf_counts, refcats, max_iter=3, verbose=False):
+def partial_dependences(X:pd.DataFrame, y:pd.Series, colnames=None,
+                        catcolnames=(),
+                        n_jobs=-1,
+                        min_slopes_per_x=5,
+                        n_trees=1,
+                        min_samples_leaf=10,
+                        cat_min_samples_leaf=5,
+                        bootstrap=False,
+                        max_features=1.0,
+                        supervised=True,
+                        verbose=False) -> dict:
+    """
+    Compute partial dependence information for multiple columns of X at once,
+    fanning the columns out over n_jobs worker processes. The feature matrix is
+    placed once into multiprocessing.shared_memory; workers attach to it and drop
+    colname by index rather than copying X into each task via pickling.
+    Columns in catcolnames go through cat_partial_dependence() using
+    cat_min_samples_leaf and the others through partial_dependence().
+
+    :param X: Dataframe with all explanatory variables
+    :param y: Series or vector with response variable
+    :param colnames: which columns to compute partial dependence for; default is all
+    :param catcolnames: which of colnames are label-encoded categorical columns
+    :param n_jobs: how many processes to use; -1 means all cores and 1 means
+                   compute serially in this process.
+
+    Returns a dict mapping each colname to the tuple returned from
+    partial_dependence() or cat_partial_dependence().
+    """
+    if colnames is None:
+        colnames = list(X.columns)
+    catcolnames = set(catcolnames)
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = os.cpu_count()
+    n_jobs = min(n_jobs, len(colnames))
+
+    X_values = X.values.astype(np.float64)
+    y = np.asarray(y, dtype=float)
+    tasks = [(X.columns.get_loc(colname), colname, colname in catcolnames)
+             for colname in colnames]
+    pd_kwargs = dict(min_slopes_per_x=min_slopes_per_x,
+                     n_trees=n_trees,
+                     min_samples_leaf=min_samples_leaf,
+                     bootstrap=bootstrap,
+                     max_features=max_features,
+                     supervised=supervised,
+                     verbose=verbose)
+    catpd_kwargs = dict(n_trees=n_trees,
+                        min_samples_leaf=cat_min_samples_leaf,
+                        sparse=True,
+                        bootstrap=bootstrap,
+                        max_features=max_features,
+                        supervised=supervised,
+                        verbose=verbose)
+
+    if n_jobs<=1:
+        return {colname:_pd_column(X_values, y, task, pd_kwargs, catpd_kwargs)
+                for colname, task in zip(colnames, tasks)}
+
+    shm = shared_memory.SharedMemory(create=True, size=max(X_values.nbytes, 1))
+    try:
+        X_shared = np.ndarray(X_values.shape, dtype=np.float64, buffer=shm.buf)
+        X_shared[:] = X_values
+        del X_values
+        # fork() after numba's parallel threading layer has started can deadlock so spawn
+        with ProcessPoolExecutor(max_workers=n_jobs,
+                                 mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_pd_worker,
+                                 initargs=(shm.name, X_shared.shape, y,
+                                           pd_kwargs, catpd_kwargs)) as pool:
+            results = list(pool.map(_pd_worker, tasks))
+        del X_shared
+    finally:
+        shm.close()
+        shm.unlink()
+    return dict(zip(colnames, results))
+
+
+# State of each partial_dependences() worker process, set by _init_pd_worker()
+_pd_worker_state = {}
+
+
+def _init_pd_worker(shm_name, shape, y, pd_kwargs, catpd_kwargs):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _pd_worker_state['shm'] = shm # keep segment mapped while worker lives
+    _pd_worker_state['X'] = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    _pd_worker_state['y'] = y
+    _pd_worker_state['pd_kwargs'] = pd_kwargs
+    _pd_worker_state['catpd_kwargs'] = catpd_kwargs
+
+
+def _pd_worker(task):
+    s = _pd_worker_state
+    # nested numba parallelism crashes under multiprocessing so use serial jit
+    return _pd_column(s['X'], s['y'], task, s['pd_kwargs'], s['catpd_kwargs'],
+                      parallel_jit=False)
+
+
+def _pd_column(X:np.ndarray, y:np.ndarray, task, pd_kwargs, catpd_kwargs, parallel_jit=True):
+    j, colname, is_catcol = task
+    X_col = X[:, j]
+    X_not_col = X[:, np.arange(X.shape[1]) != j]
+    if is_catcol:
+        return _cat_partial_dependence(X_not_col, X_col.astype(int), y, colname,
+                                       parallel_jit=parallel_jit,
+                                       **catpd_kwargs)
+    return _partial_dependence(X_not_col, X_col, y, colname,
+                               parallel_jit=parallel_jit,
+                               **pd_kwargs)
+
+
+def multi_target_partial_dependence(X:pd.DataFrame, Y, colname:str,
+                                    min_slopes_per_x=5,
+                                    parallel_jit=True,
+                                    n_trees=1, min_samples_leaf=10, bootstrap=False,
+                                    max_features=1.0,
+                                    stratifier=None,
+                                    cache=None,
+                                    random_state=None,
+                                    verbose=False) -> dict:
+    """
+    Partial dependence of each of several targets on X[colname] using a single
+    unsupervised partition of x_not_colname space. The unsupervised forest doesn't
+    look at y, so it is fit once for all targets rather than once per target, and
+    one discrete_xc_space() pass collects the slopes of all targets at once.
+
+    :param Y: DataFrame with one column per target or (n, k) matrix of targets
+    :param stratifier: optional existing partition of X.drop(colname, axis=1);
+                       see partial_dependence()
+
+    Other parameters are as for partial_dependence() with supervised=False.
+    Returns a dict mapping each target name (Y column name or column index) to
+    the tuple partial_dependence() would return for that target.
+    """
+    Y, targetnames = _target_matrix(Y)
+    X_not_col = X.drop(colname, axis=1).values
+    X_col = X[colname].values
+    if stratifier is None:
+        stratifier = _fit_stratification(X_not_col, None, colname, n_trees, min_samples_leaf,
+                                         max_features, bootstrap, supervised=False,
+                                         cache=cache, rng=_as_rng(random_state),
+                                         parallel_jit=parallel_jit, verbose=verbose)
+    leaves = leaf_samples(stratifier, X_not_col, parallel_jit=parallel_jit)
+    column_index = ColumnIndex.from_column(X_col)
+    leaf_xranges, leaf_slopes, slope_leaves, ignored = \
+        discrete_xc_space(leaves, X_col, Y, column_index=column_index)
+    if verbose:
+        print(f"discrete StratPD num samples ignored {ignored}/{len(X_col)} for {colname}")
+
+    results = {}
+    for t, targetname in enumerate(targetnames):
+        target_slopes = np.ascontiguousarray(leaf_slopes[:,t])
+        slope_counts_at_x, dx, slope_at_x, pdpx, pdpy, idx = \
+            _pdp_from_slopes(column_index.uniq_x, leaf_xranges, target_slopes,
+                             min_slopes_per_x, parallel_jit)
+        results[targetname] = (leaf_xranges, target_slopes, slope_counts_at_x, dx,
+                               slope_at_x, pdpx, pdpy, ignored)
+    return results
+
+
+def multi_target_cat_partial_dependence(X:pd.DataFrame, Y, colname:str,
+                                        max_catcode=None,
+                                        n_trees=1,
+                                        min_samples_leaf=5,
+                                        max_features=1.0,
+                                        bootstrap=False,
+                                        solver='merge',
+                                        stratifier=None,
+                                        cache=None,
+                                        parallel_jit=True,
+                                        random_state=None,
+                                        verbose=False) -> dict:
+    """
+    The cat_partial_dependence(sparse=True, supervised=False) analog of
+    multi_target_partial_dependence(): fit one unsupervised partition, sort leaf
+    samples by category once, then compute per-leaf category deltas and merge
+    them for each target. Returns a dict mapping each target name to the tuple
+    cat_partial_dependence() would return for that target. Pass parallel_jit=False
+    when calling from multiple threads at once.
+    """
+    Y, targetnames = _target_matrix(Y)
+    X_not_col = X.drop(colname, axis=1).values
+    X_col = X[colname].values
+    if (X_col<0).any():
+        raise ValueError(f"Category codes must be > 0 in column {colname}")
+    if max_catcode is None:
+        max_catcode = np.max(X_col)
+    rng = _as_rng(random_state)
+    if stratifier is None:
+        stratifier = _fit_stratification(X_not_col, None, colname, n_trees, min_samples_leaf,
+                                         max_features, bootstrap, supervised=False,
+                                         cache=cache, rng=rng, parallel_jit=parallel_jit,
+                                         verbose=verbose)
+    leaves = leaf_samples(stratifier, X_not_col, parallel_jit=parallel_jit)
+    all_cat_leaves, ignored = _multi_catwise_leaves(leaves, X_col, Y, max_catcode, rng=rng,
+                                                    parallel_jit=parallel_jit)
+    if verbose:
+        print(f"CatStratPD Num samples ignored {ignored} for {colname}")
+
+    results = {}
+    for targetname, cat_leaves in zip(targetnames, all_cat_leaves):
+        avg_per_cat, count_per_cat, merge_ignored = \
+            avg_values_at_cat(cat_leaves, None, cat_leaves.refcats, rng=rng, solver=solver,
+                              verbose=verbose)
+        results[targetname] = (cat_leaves, None, avg_per_cat, count_per_cat, ignored, merge_ignored)
+    return results
+
+
+def _target_matrix(Y):
+    "Return Y as an (n, k) float matrix and the list of k target names"
+    if isinstance(Y, pd.DataFrame):
+        return Y.values.astype(np.float64), list(Y.columns)
+    if isinstance(Y, pd.Series):
+        return Y.values.astype(np.float64).reshape(-1, 1), [Y.name]
+    Y = np.asarray(Y, dtype=np.float64)
+    if Y.ndim==1:
+        Y = Y.reshape(-1, 1)
+    return Y, list(range(Y.shape[1]))
+
+
+def cat_leaf_components(cat_leaves:CatLeafDeltas):
+    """
+    Two leaves can only be merged if they are connected through a chain of
+    leaves sharing categories. Use union-find over (leaf, category) membership to
+    partition the leaves of a CatLeafDeltas into connected components.
+    Return (leaf_component, n_components) where leaf_component[i] is the component
+    of leaf i; components are numbered in order of their first leaf so leaf 0
+    is always in component 0.
+    """
+    return _cat_leaf_components(cat_leaves.indptr, cat_leaves.cats, cat_leaves.max_catcode+1)
+
+
+@jit(nopython=True)
+def _find_root(parent, i):
+    while parent[i]!=i:
+        parent[i] = parent[parent[i]] # path halving
+        i = parent[i]
+    return i
+
+
+@jit(nopython=True)
+def _cat_leaf_components(indptr, cats, ncats):
+    n_leaves = len(indptr) - 1
+    parent = np.arange(n_leaves)
+    first_leaf_with_cat = np.full(ncats, -1)
+    for i in range(n_leaves):
+        for k in range(indptr[i], indptr[i+1]):
+            c = cats[k]
+            if first_leaf_with_cat[c]==-1:
+                first_leaf_with_cat[c] = i
+                continue
+            a = _find_root(parent, i)
+            b = _find_root(parent, first_leaf_with_cat[c])
+            if a!=b:
+                parent[max(a,b)] = min(a,b) # keep lowest leaf as root
+    leaf_component = np.empty(n_leaves, dtype=np.int64)
+    root_component = np.full(n_leaves, -1)
+    n_components = 0
+    for i in range(n_leaves):
+        r = _find_root(parent, i)
+        if root_component[r]==-1:
+            root_component[r] = n_components
+            n_components += 1
+        leaf_component[i] = root_component[r]
+    return leaf_component, n_components
+
+
+def avg_values_at_cat(leaf_deltas, leaf_counts=None, refcats=None, max_iter=3, rng=None,
+                      solver='merge', verbose=False):
     """
     In leaf_deltas, we have information from the leaves indicating how much
     above or below each category was from the reference category of that leaf.
@@ -993,8 +2584,33 @@ def avg_values_at_cat(leaf_deltas, leaf_counts, refcats, max_iter=3, verbose=Fal
 
     Choosing random refcat helps avoid focusing on some outliers by accident
     and after merging same (random) refcat, use random refcat to merge in the loop.
-    even less likely to hit outlier 2x in row.
+    even less likely to hit outlier 2x in row. Random choices come from
+    np.random.Generator rng or, if None, global np.random state.
+
+    If leaf_deltas is a CatLeafDeltas, leaf_counts and refcats are ignored and the
+    merge works on just the categories present in each leaf; see
+    sparse_avg_values_at_cat().
+
+    Leaves not connected to the first leaf through shared categories can never
+    merge; a union-find pre-pass (cat_leaf_components()) finds them up front and
+    counts their samples as merge_ignored without rescanning them each pass.
+    To merge every component independently, see merge_cat_components().
+
+    With solver='lsqr', skip the iterative merging and solve for all category
+    effects at once by weighted least squares; see lsqr_avg_values_at_cat().
     """
+    if solver=='lsqr':
+        if not isinstance(leaf_deltas, CatLeafDeltas):
+            leaf_deltas = CatLeafDeltas.fromdense(leaf_deltas, leaf_counts, refcats)
+        return lsqr_avg_values_at_cat(leaf_deltas, verbose=verbose)
+    if solver!='merge':
+        raise ValueError(f"solver must be 'merge' or 'lsqr' not {solver}")
+    if isinstance(leaf_deltas, CatLeafDeltas):
+        return sparse_avg_values_at_cat(leaf_deltas, max_iter=max_iter, rng=rng, verbose=verbose)
+    if leaf_deltas.shape[1]==0: # no leaf with 2 or more categories
+        return np.full(shape=(leaf_deltas.shape[0],), fill_value=np.nan), \
+               np.zeros(shape=(leaf_deltas.shape[0],), dtype=int), 0
+
     # catavg is the running average vector and starts out as the first column
     catavg = leaf_deltas[:,0] # init with first ref category (column)
     catavg_weight = leaf_counts[:,0]
@@ -1002,6 +2618,10 @@ def avg_values_at_cat(leaf_deltas, leaf_counts, refcats, max_iter=3, verbose=Fal
     weight_for_refcats = np.sum(leaf_counts, axis=0)
 
     work = set(range(1,leaf_deltas.shape[1]))
+    leaf_component, _ = cat_leaf_components(CatLeafDeltas.fromdense(leaf_deltas, leaf_counts, refcats))
+    unmergeable = np.where(leaf_component!=0)[0]
+    merge_ignored += np.sum(weight_for_refcats[unmergeable])
+    work -= set(unmergeable)
     completed = {-1} # init to any nonempty set to enter loop
     iteration = 1
     # Two passes should be sufficient to merge all possible vectors, but
@@ -1019,7 +2639,7 @@ def avg_values_at_cat(leaf_deltas, leaf_counts, refcats, max_iter=3, verbose=Fal
                 continue
 
             # pick random category in intersection to use as common refcat
-            ix = np.random.choice(intersection_idx, size=1)[0]
+            ix = intersection_idx[_randint(rng, len(intersection_idx))]
 
             # Merge column j inWowto catavg vector
             shifted_v = v - v[ix]                       # make ix the reference cat in common
@@ -1052,6 +2672,339 @@ def avg_values_at_cat(leaf_deltas, leaf_counts, refcats, max_iter=3, verbose=Fal
     return catavg, catavg_weight, merge_ignored # last one is count of values per cat actually incorporated
 
 
+def lsqr_avg_values_at_cat(cat_leaves:CatLeafDeltas, verbose=False):
+    """
+    Rather than merging leaves one at a time, model the delta of category c in
+    leaf l as a per-category effect plus a per-leaf offset (absorbing the leaf's
+    refcat):
+
+        delta[l,c] = beta[c] + alpha[l]
+
+    and find beta, alpha minimizing sum count[l,c] * (delta[l,c] - beta[c] - alpha[l])^2
+    with scipy's sparse lsqr solver in a single shot. The system has one row per
+    non-empty (cat, leaf) cell.
+
+    Category effects are only comparable within a set of leaves connected by
+    shared categories, so like the merge we keep the categories connected to
+    the first leaf and count samples in other leaves as merge_ignored. The
+    result is shifted so the first leaf's refcat is 0. Returns the same
+    (avg_per_cat, count_per_cat, merge_ignored) as avg_values_at_cat().
+    """
+    ncats = cat_leaves.max_catcode + 1
+    catavg = np.full(shape=(ncats,), fill_value=np.nan)
+    catavg_weight = np.zeros(shape=(ncats,), dtype=int)
+    if len(cat_leaves)==0:
+        return catavg, catavg_weight, 0
+
+    n_leaves = len(cat_leaves)
+    leaf_of = np.repeat(np.arange(n_leaves), np.diff(cat_leaves.indptr))
+    uniq_cats, cat_idx = np.unique(cat_leaves.cats, return_inverse=True)
+    n_uniq_cats = len(uniq_cats)
+
+    leaf_component, _ = cat_leaf_components(cat_leaves)
+    keep = leaf_component[leaf_of]==0
+    merge_ignored = int(np.sum(cat_leaves.counts[~keep]))
+
+    cells_leaf, cells_cat = leaf_of[keep], cat_idx[keep]
+    sqrt_w = np.sqrt(cat_leaves.counts[keep].astype(float))
+    nrows = len(cells_leaf)
+    rows = np.concatenate([np.arange(nrows), np.arange(nrows)])
+    cols = np.concatenate([cells_cat, n_uniq_cats + cells_leaf])
+    A = sp.csr_matrix((np.concatenate([sqrt_w, sqrt_w]), (rows, cols)),
+                      shape=(nrows, n_uniq_cats + n_leaves))
+    b = sqrt_w * cat_leaves.deltas[keep]
+    solution = lsqr(A, b, atol=1e-12, btol=1e-12)
+    if verbose: print(f"lsqr stopped with istop={solution[1]} after {solution[2]} iterations")
+    beta = solution[0][:n_uniq_cats]
+
+    connected_cats = np.unique(cells_cat)
+    refcat_idx = np.searchsorted(uniq_cats, cat_leaves.refcats[0])
+    catavg[uniq_cats[connected_cats]] = beta[connected_cats] - beta[refcat_idx]
+    catavg_weight[uniq_cats] = np.bincount(cells_cat, weights=cat_leaves.counts[keep],
+                                           minlength=n_uniq_cats).astype(int)
+    if verbose: print("final cat avgs", parray3(catavg))
+    return catavg, catavg_weight, merge_ignored
+
+
+def sparse_avg_values_at_cat(cat_leaves:CatLeafDeltas, max_iter=3, rng=None, verbose=False):
+    """
+    Same merging algorithm as avg_values_at_cat() but on a CatLeafDeltas. The
+    running average catavg is dense (one entry per category code) but each leaf
+    only touches the categories it contains, so a merge costs O(cats in leaf)
+    rather than O(max_catcode). Makes the same random choices, in the same order,
+    as avg_values_at_cat() does on the equivalent dense matrices.
+    """
+    indptr, cats, deltas, counts, refcats = \
+        cat_leaves.indptr, cat_leaves.cats, cat_leaves.deltas, cat_leaves.counts, cat_leaves.refcats
+    catavg = np.full(shape=(cat_leaves.max_catcode+1,), fill_value=np.nan)
+    catavg_weight = np.zeros(shape=(cat_leaves.max_catcode+1,), dtype=int)
+    merge_ignored = 0
+    if len(cat_leaves)==0:
+        return catavg, catavg_weight, merge_ignored
+
+    # catavg is the running average vector and starts out as the first leaf
+    leaf_cats, v, cur_weight = cat_leaves.leaf(0)
+    catavg[leaf_cats] = v
+    catavg_weight[leaf_cats] = cur_weight
+    weight_for_refcats = np.add.reduceat(counts, indptr[:-1])
+
+    work = set(range(1,len(cat_leaves)))
+    leaf_component, _ = cat_leaf_components(cat_leaves)
+    unmergeable = np.where(leaf_component!=0)[0]
+    merge_ignored += np.sum(weight_for_refcats[unmergeable])
+    work -= set(unmergeable)
+    completed = {-1} # init to any nonempty set to enter loop
+    iteration = 1
+    while len(work)>0 and len(completed)>0 and iteration<=max_iter:
+        completed = set()
+        for j in work:      # for each refcat, avg in the vectors
+            leaf_cats, v, cur_weight = cat_leaves.leaf(j)
+            prev_catavg = catavg[leaf_cats]
+            intersection_idx = np.where(~np.isnan(prev_catavg) & ~np.isnan(v))[0]
+            if len(intersection_idx)==0: # found something to merge into catavg?
+                continue
+
+            # pick random category in intersection to use as common refcat
+            ix = intersection_idx[_randint(rng, len(intersection_idx))]
+
+            # Merge leaf j into catavg vector
+            shifted_v = v - v[ix]                       # make ix the reference cat in common
+            relative_to_value = prev_catavg[ix]         # corresponding value in catavg
+            adjusted_v = shifted_v + relative_to_value  # adjust so v is mergeable with catavg
+            catavg[leaf_cats] = nanavg_vectors(prev_catavg, adjusted_v,
+                                               catavg_weight[leaf_cats], cur_weight)
+            # Update weight of running avg to incorporate "mass" from v
+            catavg_weight[leaf_cats] += cur_weight
+            if verbose:
+                print(f"{refcats[j]:-2d} : cats       =", parray(leaf_cats))
+                print("     vec to add =", parray(v), f"- {v[ix]:.2f}")
+                print("     adjusted   =", parray(adjusted_v), "*", cur_weight)
+                print("     prev avg   =", parray(prev_catavg))
+                print("     new avg    =", parray(catavg[leaf_cats]))
+                print()
+            completed.add(j)
+        iteration += 1
+        work = work - completed
+
+    if len(work)>0:
+        # hmm..couldn't merge some leaves; total up the samples we ignored
+        for j in work:
+            merge_ignored += weight_for_refcats[j]
+        if verbose: print(f"cats {refcats[list(work)]} couldn't be merged into running sum; ignored={merge_ignored}")
+
+    if verbose: print("final cat avgs", parray3(catavg))
+    return catavg, catavg_weight, merge_ignored
+
+
+def merge_cat_components(cat_leaves:CatLeafDeltas, max_iter=3, n_jobs=1, random_state=None):
+    """
+    Rather than keeping only the categories connected to the first leaf, as
+    avg_values_at_cat() does, merge every connected component of leaves (see
+    cat_leaf_components()) independently. With n_jobs>1 (-1 means all cores),
+    components are merged in a pool of n_jobs worker processes since the merge
+    loop holds the GIL. Each component gets its own random stream spawned from
+    random_state so results do not depend on n_jobs.
+
+    Returns (catavg, catavg_weight, cat_component, merge_ignored). catavg[c] is
+    category c's value within its own component, cat_component[c] (-1 if c never
+    appears). Values from different components are not comparable. merge_ignored
+    counts samples in leaves that did not merge within max_iter passes.
+    """
+    ncats = cat_leaves.max_catcode + 1
+    catavg = np.full(shape=(ncats,), fill_value=np.nan)
+    catavg_weight = np.zeros(shape=(ncats,), dtype=int)
+    cat_component = np.full(shape=(ncats,), fill_value=-1)
+    if len(cat_leaves)==0:
+        return catavg, catavg_weight, cat_component, 0
+
+    leaf_component, n_components = cat_leaf_components(cat_leaves)
+    component_leaves = np.split(np.argsort(leaf_component, kind='stable'),
+                                np.cumsum(np.bincount(leaf_component))[:-1])
+    leaf_of = np.repeat(np.arange(len(cat_leaves)), np.diff(cat_leaves.indptr))
+    cat_component[cat_leaves.cats] = leaf_component[leaf_of]
+
+    if random_state is None:
+        random_state = np.random.randint(0, 2**31 - 1)
+    elif isinstance(random_state, np.random.Generator):
+        random_state = random_state.integers(0, 2**31 - 1)
+    seeds = np.random.SeedSequence(random_state).spawn(n_components)
+    subs = [cat_leaves.take(leaves) for leaves in component_leaves]
+    n_jobs = _n_workers(n_jobs, n_components)
+    if n_jobs<=1:
+        results = list(map(_merge_cat_component, subs, [max_iter]*n_components, seeds))
+    else:
+        # fork() after numba's parallel threading layer has started can deadlock so spawn
+        with ProcessPoolExecutor(max_workers=n_jobs,
+                                 mp_context=multiprocessing.get_context('spawn')) as pool:
+            results = list(pool.map(_merge_cat_component, subs, [max_iter]*n_components, seeds,
+                                    chunksize=max(1, n_components // (4*n_jobs))))
+
+    merge_ignored = 0
+    for component, (sub_catavg, sub_weight, sub_ignored) in enumerate(results):
+        cats = cat_component==component
+        catavg[cats] = sub_catavg[cats]
+        catavg_weight[cats] = sub_weight[cats]
+        merge_ignored += sub_ignored
+    return catavg, catavg_weight, cat_component, merge_ignored
+
+
+def _merge_cat_component(sub:CatLeafDeltas, max_iter, seed):
+    return sparse_avg_values_at_cat(sub, max_iter=max_iter, rng=np.random.default_rng(seed))
+
+
+class CatPDAggregate:
+    """
+    Mergeable partial state of CatStratPD for X[colname]: the y sum and count
+    for each (partition, leaf, cat) with any samples. Like PDAggregate, compute
+    one per row shard (in another process or machine), pickle or save() them,
+    merge() associatively, and finalize() into per-category averages. Stats for
+    the same leaf add up, so shards partitioned by one shared stratifier pool
+    their leaves when given the same partition id. Shards partitioned
+    separately must have different partition ids, which is the default as
+    each from_data() call draws its id from random_state.
+    """
+    def __init__(self, partition, leaf, cat, sum_y, count):
+        self.partition = partition
+        self.leaf = leaf
+        self.cat = cat
+        self.sum_y = sum_y
+        self.count = count
+
+    @staticmethod
+    def from_data(X:pd.DataFrame, y:pd.Series, colname:str,
+                  stratifier=None,
+                  partition=None,
+                  n_trees=1,
+                  min_samples_leaf=5,
+                  max_features=1.0,
+                  bootstrap=False,
+                  supervised=True,
+                  random_state=None) -> 'CatPDAggregate':
+        """
+        Partition X.drop(colname, axis=1) with stratifier (anything accepted by
+        cat_partial_dependence()) or a newly fit Stratifier and collect the y sums
+        and counts per (leaf, cat). partition is an int id for the stratification;
+        if None, it is drawn from random_state so seeded runs are reproducible.
+        Shards with separately fit stratifiers need different random_state seeds.
+        """
+        rng = _as_rng(random_state)
+        X_not_col = X.drop(colname, axis=1).values
+        X_col = X[colname].values.astype(np.int64)
+        y = np.asarray(y, dtype=float)
+        if stratifier is None:
+            stratifier = Stratifier(n_trees=n_trees, min_samples_leaf=min_samples_leaf,
+                                    max_features=max_features, bootstrap=bootstrap,
+                                    supervised=supervised).fit(X_not_col, y, random_state=rng)
+        if partition is None:
+            partition = int(rng.integers(0, 2**56)) if rng is not None \
+                        else int.from_bytes(os.urandom(7), 'little')
+        leaf_ids = _leaf_ids(stratifier, X_not_col)
+        n_tree_cols = leaf_ids.shape[1]
+        # make leaf ids unique across trees then flatten tree-major
+        leaf = (leaf_ids.astype(np.int64) + (np.arange(n_tree_cols, dtype=np.int64) << 32)).T.ravel()
+        return CatPDAggregate._grouped(np.full(len(leaf), partition, dtype=np.int64), leaf,
+                                       np.tile(X_col, n_tree_cols), np.tile(y, n_tree_cols),
+                                       np.ones(len(leaf), dtype=np.int64))
+
+    @staticmethod
+    def _grouped(partition, leaf, cat, sum_y, count) -> 'CatPDAggregate':
+        "Sort by (partition, leaf, cat) and add up sum_y and count for duplicate keys"
+        order = np.lexsort((cat, leaf, partition))
+        partition, leaf, cat = partition[order], leaf[order], cat[order]
+        starts = np.flatnonzero(np.concatenate([[True],
+                                                (partition[1:] != partition[:-1]) |
+                                                (leaf[1:] != leaf[:-1]) |
+                                                (cat[1:] != cat[:-1])])) if len(cat)>0 \
+                 else np.empty(0, dtype=int)
+        if len(cat)>0:
+            sum_y, count = np.add.reduceat(sum_y[order], starts), np.add.reduceat(count[order], starts)
+        return CatPDAggregate(partition[starts], leaf[starts], cat[starts], sum_y, count)
+
+    def merge(self, other:'CatPDAggregate') -> 'CatPDAggregate':
+        return CatPDAggregate._grouped(*[np.concatenate([getattr(self, a), getattr(other, a)])
+                                         for a in ('partition', 'leaf', 'cat', 'sum_y', 'count')])
+
+    def cat_leaves(self, max_catcode=None, random_state=None):
+        """
+        Return (CatLeafDeltas, ignored) as sparse_catwise_leaves() would for all
+        rows, picking a random refcat per leaf.
+        """
+        rng = _as_rng(random_state)
+        if max_catcode is None:
+            max_catcode = np.max(self.cat) if len(self.cat)>0 else 0
+        is_leaf_start = np.concatenate([[True],
+                                        (self.partition[1:] != self.partition[:-1]) |
+                                        (self.leaf[1:] != self.leaf[:-1])])[:len(self.cat)]
+        leaf_starts = np.flatnonzero(is_leaf_start)
+        n_uniq = np.diff(np.append(leaf_starts, len(self.cat)))
+        kept = n_uniq >= 2
+        in_kept_leaf = np.repeat(kept, n_uniq)
+        ignored = int(np.sum(self.count[~in_kept_leaf]))
+
+        if rng is None:
+            refidx = np.random.randint(0, n_uniq[kept])
+        else:
+            refidx = rng.integers(0, n_uniq[kept])
+        avg_y = self.sum_y / self.count
+        ref_avg = avg_y[leaf_starts[kept] + refidx]
+        cat_indptr = np.concatenate([[0], np.cumsum(n_uniq[kept])]).astype(np.int64)
+        cats = self.cat[in_kept_leaf]
+        cat_leaves = CatLeafDeltas(cat_indptr, cats,
+                                   avg_y[in_kept_leaf] - np.repeat(ref_avg, n_uniq[kept]),
+                                   self.count[in_kept_leaf], cats[cat_indptr[:-1] + refidx],
+                                   max_catcode)
+        return cat_leaves, ignored
+
+    def finalize(self, max_catcode=None, solver='merge', max_iter=3, random_state=None):
+        """
+        Return avg_per_cat, count_per_cat, ignored, merge_ignored as in
+        cat_partial_dependence(). solver is 'merge' or 'lsqr'; see avg_values_at_cat().
+        """
+        rng = _as_rng(random_state)
+        cat_leaves, ignored = self.cat_leaves(max_catcode, random_state=rng)
+        avg_per_cat, count_per_cat, merge_ignored = \
+            avg_values_at_cat(cat_leaves, max_iter=max_iter, rng=rng, solver=solver)
+        return avg_per_cat, count_per_cat, ignored, merge_ignored
+
+    def save(self, path):
+        np.savez_compressed(path, partition=self.partition, leaf=self.leaf, cat=self.cat,
+                            sum_y=self.sum_y, count=self.count)
+
+    @staticmethod
+    def load(path) -> 'CatPDAggregate':
+        with np.load(path) as f:
+            return CatPDAggregate(f['partition'], f['leaf'], f['cat'], f['sum_y'], f['count'])
+
+
+def catstratpd_trials(X:pd.DataFrame, y:pd.Series, colname:str,
+                      n_trials=1,
+                      bootstrap=False,
+                      subsample_size=.75,
+                      n_jobs=1,
+                      random_state=None,
+                      **kwargs) -> list:
+    """
+    Run cat_partial_dependence() n_trials times, each on a bootstrapped or
+    subsampled version of X,y (or X,y itself if n_trials==1), and return the list
+    of cat_partial_dependence() result tuples in trial order. Randomness and
+    n_jobs behave as in stratpd_trials(). kwargs are passed to
+    cat_partial_dependence(); pass max_catcode so all trials agree on length.
+    """
+    n_jobs = _n_workers(n_jobs, n_trials)
+    if n_jobs>1:
+        # numba's parallel threading layer can't be entered from multiple threads at once
+        kwargs['parallel_jit'] = False
+
+    def trial(seed):
+        rng = np.random.default_rng(seed)
+        X_, y_, _ = _resample_trial(X, y, n_trials, bootstrap, subsample_size, rng)
+        return cat_partial_dependence(X_, y_, colname=colname,
+                                      random_state=rng,
+                                      **kwargs)
+
+    return _run_trials(trial, n_trials, n_jobs, random_state)
+
+
 def plot_catstratpd(X, y,
                     colname,  # X[colname] expected to be numeric codes
                     targetname,
@@ -1082,6 +3035,10 @@ def plot_catstratpd(X, y,
                     show_xticks=True,
                     show_ylabel=True,
                     show_impact=False,
+                    stratifier=None,
+                    cache=None,
+                    n_jobs=1,
+                    random_state=None,
                     verbose=False,
                     figsize=(5,3)):
     """
@@ -1089,6 +3046,9 @@ def plot_catstratpd(X, y,
     Warning: cat columns are assumed to be label encoded as unique integers. This
     function uses the cat code as a raw index internally. So if you have two cat
     codes 1 and 1000, this function allocates internal arrays of size 1000+1.
+    Categories not connected to the first leaf are not plotted. Their averages
+    from cat_partial_dependence(merge_components=True) are only comparable within
+    a component, so they cannot share one bar chart.
 
     Key parameters:
 
@@ -1122,6 +3082,19 @@ def plot_catstratpd(X, y,
                             of a single leaf node containing all
                             observations, leading to a marginal not
                             partial dependence curve.
+
+    :param stratifier: optional fitted Stratifier or other model with apply(); every
+                       trial then reuses its partition instead of fitting a
+                       forest. See cat_partial_dependence(). A leaf id matrix
+                       only works with n_trials=1 as trials resample X.
+
+    :param cache: optional LeafCache so reruns with the same random_state skip
+                  fitting forests; see LeafCache.
+
+    :param n_jobs: how many threads to use for running trials; see catstratpd_trials()
+
+    :param random_state: int seed or np.random.Generator; trials are reproducible
+                         for a given seed regardless of n_jobs.
     """
     if ax is None:
         if figsize is not None:
@@ -1133,7 +3106,6 @@ def plot_catstratpd(X, y,
     max_catcode = max(uniq_catcodes)
 
     X_col = X[colname]
-    n = len(X_col)
 
     def avg_pd_catvalues(all_avg_per_cat):
         m = np.zeros(shape=(max_catcode+1,))
@@ -1156,25 +3128,21 @@ def plot_catstratpd(X, y,
     all_avg_per_cat = []
     ignored = 0
     merge_ignored = 0
-    for i in range(n_trials):
-        if n_trials>1:
-            if bootstrap:
-                idxs = resample(range(n), n_samples=n, replace=True)
-            else: # use subsetting
-                idxs = resample(range(n), n_samples=int(n * subsample_size), replace=False)
-            X_, y_ = X.iloc[idxs], y.iloc[idxs]
-        else:
-            X_, y_ = X, y
-
-        leaf_deltas, leaf_counts, avg_per_cat, count_per_cat, ignored_, merge_ignored_ = \
-            cat_partial_dependence(X_, y_,
-                                   max_catcode=np.max(X_col),
-                                   colname=colname,
-                                   n_trees=n_trees,
-                                   min_samples_leaf=min_samples_leaf,
-                                   max_features=max_features,
-                                   bootstrap=False,
-                                   verbose=verbose)
+    trials = catstratpd_trials(X, y, colname,
+                               n_trials=n_trials,
+                               bootstrap=bootstrap,
+                               subsample_size=subsample_size,
+                               n_jobs=n_jobs,
+                               random_state=random_state,
+                               max_catcode=np.max(X_col),
+                               sparse=True,
+                               n_trees=n_trees,
+                               min_samples_leaf=min_samples_leaf,
+                               max_features=max_features,
+                               stratifier=stratifier,
+                               cache=cache,
+                               verbose=verbose)
+    for leaf_deltas, leaf_counts, avg_per_cat, count_per_cat, ignored_, merge_ignored_ in trials:
         impacts.append(np.nanmean(np.abs(avg_per_cat)))
         ignored += ignored_
         merge_ignored += merge_ignored_
@@ -1362,7 +3330,7 @@ def scramble(X : np.ndarray) -> np.ndarray:
     return X_rand
 
 
-def df_scramble(X : pd.DataFrame) -> pd.DataFrame:
+def df_scramble(X : pd.DataFrame, rng=None) -> pd.DataFrame:
     """
     From Breiman: https://www.stat.berkeley.edu/~breiman/RandomForests/cc_home.htm
     "...the first coordinate is sampled from the N values {x(1,n)}. The second
@@ -1371,17 +3339,41 @@ def df_scramble(X : pd.DataFrame) -> pd.DataFrame:
     X_rand = X.copy()
     for colname in X:
         # X_rand[colname] = np.random.choice(X[colname], len(X), replace=True)
-        X_rand[colname] = X_rand[colname].sample(frac=1.0)
+        # .values as assigning a Series realigns on the index, undoing the shuffle
+        X_rand[colname] = X_rand[colname].sample(frac=1.0, random_state=rng).values
     return X_rand
 
 
-def conjure_twoclass(X):
+def permuted_twoclass(X:np.ndarray, rng=None, dtype=np.float32):
+    """
+    Memory-lean version of conjure_twoclass() for numeric matrices. Allocate the
+    (2n, p) result once, copy X into the first n rows, then fill the last n rows
+    one column at a time with a random permutation of that column (drawn from
+    np.random.Generator rng or global np.random state). There's no scrambled copy,
+    pd.concat(), or DataFrame. dtype defaults to float32, which is what sklearn
+    trees convert X to anyway, so the 2n rows take the same space as X in float64
+    and fit() does not copy them again. Returns X_synth, y_synth where y_synth
+    is 0 for X rows and 1 for scrambled rows.
+    """
+    X = np.asarray(X)
+    n, p = X.shape
+    X_synth = np.empty((2*n, p), dtype=dtype)
+    X_synth[:n] = X
+    for j in range(p):
+        perm = rng.permutation(n) if rng is not None else np.random.permutation(n)
+        X_synth[n:, j] = X[perm, j]
+    y_synth = np.concatenate([np.zeros(n), np.ones(n)])
+    return X_synth, y_synth
+
+
+def conjure_twoclass(X, rng=None):
     """
     Make new data set 2x as big with X and scrambled version of it that
     destroys structure between features. Old is class 0, scrambled is class 1.
+    DataFrame scrambling uses np.random.Generator rng if not None.
     """
     if isinstance(X, pd.DataFrame):
-        X_rand = df_scramble(X)
+        X_rand = df_scramble(X, rng=rng)
         X_synth = pd.concat([X, X_rand], axis=0)
     else:
         X_rand = scramble(X)
@@ -1428,6 +3420,27 @@ def zero_as_one(a):
     return np.where(a == 0, 1, a)
 
 
+def _as_rng(random_state):
+    "Normalize None, int seed, or np.random.Generator to a Generator or None"
+    if random_state is None:
+        return None
+    return np.random.default_rng(random_state)
+
+
+def _rf_seed(rng):
+    "Draw an int random_state for sklearn from rng; None means sklearn uses np.random"
+    if rng is None:
+        return None
+    return int(rng.integers(0, 2**31 - 1))
+
+
+def _randint(rng, n):
+    "Random int in [0,n) from rng or, if None, from global np.random state"
+    if rng is None:
+        return np.random.randint(0, n, size=1)[0]
+    return rng.integers(0, n)
+
+
 def parray(a):
     if type(a[0])==np.int64:
         return '[ ' + (' '.join([f"{x:6d}" for x in a])).strip() + ' ]'
@@ -2,6 +2,7 @@ from stratx.partdep import *
 from articles.pd.support import *
 
 import numpy as np
+from timeit import default_timer as timer
 
 from test_catmerge import stratify_cats
 
@@ -16,13 +17,13 @@ def speed_ModelID():
     leaf_deltas, leaf_counts, refcats, ignored = \
         stratify_cats(X,y,colname="ModelID",min_samples_leaf=min_samples_leaf)
 
-    start = timer()
-    _, _, merge_ignored = \
-        avg_values_at_cat(leaf_deltas, leaf_counts, refcats, max_iter=10)
-    stop = timer()
-
     nunique = len(np.unique(X['ModelID']))
-    print(f"n={n}, unique cats {nunique}, min_samples_leaf={min_samples_leaf}, merge_ignored={merge_ignored}: avg_values_at_cat {stop - start:.3f}s")
+    for solver in ['merge', 'lsqr']:
+        start = timer()
+        _, _, merge_ignored = \
+            avg_values_at_cat(leaf_deltas, leaf_counts, refcats, max_iter=10, solver=solver)
+        stop = timer()
+        print(f"n={n}, unique cats {nunique}, min_samples_leaf={min_samples_leaf}, merge_ignored={merge_ignored}: avg_values_at_cat solver={solver} {stop - start:.3f}s")
 
 
 if __name__ == '__main__':
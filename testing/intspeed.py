@@ -0,0 +1,43 @@
+from stratx.partdep import *
+from articles.pd.support import *
+
+import numpy as np
+from timeit import default_timer as timer
+from sklearn.ensemble import RandomForestRegressor
+
+def speed_YearMade():
+    "Compare bincount path for small-range integer columns against lexsort path"
+    np.random.seed(1)
+
+    n = 20_000
+    min_samples_leaf = 10
+    X,y = load_bulldozer(n=n)
+    colname = 'YearMade'
+    X_not_col = X.drop(colname, axis=1)
+    rf = RandomForestRegressor(n_estimators=1, min_samples_leaf=min_samples_leaf, bootstrap=False)
+    rf.fit(X_not_col, y)
+    leaves = leaf_samples(rf, X_not_col)
+    X_col, y = X[colname].values, y.values
+
+    discrete_xc_space(leaves, X_col, y) # warm up
+    for use_bincount in [True, False]:
+        start = timer()
+        for i in range(10):
+            discrete_xc_space(leaves, X_col, y, use_bincount=use_bincount)
+        stop = timer()
+        print(f"n={n}, {len(leaves)} leaves, unique {colname} {len(np.unique(X_col))}: discrete_xc_space use_bincount={use_bincount} {(stop - start)/10*1000:.1f}ms")
+
+    start = timer()
+    for i in range(10):
+        ColumnIndex.from_column(X_col)
+    stop = timer()
+    print(f"ColumnIndex.from_column {(stop - start)/10*1000:.2f}ms")
+    start = timer()
+    for i in range(10):
+        np.unique(X_col, return_inverse=True, return_counts=True)
+    stop = timer()
+    print(f"np.unique {(stop - start)/10*1000:.2f}ms")
+
+
+if __name__ == '__main__':
+    speed_YearMade()
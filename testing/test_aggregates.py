@@ -0,0 +1,120 @@
+"""
+MIT License
+
+Copyright (c) 2019 Terence Parr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+import pickle
+import numpy as np
+import pandas as pd
+
+from stratx.partdep import *
+from test_sparse_catwise_leaves import bulldozer_like_data
+
+
+def numeric_data(n=3000):
+    np.random.seed(1)
+    X = pd.DataFrame({'a': np.random.randint(0, 30, n), 'b': np.random.random(n)})
+    y = X['a']**2 + 10*X['b'] + np.random.normal(0, 1, n)
+    return X, y
+
+
+def test_pd_aggregate_single_shard_matches_partial_dependence():
+    X, y = numeric_data()
+    expected = partial_dependence(X, y, 'a', random_state=1)
+    result = PDAggregate.from_data(X, y, 'a', random_state=1).finalize()
+    for a, b in zip(expected[2:8], result):
+        np.testing.assert_array_almost_equal(a, b)
+
+
+def test_pd_aggregate_with_x_grid_matches_partial_dependence():
+    X, y = numeric_data()
+    X['b'] *= 30
+    x_grid = np.linspace(0, 30, 16)
+    expected = partial_dependence(X, y, 'b', x_grid=x_grid, random_state=1)
+    agg = PDAggregate.from_data(X, y, 'b', x_grid=x_grid, random_state=1)
+    assert set(agg.uniq_x) <= set(x_grid)
+    for a, b in zip(expected[2:8], agg.finalize()):
+        np.testing.assert_array_almost_equal(a, b)
+
+
+def test_pd_aggregate_merge_is_associative(tmp_path):
+    X, y = numeric_data()
+    shards = [PDAggregate.from_data(X.iloc[s], y.iloc[s], 'a', random_state=i)
+              for i, s in enumerate([slice(0, 1000), slice(1000, 2000), slice(2000, 3000)])]
+    left = shards[0].merge(shards[1]).merge(shards[2])
+    right = shards[0].merge(shards[1].merge(shards[2]))
+    path = str(tmp_path / "agg.npz")
+    right.save(path)
+    reloaded = pickle.loads(pickle.dumps(PDAggregate.load(path)))
+    for a, b, c in zip(left.finalize(), right.finalize(), reloaded.finalize()):
+        np.testing.assert_array_almost_equal(a, b)
+        np.testing.assert_array_almost_equal(a, c)
+    pdpx, pdpy = left.finalize()[3:5]
+    assert np.corrcoef(pdpy, pdpx**2)[0,1] > .99
+
+
+def test_cat_aggregate_matches_cat_partial_dependence(tmp_path):
+    X, y = bulldozer_like_data()
+    X_not_col = X.drop('ModelID', axis=1).values
+    max_catcode = np.max(X['ModelID'])
+    stratifier = Stratifier(n_trees=2, min_samples_leaf=5).fit(X_not_col, y.values, random_state=1)
+    _, _, avg_per_cat, count_per_cat, ignored, merge_ignored = \
+        cat_partial_dependence(X, y, 'ModelID', stratifier=stratifier, random_state=5)
+
+    whole = CatPDAggregate.from_data(X, y, 'ModelID', stratifier=stratifier, partition=0)
+    # row shards with the same stratifier and partition id pool their leaves
+    a = CatPDAggregate.from_data(X.iloc[:700], y.iloc[:700], 'ModelID', stratifier=stratifier, partition=0)
+    b = CatPDAggregate.from_data(X.iloc[700:], y.iloc[700:], 'ModelID', stratifier=stratifier, partition=0)
+    path = str(tmp_path / "cat.npz")
+    b.save(path)
+    merged = a.merge(CatPDAggregate.load(path))
+    for agg in (whole, merged):
+        avg_per_cat_, count_per_cat_, ignored_, merge_ignored_ = \
+            agg.finalize(max_catcode=max_catcode, random_state=5)
+        np.testing.assert_array_almost_equal(avg_per_cat, avg_per_cat_)
+        np.testing.assert_array_equal(count_per_cat, count_per_cat_)
+        assert (ignored, merge_ignored)==(ignored_, merge_ignored_)
+
+
+def test_cat_aggregates_from_separate_partitions_stay_separate():
+    X, y = bulldozer_like_data()
+    a = CatPDAggregate.from_data(X.iloc[:1000], y.iloc[:1000], 'ModelID', random_state=1)
+    b = CatPDAggregate.from_data(X.iloc[1000:], y.iloc[1000:], 'ModelID', random_state=2)
+    merged = a.merge(b)
+    assert len(merged.cat)==len(a.cat) + len(b.cat)
+    assert len(np.unique(merged.partition))==2
+    avg_per_cat, count_per_cat, ignored, merge_ignored = merged.finalize(random_state=1)
+    assert np.sum(count_per_cat) + ignored + merge_ignored==len(X)
+
+
+def test_cat_aggregates_reproducible_with_random_state():
+    X, y = bulldozer_like_data()
+    def run():
+        a = CatPDAggregate.from_data(X.iloc[:1000], y.iloc[:1000], 'ModelID', random_state=1)
+        b = CatPDAggregate.from_data(X.iloc[1000:], y.iloc[1000:], 'ModelID', random_state=2)
+        return a.merge(b).finalize(random_state=7)
+    avg_per_cat, count_per_cat, ignored, merge_ignored = run()
+    avg_per_cat_, count_per_cat_, ignored_, merge_ignored_ = run()
+    np.testing.assert_array_equal(avg_per_cat, avg_per_cat_)
+    np.testing.assert_array_equal(count_per_cat, count_per_cat_)
+    assert (ignored, merge_ignored)==(ignored_, merge_ignored_)
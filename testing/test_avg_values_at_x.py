@@ -0,0 +1,70 @@
+"""
+MIT License
+
+Copyright (c) 2019 Terence Parr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+import numpy as np
+from numpy import nan
+
+from stratx.partdep import *
+
+
+def dense_avg_values_at_x(uniq_x, leaf_ranges, leaf_slopes):
+    "The original nx x nslopes matrix approach, used as a reference"
+    slopes = np.full(shape=(len(uniq_x), len(leaf_slopes)), fill_value=np.nan)
+    for i, (xr, slope) in enumerate(zip(leaf_ranges, leaf_slopes)):
+        slopes[:, i] = np.where((uniq_x < xr[0]) | (uniq_x >= xr[1]), np.nan, slope)
+    counts = len(leaf_slopes) - np.isnan(slopes).sum(axis=1)
+    with np.errstate(invalid='ignore'):
+        avg = np.nansum(slopes, axis=1) / counts
+    return avg, counts
+
+
+def test_simple_ranges():
+    uniq_x = np.array([1, 2, 3, 5, 6])
+    leaf_ranges = np.array([[1, 3], [2, 5], [5, 6]])
+    leaf_slopes = np.array([1.0, 3.0, 0.0])
+    for f in [avg_values_at_x_jit, avg_values_at_x_nonparallel_jit]:
+        avg, counts = f(uniq_x, leaf_ranges, leaf_slopes)
+        np.testing.assert_array_almost_equal(avg, [1, 2, 3, 0, nan])
+        np.testing.assert_array_equal(counts, [1, 2, 1, 1, 0])
+
+
+def test_no_slopes():
+    uniq_x = np.array([1.0, 2.0])
+    avg, counts = avg_values_at_x_jit(uniq_x, np.array([]).reshape(0, 0), np.array([]))
+    np.testing.assert_array_equal(avg, [nan, nan])
+    np.testing.assert_array_equal(counts, [0, 0])
+
+
+def test_random_ranges_match_dense():
+    np.random.seed(1)
+    uniq_x = np.unique(np.random.random(200))
+    left = np.random.choice(uniq_x[:-1], 1000)
+    right = np.array([np.random.choice(uniq_x[uniq_x > l]) for l in left])
+    leaf_ranges = np.column_stack([left, right])
+    leaf_slopes = np.random.normal(0, 10, 1000)
+    expected_avg, expected_counts = dense_avg_values_at_x(uniq_x, leaf_ranges, leaf_slopes)
+    avg, counts = avg_values_at_x_jit(uniq_x, leaf_ranges, leaf_slopes)
+    np.testing.assert_array_almost_equal(avg, expected_avg)
+    np.testing.assert_array_equal(counts, expected_counts)
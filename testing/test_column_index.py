@@ -0,0 +1,106 @@
+"""
+MIT License
+
+Copyright (c) 2019 Terence Parr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+
+from stratx.partdep import *
+from stratx.partdep import _small_int_range
+
+
+def test_small_int_range():
+    assert _small_int_range(np.array([1990, 1995, 2005])) == (1990, 16)
+    assert _small_int_range(np.array([3., -2., 0.])) == (-2., 6)
+    assert _small_int_range(np.array([0.5, 1.0])) is None
+    assert _small_int_range(np.array([0., np.nan])) is None
+    assert _small_int_range(np.array([0, 10**9])) is None
+    assert _small_int_range(np.array(['a', 'b'])) is None
+
+
+def test_column_index_matches_np_unique():
+    np.random.seed(1)
+    for X_col in [np.random.randint(-5, 20, size=1000),
+                  np.random.randint(1990, 2010, size=1000).astype(float),
+                  np.random.random(1000)]:
+        uniq, inverse, counts = np.unique(X_col, return_inverse=True, return_counts=True)
+        index = ColumnIndex.from_column(X_col)
+        np.testing.assert_array_equal(index.uniq_x, uniq)
+        assert index.uniq_x.dtype==X_col.dtype
+        np.testing.assert_array_equal(index.codes, inverse)
+        assert index.codes.dtype==np.int32
+        np.testing.assert_array_equal(index.counts, counts)
+        np.testing.assert_array_equal(index.counts_at(uniq[::3]), counts[::3])
+
+
+def test_counts_at_missing_values_is_zero():
+    index = ColumnIndex.from_column(np.array([3, 1, 3, 7]))
+    np.testing.assert_array_equal(index.counts_at([0, 1, 2, 3, 7, 9]), [0, 1, 0, 2, 1, 0])
+
+
+def test_take_matches_index_of_subsample():
+    np.random.seed(1)
+    X_col = np.random.random(500).round(2)
+    index = ColumnIndex.from_column(X_col)
+    for rows in [np.random.choice(500, size=300, replace=False),
+                 np.random.choice(500, size=500, replace=True)]:
+        sub, expected = index.take(rows), ColumnIndex.from_column(X_col[rows])
+        np.testing.assert_array_equal(sub.uniq_x, expected.uniq_x)
+        np.testing.assert_array_equal(sub.codes, expected.codes)
+        np.testing.assert_array_equal(sub.counts, expected.counts)
+
+
+def test_bincount_slopes_match_generic_path():
+    np.random.seed(1)
+    n = 2000
+    X = pd.DataFrame({'x1':np.random.randint(0, 40, n).astype(float),
+                      'x2':np.random.random(n),
+                      'x3':np.random.randint(-3, 3, n)})
+    y = X['x1']**2 + 5*X['x2'] + X['x3'] + np.random.normal(0, 1, n)
+    for colname in ['x1', 'x3']:
+        X_not_col = X.drop(colname, axis=1)
+        rf = RandomForestRegressor(n_estimators=3, min_samples_leaf=10, bootstrap=False, random_state=1)
+        rf.fit(X_not_col, y)
+        leaves = leaf_samples(rf, X_not_col)
+        X_col, y_ = X[colname].values, y.values
+        fast = discrete_xc_space(leaves, X_col, y_, column_index=ColumnIndex.from_column(X_col))
+        slow = discrete_xc_space(leaves, X_col, y_, use_bincount=False)
+        np.testing.assert_array_equal(fast[0], slow[0])  # x ranges
+        np.testing.assert_allclose(fast[1], slow[1])     # slopes
+        np.testing.assert_array_equal(fast[2], slow[2])  # leaf of each slope
+        assert fast[3]==slow[3]                          # ignored
+
+
+def test_partial_dependence_with_column_index_same_as_without():
+    np.random.seed(1)
+    n = 1000
+    X = pd.DataFrame({'x1':np.random.random(n).round(2), 'x2':np.random.random(n)})
+    y = X['x1']**2 + X['x2'] + np.random.normal(0, .1, n)
+    index = ColumnIndex.from_column(X['x1'].values)
+    trials = stratpd_trials(X, y, 'x1', n_trials=3, random_state=1)
+    trials_with_index = stratpd_trials(X, y, 'x1', n_trials=3, random_state=1, column_index=index)
+    for result, result_with_index in zip(trials, trials_with_index):
+        for a, b in zip(result, result_with_index):
+            np.testing.assert_array_equal(a, b)
@@ -0,0 +1,211 @@
+"""
+MIT License
+
+Copyright (c) 2019 Terence Parr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+
+from stratx.ice import *
+
+
+def ice_data(n=1000):
+    np.random.seed(1)
+    X = pd.DataFrame({'x1':np.random.randint(0, 30, n),
+                      'x2':np.random.random(n),
+                      'x3':np.random.random(n)})
+    y = X['x1']**2 + 10*X['x2'] + np.random.normal(0, 1, n)
+    rf = RandomForestRegressor(n_estimators=5, min_samples_leaf=5, random_state=1)
+    rf.fit(X, y)
+    return X, rf
+
+
+def loop_ice(model, X, colname, linex):
+    "Reference ICE computation: one predict() per x value"
+    X = X.copy()
+    lines = np.empty(shape=(len(X), len(linex)))
+    for i, v in enumerate(linex):
+        X[colname] = v
+        lines[:, i] = model.predict(X)
+    return lines
+
+
+def mixed_dtype_data(n=500):
+    np.random.seed(1)
+    X = pd.DataFrame({'x1':np.random.randint(0, 30, n),
+                      'color':pd.Categorical(np.random.choice(['red','green','blue'], n)),
+                      'flag':np.random.random(n) < .3})
+    return X
+
+
+class DtypeCheckingModel:
+    "Predicts from int, category and bool columns, failing if any dtype changed"
+    def predict(self, X):
+        assert X['x1'].dtype==np.int64
+        assert isinstance(X['color'].dtype, pd.CategoricalDtype)
+        assert X['flag'].dtype==bool
+        return X['x1']**2 + 10*X['color'].cat.codes + 5*X['flag']
+
+
+def test_ice_matrix_matches_one_predict_per_x():
+    X, rf = ice_data()
+    linex = np.linspace(0, 29, 13) # non-integer values for int column
+    expected = loop_ice(rf, X, 'x1', linex)
+    for chunk_size in [1_000_000, 2500, 450]:
+        ice = ice_matrix(rf, X, 'x1', linex, chunk_size=chunk_size)
+        assert ice.shape==(len(X), len(linex)) and ice.dtype==np.float32
+        np.testing.assert_allclose(ice, expected, rtol=1e-5)
+
+
+def test_ice_matrix_keeps_column_dtypes():
+    X = mixed_dtype_data()
+    X_orig = X.copy()
+    model = DtypeCheckingModel()
+    for colname, linex in [('x1', np.arange(0, 30, 3)), ('color', np.array(['blue','green','red']))]:
+        X_ = X.copy()
+        expected = np.empty(shape=(len(X), len(linex)))
+        for i, v in enumerate(linex):
+            X_[colname] = pd.Series(v, index=X.index, dtype=X[colname].dtype)
+            expected[:, i] = model.predict(X_)
+        for chunk_size in [1_000_000, 1200, 300]:
+            ice = ice_matrix(model, X, colname, linex, chunk_size=chunk_size)
+            np.testing.assert_array_equal(ice, expected)
+        rows = np.arange(0, len(X), 7)
+        ice = ice_matrix(model, X, colname, linex, rows=rows, chunk_size=100)
+        np.testing.assert_array_equal(ice, expected[rows])
+    pd.testing.assert_frame_equal(X, X_orig)
+
+
+def test_predict_ice_does_not_modify_X():
+    X, rf = ice_data()
+    X_orig = X.copy()
+    ice = predict_ice(rf, X, 'x2', numx=10)
+    pd.testing.assert_frame_equal(X, X_orig)
+    assert ice.shape==(len(X)+1, 10)
+    np.testing.assert_allclose(ice.iloc[0], np.linspace(X['x2'].min(), X['x2'].max(), 10), rtol=1e-6)
+
+
+def test_predict_ice_as_array_and_nlines():
+    X, rf = ice_data()
+    frame = predict_ice(rf, X, 'x1', numx=20)
+    lines = predict_ice(rf, X, 'x1', numx=20, as_frame=False)
+    assert isinstance(lines, np.ndarray)
+    np.testing.assert_array_equal(lines, frame.values)
+    sampled = predict_ice(rf, X, 'x1', numx=20, nlines=50, as_frame=False)
+    assert sampled.shape==(51, 20)
+    np.testing.assert_array_equal(sampled[0], lines[0])
+
+
+def test_friedman_pdp_threads_do_not_modify_X():
+    X, rf = ice_data(n=300)
+    X_orig = X.copy()
+    pdpxs, pdpys = friedman_partial_dependences(rf, X, numx=None, n_jobs=1)
+    pdpxs_, pdpys_ = friedman_partial_dependences(rf, X, numx=None, n_jobs=3)
+    pd.testing.assert_frame_equal(X, X_orig)
+    for a, b in zip(pdpys + pdpxs, pdpys_ + pdpxs_):
+        np.testing.assert_array_equal(a, b)
+    # same as overwriting X[colname] one x at a time
+    pdpy = loop_ice(rf, X, 'x1', pdpxs[0]).mean(axis=0)
+    np.testing.assert_allclose(pdpys[0], pdpy - np.mean(pdpy))
+
+
+def test_friedman_pdp_sampled_x_same_for_any_n_jobs(monkeypatch):
+    import threading
+    X, rf = ice_data(n=300)
+    # x values must be drawn in the calling thread, not in thread pool order
+    choice, threads = np.random.choice, set()
+    def recording_choice(*args, **kwargs):
+        threads.add(threading.current_thread())
+        return choice(*args, **kwargs)
+    monkeypatch.setattr(np.random, 'choice', recording_choice)
+    np.random.seed(5)
+    pdpxs, pdpys = friedman_partial_dependences(rf, X, numx=20, n_jobs=1)
+    np.random.seed(5)
+    pdpxs_, pdpys_ = friedman_partial_dependences(rf, X, numx=20, n_jobs=4)
+    assert threads=={threading.current_thread()}
+    for a, b in zip(pdpys + pdpxs, pdpys_ + pdpxs_):
+        np.testing.assert_array_equal(a, b)
+
+
+def test_friedman_pdp_keeps_column_dtypes():
+    X = mixed_dtype_data()
+    X_orig = X.copy()
+    model = DtypeCheckingModel()
+    for colname in ['x1', 'color']:
+        pdpx, pdpy = friedman_partial_dependence(model, X, colname, numx=None, mean_centered=False)
+        X_ = X.copy()
+        for x, y in zip(pdpx, pdpy):
+            X_[colname] = pd.Series(x, index=X.index, dtype=X[colname].dtype)
+            assert y==np.mean(model.predict(X_))
+    pd.testing.assert_frame_equal(X, X_orig)
+
+
+def test_failed_predict_leaves_X_alone():
+    X, rf = ice_data(n=300)
+    X_orig = X.copy()
+    class Flaky:
+        ncalls = 0
+        def predict(self, X):
+            Flaky.ncalls += 1
+            if Flaky.ncalls > 1:
+                raise RuntimeError("model failed")
+            return rf.predict(X)
+    for f in [lambda: friedman_partial_dependence(Flaky(), X, 'x2', numx=5),
+              lambda: ice_matrix(Flaky(), X, 'x2', [0, .5, 1], chunk_size=300)]:
+        Flaky.ncalls = 0
+        try:
+            f()
+            assert False, "expected predict() failure"
+        except RuntimeError:
+            pass
+        pd.testing.assert_frame_equal(X, X_orig)
+
+
+def test_streaming_pdp_matches_mean_of_ice_lines():
+    X, rf = ice_data()
+    linex = np.linspace(0, 29, 15)
+    ice = ice_matrix(rf, X, 'x1', linex, dtype=np.float64)
+    for chunk_size in [1_000_000, 2000, 15]:
+        pdpy, stderr, counts = streaming_pdp(rf, X, 'x1', linex, chunk_size=chunk_size)
+        np.testing.assert_allclose(pdpy, ice.mean(axis=0))
+        np.testing.assert_allclose(stderr, ice.std(axis=0, ddof=1) / np.sqrt(len(X)))
+        np.testing.assert_array_equal(counts, len(X))
+
+
+def test_streaming_pdp_stops_early_at_tolerance():
+    X, rf = ice_data()
+    linex = np.linspace(0, 29, 15)
+    pdpy, stderr, counts = streaming_pdp(rf, X, 'x1', linex, chunk_size=1500, tol=5.0,
+                                         min_rows=200, random_state=1)
+    assert np.all(counts < len(X)) and np.all(counts >= 200)
+    assert np.all(stderr <= 5.0)
+    np.testing.assert_allclose(pdpy, ice_matrix(rf, X, 'x1', linex).mean(axis=0), atol=20)
+
+
+def test_original_pdp():
+    X, rf = ice_data()
+    pdp_curve = original_pdp(rf, X, 'x1', numx=30)
+    assert pdp_curve.shape==(30,) and pdp_curve[0]==0
+    pdp_curve = original_catpdp(rf, X, 'x1')
+    assert pdp_curve.shape==(30,)
@@ -0,0 +1,108 @@
+"""
+MIT License
+
+Copyright (c) 2019 Terence Parr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+import os
+import numpy as np
+import pandas as pd
+
+from stratx.partdep import *
+from test_sparse_catwise_leaves import bulldozer_like_data
+
+
+def test_cache_hit_skips_fit_and_matches(tmp_path, monkeypatch):
+    X, y = bulldozer_like_data()
+    cache = LeafCache(str(tmp_path))
+    expected = partial_dependence(X, y, 'YearMade', random_state=1)
+    first = partial_dependence(X, y, 'YearMade', random_state=1, cache=cache)
+    catfirst = cat_partial_dependence(X, y, 'ModelID', random_state=1, cache=cache)
+    assert len([f for f in os.listdir(tmp_path) if f.endswith(".npy")])==2
+
+    def no_fit(self, *args, **kwargs):
+        raise AssertionError("fit called despite cache hit")
+    monkeypatch.setattr(Stratifier, 'fit', no_fit)
+    second = partial_dependence(X, y, 'YearMade', random_state=1, cache=cache)
+    catsecond = cat_partial_dependence(X, y, 'ModelID', random_state=1, cache=cache)
+    for a, b, c in zip(expected, first, second):
+        np.testing.assert_array_equal(a, b)
+        np.testing.assert_array_equal(a, c)
+    for a, b in zip(catfirst, catsecond):
+        np.testing.assert_array_equal(a, b)
+
+
+def test_cache_key_depends_on_data_and_hyperparameters():
+    X, y = bulldozer_like_data()
+    X_not_col = X.drop('ModelID', axis=1).values
+    def key(X_not_col=X_not_col, y=y.values, seed=1, min_samples_leaf=5, supervised=True):
+        return LeafCache.key(X_not_col, y, 'ModelID', np.random.default_rng(seed),
+                             1, min_samples_leaf, 1.0, False, supervised)
+    assert key()==key()
+    assert key()!=key(seed=2)
+    assert key()!=key(min_samples_leaf=10)
+    assert key()!=key(y=y.values+1)
+    assert key(supervised=False)==key(y=y.values+1, supervised=False)
+    X2 = X_not_col.copy()
+    X2[0,0] += 1
+    assert key()!=key(X_not_col=X2)
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = LeafCache(str(tmp_path), max_bytes=2500)
+    rng = np.random.default_rng(1)
+    leaf_ids = np.zeros((250,1), dtype=np.int32) # ~1128 bytes each as .npy
+    cache.put('a', leaf_ids, rng)
+    cache.put('b', leaf_ids, rng)
+    os.utime(tmp_path / 'a.npy', (0, 0))
+    os.utime(tmp_path / 'b.npy', (1, 1))
+    assert cache.get('a', rng) is not None # 'a' now most recently used
+    cache.put('c', leaf_ids, rng)
+    assert cache.get('b', rng) is None
+    assert cache.get('a', rng) is not None
+    assert cache.get('c', rng) is not None
+
+
+def test_cache_with_mt19937_generator(tmp_path, monkeypatch):
+    X, y = bulldozer_like_data()
+    cache = LeafCache(str(tmp_path))
+    rng = np.random.Generator(np.random.MT19937(1))
+    first = partial_dependence(X, y, 'YearMade', random_state=rng, cache=cache)
+    assert len([f for f in os.listdir(tmp_path) if f.endswith(".state")])==1
+
+    def no_fit(self, *args, **kwargs):
+        raise AssertionError("fit called despite cache hit")
+    monkeypatch.setattr(Stratifier, 'fit', no_fit)
+    rng2 = np.random.Generator(np.random.MT19937(1))
+    second = partial_dependence(X, y, 'YearMade', random_state=rng2, cache=cache)
+    for a, b in zip(first, second):
+        np.testing.assert_array_equal(a, b)
+    assert rng.integers(0, 2**31)==rng2.integers(0, 2**31)
+    # MT19937 states differing only in the middle of the key array get different keys
+    X_not_col = X.drop('YearMade', axis=1).values
+    state = np.random.MT19937(1).state
+    state['state']['key'][300] += 1
+    other = np.random.MT19937()
+    other.state = state
+    key = lambda bitgen: LeafCache.key(X_not_col, y.values, 'YearMade', np.random.Generator(bitgen),
+                                       1, 10, 1.0, False, True)
+    assert key(np.random.MT19937(1))!=key(other)
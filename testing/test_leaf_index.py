@@ -0,0 +1,123 @@
+"""
+MIT License
+
+Copyright (c) 2019 Terence Parr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+
+from stratx.partdep import *
+
+
+def test_single_tree():
+    leaf_ids = np.array([3, 1, 3, 4, 1, 1]).reshape(-1,1)
+    leaves = LeafIndex.from_leaf_ids(leaf_ids)
+    assert len(leaves)==3
+    np.testing.assert_array_equal(leaves.indices, [1, 4, 5, 0, 2, 3])
+    np.testing.assert_array_equal(leaves.indptr, [0, 3, 5, 6])
+    np.testing.assert_array_equal(leaves[0], [1, 4, 5])
+    np.testing.assert_array_equal(leaves[1], [0, 2])
+    np.testing.assert_array_equal(leaves[2], [3])
+    np.testing.assert_array_equal(leaves.leaf_sizes(), [3, 2, 1])
+
+
+def test_two_trees():
+    leaf_ids = np.array([[1, 2],
+                         [2, 2],
+                         [1, 5],
+                         [2, 2]])
+    leaves = LeafIndex.from_leaf_ids(leaf_ids)
+    expected = [[0, 2], [1, 3], [0, 1, 3], [2]]
+    assert len(leaves)==len(expected)
+    for leaf, exp in zip(leaves, expected):
+        np.testing.assert_array_equal(leaf, exp)
+    assert leaves.indices.dtype==np.int32
+
+
+def test_same_grouping_as_np_where():
+    np.random.seed(1)
+    n = 500
+    X = pd.DataFrame({'x1':np.random.random(n), 'x2':np.random.random(n)})
+    y = X['x1'] + X['x2']
+    rf = RandomForestRegressor(n_estimators=3, min_samples_leaf=5, bootstrap=False)
+    rf.fit(X, y)
+    leaf_ids = rf.apply(X)
+    expected = []
+    for t in range(leaf_ids.shape[1]):
+        for id in np.unique(leaf_ids[:,t]):
+            expected.append(np.where(leaf_ids[:,t]==id)[0])
+    leaves = leaf_samples(rf, X)
+    assert len(leaves)==len(expected)
+    for leaf, exp in zip(leaves, expected):
+        np.testing.assert_array_equal(leaf, exp)
+
+
+def test_large_or_negative_leaf_ids_use_argsort():
+    leaf_ids = np.array([10**9, -5, 10**9, 7]).reshape(-1,1)
+    leaves = LeafIndex.from_leaf_ids(leaf_ids)
+    np.testing.assert_array_equal(leaves.indices, [1, 3, 0, 2])
+    np.testing.assert_array_equal(leaves.indptr, [0, 1, 2, 4])
+
+
+def test_float_leaf_ids_use_argsort():
+    # e.g., GradientBoostingRegressor.apply() returns float64 leaf ids
+    leaf_ids = np.array([[3., 1.], [1., 1.], [3., 2.], [2., 1.]])
+    leaves = LeafIndex.from_leaf_ids(leaf_ids)
+    expected = LeafIndex.from_leaf_ids(leaf_ids.astype(int))
+    np.testing.assert_array_equal(leaves.indices, expected.indices)
+    np.testing.assert_array_equal(leaves.indptr, expected.indptr)
+    np.testing.assert_array_equal(leaves.indices, [1, 3, 0, 2, 0, 1, 3, 2])
+
+
+def test_float_leaf_ids_from_gradient_boosting():
+    from sklearn.ensemble import GradientBoostingRegressor
+    np.random.seed(1)
+    n = 500
+    X = pd.DataFrame(np.random.random(size=(n, 3)), columns=['x1','x2','x3'])
+    y = X['x1'] + X['x2']**2 + X['x3']
+    X_not_col = X.drop('x2', axis=1).values
+    gbr = GradientBoostingRegressor(n_estimators=2, max_depth=3, random_state=1).fit(X_not_col, y)
+    leaf_ids = gbr.apply(X_not_col)
+    assert leaf_ids.dtype==np.float64
+    pdpx, pdpy = partial_dependence(X, y, 'x2', stratifier=leaf_ids)[5:7]
+    pdpx_, pdpy_ = partial_dependence(X, y, 'x2', stratifier=leaf_ids.astype(int))[5:7]
+    np.testing.assert_array_equal(pdpx, pdpx_)
+    np.testing.assert_array_equal(pdpy, pdpy_)
+
+
+def test_apply_trees_matches_sklearn_apply():
+    np.random.seed(1)
+    n = 3000
+    X = np.random.normal(size=(n, 4))
+    X[:,1] = np.random.randint(0, 10, size=n)
+    y = X @ np.array([1, 2, 3, 4]) + np.random.normal(size=n)
+    for n_trees, max_features in [(1, 1.0), (4, .5)]:
+        rf = RandomForestRegressor(n_estimators=n_trees, min_samples_leaf=5,
+                                   max_features=max_features, random_state=1)
+        rf.fit(X, y)
+        np.testing.assert_array_equal(apply_trees(rf, X), rf.apply(X))
+        np.testing.assert_array_equal(apply_trees(rf, X, chunk_size=100), rf.apply(X))
+        np.testing.assert_array_equal(apply_trees(rf.estimators_[0], X), rf.estimators_[0].apply(X))
+        # float32 input and pandas-derived input work too
+        np.testing.assert_array_equal(apply_trees(rf, X.astype(np.float32)), rf.apply(X))
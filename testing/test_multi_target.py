@@ -0,0 +1,102 @@
+"""
+MIT License
+
+Copyright (c) 2019 Terence Parr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+
+from stratx.partdep import *
+from test_sparse_catwise_leaves import bulldozer_like_data
+
+
+def multi_target_data(n=2000):
+    X, y = bulldozer_like_data(n=n)
+    Y = pd.DataFrame({'price':y,
+                      'age':2010 - X['YearMade'] + np.random.normal(0, 1, n),
+                      'hours':X['MachineHours'] * 2})
+    return X, Y
+
+
+def test_one_fit_for_all_targets(monkeypatch):
+    X, Y = multi_target_data()
+    nfits = []
+    fit = RandomForestClassifier.fit
+    def counting_fit(self, *args, **kwargs):
+        nfits.append(1)
+        return fit(self, *args, **kwargs)
+    monkeypatch.setattr(RandomForestClassifier, 'fit', counting_fit)
+    results = multi_target_partial_dependence(X, Y, 'YearMade', random_state=1)
+    assert list(results.keys())==['price', 'age', 'hours']
+    assert len(nfits)==1
+    multi_target_cat_partial_dependence(X, Y, 'ModelID', random_state=1)
+    assert len(nfits)==2
+
+
+def test_multi_target_same_as_one_target_at_a_time():
+    X, Y = multi_target_data()
+    for colname in ['YearMade', 'MachineHours']:
+        X_not_col = X.drop(colname, axis=1).values
+        stratifier = Stratifier(supervised=False).fit(X_not_col, None, random_state=1)
+        results = multi_target_partial_dependence(X, Y.values, colname, stratifier=stratifier)
+        assert list(results.keys())==[0, 1, 2]
+        for t, targetname in enumerate(Y.columns):
+            expected = partial_dependence(X, Y[targetname], colname, stratifier=stratifier)
+            for a, b in zip(expected, results[t]):
+                np.testing.assert_allclose(a, b)
+
+
+def test_multi_target_cat_same_as_one_target_at_a_time():
+    X, Y = multi_target_data()
+    X_not_col = X.drop('ModelID', axis=1).values
+    stratifier = Stratifier(min_samples_leaf=5, supervised=False).fit(X_not_col, None, random_state=1)
+    results = multi_target_cat_partial_dependence(X, Y, 'ModelID', stratifier=stratifier,
+                                                  solver='lsqr', random_state=1)
+    for targetname in Y.columns:
+        expected = cat_partial_dependence(X, Y[targetname], 'ModelID', stratifier=stratifier,
+                                          sparse=True, solver='lsqr', random_state=1)
+        result = results[targetname]
+        np.testing.assert_array_equal(result[0].deltas, expected[0].deltas)
+        np.testing.assert_array_equal(result[0].refcats, expected[0].refcats)
+        for a, b in zip(expected[2:], result[2:]):
+            np.testing.assert_array_equal(a, b)
+
+
+def test_multi_target_serial_kernels(monkeypatch):
+    import stratx.partdep
+    X, Y = multi_target_data()
+    expected = multi_target_partial_dependence(X, Y, 'YearMade', random_state=1)
+    cat_expected = multi_target_cat_partial_dependence(X, Y, 'ModelID', random_state=1)
+    def parallel_kernel(*args):
+        raise AssertionError("parallel numba kernel used with parallel_jit=False")
+    for name in ['_apply_trees', '_catwise_count_cats', '_catwise_deltas']:
+        monkeypatch.setattr(stratx.partdep, name, parallel_kernel)
+    results = multi_target_partial_dependence(X, Y, 'YearMade', parallel_jit=False, random_state=1)
+    cat_results = multi_target_cat_partial_dependence(X, Y, 'ModelID', parallel_jit=False, random_state=1)
+    for targetname in Y.columns:
+        for a, b in zip(expected[targetname], results[targetname]):
+            np.testing.assert_array_equal(a, b)
+        np.testing.assert_array_equal(cat_results[targetname][0].deltas, cat_expected[targetname][0].deltas)
+        for a, b in zip(cat_expected[targetname][2:], cat_results[targetname][2:]):
+            np.testing.assert_array_equal(a, b)
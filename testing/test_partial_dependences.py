@@ -0,0 +1,63 @@
+"""
+MIT License
+
+Copyright (c) 2019 Terence Parr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+import numpy as np
+import pandas as pd
+
+from stratx.partdep import *
+
+
+def synthetic_data(n=1000):
+    np.random.seed(1)
+    X = pd.DataFrame()
+    X['x1'] = np.random.randint(0, 20, size=n)
+    X['x2'] = np.random.random(size=n)
+    X['state'] = np.random.randint(1, 5, size=n)
+    y = X['x1'] ** 2 + 10 * X['x2'] + 5 * X['state']
+    return X, y
+
+
+def test_serial_matches_partial_dependence():
+    X, y = synthetic_data()
+    results = partial_dependences(X, y, colnames=['x1','x2'], n_jobs=1)
+    assert list(results.keys())==['x1','x2']
+    for colname in ['x1','x2']:
+        np.random.seed(1)
+        _, _, _, _, _, pdpx, pdpy, ignored = partial_dependence(X, y, colname)
+        _, _, _, _, _, pdpx_, pdpy_, ignored_ = results[colname]
+        np.testing.assert_array_equal(pdpx, pdpx_)
+        np.testing.assert_array_almost_equal(pdpy, pdpy_, decimal=5)
+
+
+def test_parallel_with_catcol():
+    X, y = synthetic_data()
+    results = partial_dependences(X, y, catcolnames=['state'], n_jobs=2)
+    assert set(results.keys())=={'x1','x2','state'}
+    pdpx, pdpy = results['x1'][5], results['x1'][6]
+    np.testing.assert_array_equal(pdpx, np.arange(0, 19)) # no slope beyond max x
+    assert np.corrcoef(pdpy, pdpx ** 2)[0,1] > .99
+    leaf_deltas, leaf_counts, avg_per_cat, count_per_cat, ignored, merge_ignored = results['state']
+    avg_per_cat = avg_per_cat[1:] - avg_per_cat[1]
+    np.testing.assert_array_almost_equal(avg_per_cat, [0, 5, 10, 15], decimal=0)
@@ -0,0 +1,195 @@
+"""
+MIT License
+
+Copyright (c) 2019 Terence Parr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+
+from stratx.partdep import *
+
+
+def bulldozer_like_data(n=2000, ncats=300):
+    np.random.seed(1)
+    X = pd.DataFrame()
+    X['YearMade'] = np.random.randint(1960, 2010, size=n)
+    X['MachineHours'] = np.random.random(size=n) * 1000
+    X['ModelID'] = np.random.randint(0, ncats, size=n)
+    cat_effects = np.random.normal(0, 100, size=ncats)
+    y = 10 * X['YearMade'] + X['MachineHours'] + cat_effects[X['ModelID']]
+    return X, y
+
+
+def fit_rf(X_not_col, y, min_samples_leaf=5):
+    rf = RandomForestRegressor(n_estimators=1, min_samples_leaf=min_samples_leaf,
+                               bootstrap=False, random_state=1)
+    rf.fit(X_not_col, y)
+    return rf
+
+
+def test_todense_matches_catwise_leaves():
+    X, y = bulldozer_like_data()
+    X_not_col, X_col = X.drop('ModelID', axis=1).values, X['ModelID'].values
+    rf = fit_rf(X_not_col, y)
+    max_catcode = np.max(X_col)
+    np.random.seed(3)
+    leaf_deltas, leaf_counts, refcats, ignored = \
+        catwise_leaves(rf, X_not_col, X_col, y.values, max_catcode)
+    np.random.seed(3)
+    cat_leaves, ignored_ = sparse_catwise_leaves(rf, X_not_col, X_col, y.values, max_catcode)
+    leaf_deltas_, leaf_counts_ = cat_leaves.todense()
+    np.testing.assert_array_equal(leaf_deltas, leaf_deltas_)
+    np.testing.assert_array_equal(leaf_counts, leaf_counts_)
+    np.testing.assert_array_equal(refcats, cat_leaves.refcats)
+    assert ignored==ignored_
+    assert len(cat_leaves.cats)==np.sum(leaf_counts>0)
+
+
+def test_sparse_merge_matches_dense_merge():
+    X, y = bulldozer_like_data()
+    X_not_col, X_col = X.drop('ModelID', axis=1).values, X['ModelID'].values
+    rf = fit_rf(X_not_col, y)
+    cat_leaves, _ = sparse_catwise_leaves(rf, X_not_col, X_col, y.values, np.max(X_col))
+    leaf_deltas, leaf_counts = cat_leaves.todense()
+    np.random.seed(5)
+    avg_per_cat, count_per_cat, merge_ignored = \
+        avg_values_at_cat(leaf_deltas, leaf_counts, cat_leaves.refcats)
+    np.random.seed(5)
+    avg_per_cat_, count_per_cat_, merge_ignored_ = avg_values_at_cat(cat_leaves)
+    np.testing.assert_array_almost_equal(avg_per_cat, avg_per_cat_)
+    np.testing.assert_array_equal(count_per_cat, count_per_cat_)
+    assert merge_ignored==merge_ignored_
+
+
+def test_no_leaves():
+    cat_leaves = CatLeafDeltas(np.array([0]), np.empty(0, dtype=int), np.empty(0),
+                               np.empty(0, dtype=int), np.empty(0, dtype=int), max_catcode=3)
+    avg_per_cat, count_per_cat, merge_ignored = avg_values_at_cat(cat_leaves)
+    assert np.isnan(avg_per_cat).all() and len(avg_per_cat)==4
+    np.testing.assert_array_equal(count_per_cat, [0, 0, 0, 0])
+    assert merge_ignored==0
+
+
+def test_no_dense_leaves():
+    leaf_deltas = np.empty(shape=(4, 0))
+    leaf_counts = np.empty(shape=(4, 0), dtype=int)
+    avg_per_cat, count_per_cat, merge_ignored = \
+        avg_values_at_cat(leaf_deltas, leaf_counts, np.empty(0, dtype=int))
+    assert np.isnan(avg_per_cat).all() and len(avg_per_cat)==4
+    np.testing.assert_array_equal(count_per_cat, [0, 0, 0, 0])
+    assert merge_ignored==0
+    # every leaf has a single category so none is kept
+    X = pd.DataFrame({'x1':np.arange(20), 'cat':np.repeat([1, 2], 10)})
+    y = pd.Series(np.arange(20, dtype=float))
+    avg_per_cat, count_per_cat, ignored, merge_ignored = \
+        cat_partial_dependence(X, y, 'cat', min_samples_leaf=10, random_state=1)[2:]
+    assert np.isnan(avg_per_cat).all() and ignored==20 and merge_ignored==0
+
+
+def test_lsqr_solver_recovers_cat_effects():
+    X, y = bulldozer_like_data()
+    np.random.seed(1) # regenerate the cat effects used in bulldozer_like_data()
+    n, ncats = len(X), 300
+    np.random.randint(1960, 2010, size=n); np.random.random(size=n); np.random.randint(0, ncats, size=n)
+    cat_effects = np.random.normal(0, 100, size=ncats)
+
+    X_not_col, X_col = X.drop('ModelID', axis=1).values, X['ModelID'].values
+    rf = fit_rf(X_not_col, y)
+    cat_leaves, _ = sparse_catwise_leaves(rf, X_not_col, X_col, y.values, np.max(X_col))
+    avg_per_cat, count_per_cat, merge_ignored = avg_values_at_cat(cat_leaves, solver='lsqr')
+    known = ~np.isnan(avg_per_cat)
+    assert np.sum(known) > .9 * ncats
+    assert np.corrcoef(avg_per_cat[known], cat_effects[known])[0,1] > .98
+    assert avg_per_cat[cat_leaves.refcats[0]] == 0.0
+
+    # dense input gives same answer
+    leaf_deltas, leaf_counts = cat_leaves.todense()
+    avg_per_cat_, count_per_cat_, merge_ignored_ = \
+        avg_values_at_cat(leaf_deltas, leaf_counts, cat_leaves.refcats, solver='lsqr')
+    np.testing.assert_array_almost_equal(avg_per_cat, avg_per_cat_)
+    np.testing.assert_array_equal(count_per_cat, count_per_cat_)
+    assert merge_ignored==merge_ignored_
+
+
+def two_component_cat_leaves():
+    # leaves 0,2 share cat 1; leaf 1 has cats 3,4 only; leaf 3 links 4 and 5
+    return CatLeafDeltas.fromdense(
+        leaf_deltas=np.array([[0.0,    np.nan, np.nan, np.nan],
+                              [2.0,    np.nan, 0.0,    np.nan],
+                              [np.nan, np.nan, 5.0,    np.nan],
+                              [np.nan, 0.0,    np.nan, np.nan],
+                              [np.nan, 1.0,    np.nan, 0.0],
+                              [np.nan, np.nan, np.nan, 3.0]]),
+        leaf_counts=np.array([[1, 0, 0, 0],
+                              [1, 0, 2, 0],
+                              [0, 0, 1, 0],
+                              [0, 2, 0, 0],
+                              [0, 1, 0, 1],
+                              [0, 0, 0, 4]]),
+        refcats=[0, 3, 1, 4])
+
+
+def test_cat_leaf_components():
+    cat_leaves = two_component_cat_leaves()
+    leaf_component, n_components = cat_leaf_components(cat_leaves)
+    np.testing.assert_array_equal(leaf_component, [0, 1, 0, 1])
+    assert n_components==2
+
+    avg_per_cat, count_per_cat, merge_ignored = avg_values_at_cat(cat_leaves)
+    np.testing.assert_array_equal(avg_per_cat, [0, 2, 7, np.nan, np.nan, np.nan])
+    assert merge_ignored==2+1+1+4
+
+
+def test_merge_cat_components():
+    cat_leaves = two_component_cat_leaves()
+    catavg, catavg_weight, cat_component, merge_ignored = \
+        merge_cat_components(cat_leaves, n_jobs=2, random_state=1)
+    np.testing.assert_array_equal(cat_component, [0, 0, 0, 1, 1, 1])
+    np.testing.assert_array_equal(catavg, [0, 2, 7, 0, 1, 4])
+    np.testing.assert_array_equal(catavg_weight, [1, 3, 1, 2, 2, 4])
+    assert merge_ignored==0
+
+    X, y = bulldozer_like_data()
+    X_not_col, X_col = X.drop('ModelID', axis=1).values, X['ModelID'].values
+    cat_leaves, _ = sparse_catwise_leaves(fit_rf(X_not_col, y), X_not_col, X_col, y.values, np.max(X_col))
+    serial = merge_cat_components(cat_leaves, n_jobs=1, random_state=7)
+    parallel = merge_cat_components(cat_leaves, n_jobs=4, random_state=7)
+    for a, b in zip(serial, parallel):
+        np.testing.assert_array_equal(a, b)
+
+
+def test_cat_partial_dependence_merge_components():
+    X, y = bulldozer_like_data()
+    X_not_col = X.drop('ModelID', axis=1).values
+    stratifier = Stratifier(min_samples_leaf=5).fit(X_not_col, y.values, random_state=1)
+    leaf_deltas, _, avg_per_cat, count_per_cat, ignored, merge_ignored = \
+        cat_partial_dependence(X, y, 'ModelID', sparse=True, stratifier=stratifier,
+                               merge_components=True, merge_n_jobs=2, random_state=1)
+    serial = cat_partial_dependence(X, y, 'ModelID', sparse=True, stratifier=stratifier,
+                                    merge_components=True, random_state=1)
+    np.testing.assert_array_equal(avg_per_cat, serial[2])
+    np.testing.assert_array_equal(count_per_cat, serial[3])
+    assert merge_ignored==serial[5]
+    # every category seen in a kept leaf gets a value, not just the first component
+    assert np.sum(~np.isnan(avg_per_cat))==len(np.unique(leaf_deltas.cats))
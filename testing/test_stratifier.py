@@ -0,0 +1,154 @@
+"""
+MIT License
+
+Copyright (c) 2019 Terence Parr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+import numpy as np
+import pytest
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+
+from stratx.partdep import *
+from test_sparse_catwise_leaves import bulldozer_like_data
+
+
+def test_cat_partial_dependence_fits_forest_once(monkeypatch):
+    X, y = bulldozer_like_data()
+    nfits = []
+    fit = RandomForestRegressor.fit
+    def counting_fit(self, *args, **kwargs):
+        nfits.append(1)
+        return fit(self, *args, **kwargs)
+    monkeypatch.setattr(RandomForestRegressor, 'fit', counting_fit)
+    cat_partial_dependence(X, y, 'ModelID', random_state=1)
+    assert len(nfits)==1
+
+
+def test_prefit_stratifier_matches_internal_fit():
+    X, y = bulldozer_like_data()
+    X_not_col = X.drop('ModelID', axis=1).values
+    expected = cat_partial_dependence(X, y, 'ModelID', random_state=1)
+
+    rng = np.random.default_rng(1)
+    stratifier = Stratifier(min_samples_leaf=5).fit(X_not_col, y.values, random_state=rng)
+    result = cat_partial_dependence(X, y, 'ModelID', stratifier=stratifier, random_state=rng)
+    for a, b in zip(expected, result):
+        np.testing.assert_array_equal(a, b)
+
+
+def test_unsupervised_cat_partial_dependence():
+    X, y = bulldozer_like_data()
+    leaf_deltas, leaf_counts, avg_per_cat, count_per_cat, ignored, merge_ignored = \
+        cat_partial_dependence(X, y, 'ModelID', supervised=False, random_state=1)
+    assert np.sum(~np.isnan(avg_per_cat)) > 0
+
+
+def test_partial_dependence_with_prefit_model_or_leaf_ids():
+    np.random.seed(1)
+    n = 1000
+    X = pd.DataFrame({'x1': np.random.random(n), 'x2': np.random.randint(0, 30, n)})
+    y = X['x1'] + X['x2']**2
+    X_not_col = X.drop('x2', axis=1).values
+    rf = RandomForestRegressor(n_estimators=3, min_samples_leaf=10, random_state=1)
+    rf.fit(X_not_col, y)
+
+    from_model = partial_dependence(X, y, 'x2', stratifier=rf)
+    from_leaf_ids = partial_dependence(X, y, 'x2', stratifier=rf.apply(X_not_col))
+    for a, b in zip(from_model, from_leaf_ids):
+        np.testing.assert_array_equal(a, b)
+    pdpx, pdpy = from_model[5], from_model[6]
+    assert np.corrcoef(pdpy, pdpx**2)[0,1] > .99
+
+    # prefit Stratifier with the same random stream matches fitting internally
+    expected = partial_dependence(X, y, 'x2', random_state=2)
+    rng = np.random.default_rng(2)
+    stratifier = Stratifier(min_samples_leaf=10).fit(X_not_col, y.values, random_state=rng)
+    result = partial_dependence(X, y, 'x2', stratifier=stratifier, random_state=rng)
+    for a, b in zip(expected, result):
+        np.testing.assert_array_equal(a, b)
+
+
+def test_cat_partial_dependence_with_leaf_ids():
+    X, y = bulldozer_like_data()
+    X_not_col = X.drop('ModelID', axis=1).values
+    stratifier = Stratifier(min_samples_leaf=5).fit(X_not_col, y.values, random_state=1)
+    from_stratifier = cat_partial_dependence(X, y, 'ModelID', stratifier=stratifier, random_state=3)
+    from_leaf_ids = cat_partial_dependence(X, y, 'ModelID', stratifier=stratifier.apply(X_not_col),
+                                           random_state=3)
+    for a, b in zip(from_stratifier, from_leaf_ids):
+        np.testing.assert_array_equal(a, b)
+
+    with pytest.raises(ValueError):
+        cat_partial_dependence(X.iloc[:10], y.iloc[:10], 'ModelID',
+                               stratifier=stratifier.apply(X_not_col))
+
+
+def test_hist_stratifier():
+    np.random.seed(1)
+    n = 5000
+    X = pd.DataFrame({'x1': np.random.normal(size=n),
+                      'x2': np.random.randint(0, 30, n),
+                      'x3': np.random.randint(0, 4, n)})
+    y = X['x1'] + X['x2']**2 + 10*X['x3']
+    X_not_col = X.drop('x2', axis=1).values
+    stratifier = HistStratifier(min_samples_leaf=10).fit(X_not_col, y.values)
+    leaves = leaf_samples(stratifier, X_not_col)
+    assert leaves.leaf_sizes().min() >= 10
+    assert len(leaves) > 100
+    # x3 has 4 values so each gets its own bin; x1 gets quantile bins
+    np.testing.assert_array_equal(stratifier.bin_edges[1], [1, 2, 3])
+    assert len(stratifier.bin_edges[0])==255
+
+    pdpx, pdpy = partial_dependence(X, y, 'x2', stratifier=stratifier)[5:7]
+    assert np.corrcoef(pdpy, pdpx**2)[0,1] > .99
+
+    kwargs = dict(n_trees=3, min_samples_leaf=20, bootstrap=True, max_features=.5)
+    leaf_ids = HistStratifier(**kwargs).fit(X_not_col, y.values, random_state=1).apply(X_not_col)
+    assert leaf_ids.shape==(n, 3)
+    np.testing.assert_array_equal(
+        leaf_ids, HistStratifier(**kwargs).fit(X_not_col, y.values, random_state=1).apply(X_not_col))
+    unsupervised = HistStratifier(supervised=False).fit(X_not_col, None, random_state=1)
+    assert len(unsupervised.leaves(X_not_col)) > 1
+
+
+def test_permuted_twoclass_scrambles_each_column():
+    np.random.seed(1)
+    n = 1000
+    X = np.column_stack([np.arange(n), np.arange(n) * 2.0])
+    X_synth, y_synth = permuted_twoclass(X, rng=np.random.default_rng(1))
+    assert X_synth.shape==(2*n, 2) and X_synth.dtype==np.float32
+    np.testing.assert_array_equal(y_synth, np.repeat([0., 1.], n))
+    np.testing.assert_array_equal(X_synth[:n], X)
+    scrambled = X_synth[n:]
+    for j in range(2): # same marginals but different order
+        np.testing.assert_array_equal(np.sort(scrambled[:,j]), X[:,j])
+        assert not np.array_equal(scrambled[:,j], X[:,j])
+    # columns are permuted independently, destroying the x1 = x0*2 relationship
+    assert not np.array_equal(scrambled[:,1], scrambled[:,0] * 2)
+
+
+def test_df_scramble_shuffles_values():
+    X = pd.DataFrame({'a':np.arange(100), 'b':np.arange(100)})
+    X_rand = df_scramble(X, rng=np.random.default_rng(1))
+    assert not X_rand['a'].equals(X['a'])
+    np.testing.assert_array_equal(np.sort(X_rand['a'].values), X['a'].values)
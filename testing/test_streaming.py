@@ -0,0 +1,114 @@
+"""
+MIT License
+
+Copyright (c) 2019 Terence Parr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from stratx.partdep import *
+from stratx.partdep import _slopes_from_groups
+
+
+def synthetic_data(n=5000):
+    np.random.seed(3)
+    X = pd.DataFrame({'a': np.random.randint(0, 30, n),
+                      'b': np.random.random(n),
+                      'c': np.random.randint(0, 5, n)})
+    y = X['a']**2 + 3*X['b'] + 10*X['c'] + np.random.normal(0, 1, n)
+    return X, y
+
+
+def test_leaf_x_stats_merge_matches_all_at_once():
+    np.random.seed(1)
+    n = 1000
+    leaf = np.random.randint(0, 20, n).astype(np.int64)
+    x = np.random.randint(0, 10, n).astype(float)
+    y = np.random.random(n)
+    expected = LeafXStats.from_arrays(leaf, x, y)
+    parts = [LeafXStats.from_arrays(leaf[s], x[s], y[s])
+             for s in (slice(0, 300), slice(300, 301), slice(301, 1000))]
+    for merged in (parts[0].merge(parts[1]).merge(parts[2]),
+                   parts[2].merge(parts[0].merge(parts[1]))):
+        np.testing.assert_array_equal(merged.leaf, expected.leaf)
+        np.testing.assert_array_equal(merged.x, expected.x)
+        np.testing.assert_array_equal(merged.count, expected.count)
+        np.testing.assert_array_almost_equal(merged.sum_y, expected.sum_y)
+
+
+@pytest.mark.parametrize("colname", ['a', 'c'])
+def test_streaming_matches_in_memory(tmp_path, colname):
+    X, y = synthetic_data()
+    path = str(tmp_path / "data.npy")
+    np.save(path, np.column_stack([X.values, y.values]))
+    X_not_col = X.drop(colname, axis=1).values
+    stratifier = Stratifier(n_trees=2, min_samples_leaf=5).fit(X_not_col, y.values, random_state=1)
+
+    expected = partial_dependence(X, y, colname, stratifier=stratifier)
+    result = streaming_partial_dependence(path, list(X.columns).index(colname), 3,
+                                          chunk_size=700, stratifier=stratifier)
+    for a, b in zip(expected, result):
+        np.testing.assert_array_almost_equal(a, b)
+    if colname=='c':
+        assert result[7] > 0 # some leaves have a single c value
+
+
+def test_streaming_fits_on_sample():
+    X, y = synthetic_data()
+    data = np.column_stack([X.values, y.values])
+    pdpx, pdpy, ignored = streaming_partial_dependence(data, 0, 3, sample_size=2000,
+                                                       chunk_size=1000, random_state=1)[5:]
+    assert np.corrcoef(pdpy, pdpx**2)[0,1] > .99
+
+
+def test_streaming_feather(tmp_path):
+    pytest.importorskip("pyarrow")
+    X, y = synthetic_data()
+    df = X.copy()
+    df['y'] = y
+    path = str(tmp_path / "data.feather")
+    df.to_feather(path)
+    stratifier = Stratifier(min_samples_leaf=5).fit(X[['b','c']].values, y.values, random_state=1)
+    expected = partial_dependence(X, y, 'a', stratifier=stratifier)
+    result = streaming_partial_dependence(path, 'a', 'y', chunk_size=700, stratifier=stratifier)
+    for a, b in zip(expected, result):
+        np.testing.assert_array_almost_equal(a, b)
+
+
+def test_empty_input_gives_no_slopes():
+    leaf_xranges, leaf_slopes, slope_leaves, ignored = \
+        _slopes_from_groups(np.empty(0, dtype=int), np.empty(0), np.empty(0), np.empty(0, dtype=int))
+    assert leaf_xranges.shape==(0, 2) and len(leaf_slopes)==0 and len(slope_leaves)==0
+    assert ignored==0
+    empty = LeafXStats.from_arrays(np.empty(0, dtype=np.int64), np.empty(0), np.empty(0))
+    assert len(empty.slopes()[1])==0
+
+    X, y = synthetic_data()
+    stratifier = Stratifier(min_samples_leaf=5).fit(X[['b','c']].values, y.values, random_state=1)
+    data = np.column_stack([X.values, y.values])
+    merged = LeafXStats.from_arrays(np.arange(3), np.ones(3), np.ones(3)).merge(empty)
+    np.testing.assert_array_equal(merged.count, [1, 1, 1])
+    # a table with no rows at all
+    pdpx, pdpy, ignored = streaming_partial_dependence(data[:0], 0, 3, stratifier=stratifier)[5:]
+    assert len(pdpx)==0 and ignored==0
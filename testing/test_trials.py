@@ -0,0 +1,105 @@
+"""
+MIT License
+
+Copyright (c) 2019 Terence Parr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+import os
+import subprocess
+import sys
+import numpy as np
+import pandas as pd
+
+from stratx.partdep import *
+from test_partial_dependences import synthetic_data
+
+
+def test_stratpd_trials_same_for_any_n_jobs():
+    X, y = synthetic_data()
+    serial = stratpd_trials(X, y, 'x2', n_trials=4, n_jobs=1, random_state=99)
+    threaded = stratpd_trials(X, y, 'x2', n_trials=4, n_jobs=4, random_state=99)
+    assert len(serial)==len(threaded)==4
+    for a, b in zip(serial, threaded):
+        np.testing.assert_array_equal(a[5], b[5]) # pdpx
+        np.testing.assert_array_equal(a[6], b[6]) # pdpy
+
+
+def test_stratpd_trials_differ_across_trials():
+    X, y = synthetic_data()
+    trials = stratpd_trials(X, y, 'x2', n_trials=2, random_state=99)
+    assert not np.array_equal(trials[0][5], trials[1][5])
+
+
+def test_catstratpd_trials_same_for_any_n_jobs():
+    X, y = synthetic_data()
+    serial = catstratpd_trials(X, y, 'state', n_trials=4, n_jobs=1, random_state=5, max_catcode=4)
+    threaded = catstratpd_trials(X, y, 'state', n_trials=4, n_jobs=2, random_state=5, max_catcode=4)
+    for a, b in zip(serial, threaded):
+        np.testing.assert_array_equal(a[2], b[2]) # avg_per_cat
+
+
+def test_leaf_bootstrap_bands():
+    X, y = synthetic_data()
+    y = y + np.random.normal(0, 10, size=len(y))
+    *_, pdpx, pdpy, ignored, pdpy_bands = \
+        partial_dependence(X, y, 'x1', n_leaf_bootstraps=50, random_state=3)
+    assert pdpy_bands.shape==(2, len(pdpx))
+    assert (pdpy_bands[0] <= pdpy_bands[1]).all()
+    assert pdpy_bands[0][0]==pdpy_bands[1][0]==0
+    # point estimate should mostly lie within the bands
+    assert np.mean((pdpy_bands[0] <= pdpy) & (pdpy <= pdpy_bands[1])) > .8
+    *_, pdpy_bands_ = partial_dependence(X, y, 'x1', n_leaf_bootstraps=50, random_state=3)
+    np.testing.assert_array_equal(pdpy_bands, pdpy_bands_)
+
+
+def run_with_workqueue_layer(code):
+    """
+    Run code in a fresh interpreter using numba's workqueue threading layer, which
+    aborts the process if parallel kernels are entered from several threads at once.
+    """
+    testing_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, NUMBA_THREADING_LAYER='workqueue', NUMBA_NUM_THREADS='4',
+               PYTHONPATH=os.pathsep.join([os.path.dirname(testing_dir), testing_dir]))
+    script = "from stratx.partdep import *\nfrom test_partial_dependences import synthetic_data\n" + code
+    result = subprocess.run([sys.executable, '-c', script], env=env, cwd=testing_dir,
+                            capture_output=True, text=True)
+    assert result.returncode==0, result.stderr
+
+
+def test_threaded_trials_with_workqueue_layer():
+    run_with_workqueue_layer("X, y = synthetic_data()\n"
+                             "stratpd_trials(X, y, 'x2', n_trials=8, n_jobs=8, random_state=1)\n")
+
+
+def test_threaded_cat_trials_with_workqueue_layer():
+    run_with_workqueue_layer("X, y = synthetic_data()\n"
+                             "catstratpd_trials(X, y, 'state', n_trials=8, n_jobs=8, random_state=1,\n"
+                             "                  max_catcode=4, sparse=True)\n")
+
+
+def test_catstratpd_trials_same_with_serial_kernels():
+    X, y = synthetic_data()
+    serial = catstratpd_trials(X, y, 'state', n_trials=3, n_jobs=1, random_state=5, max_catcode=4)
+    threaded = catstratpd_trials(X, y, 'state', n_trials=3, n_jobs=3, random_state=5, max_catcode=4)
+    for a, b in zip(serial, threaded):
+        for u, v in zip(a[2:], b[2:]):
+            np.testing.assert_array_equal(u, v)
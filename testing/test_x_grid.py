@@ -0,0 +1,56 @@
+"""
+MIT License
+
+Copyright (c) 2019 Terence Parr
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+import numpy as np
+import pandas as pd
+
+from stratx.partdep import *
+
+
+def test_snap_to_grid():
+    x = np.array([-1, 0, .4, .5, .6, 2.9, 3, 10])
+    np.testing.assert_array_equal(snap_to_grid(x, [0, 1, 3]), [0, 0, 0, 0, 1, 3, 3, 3])
+    np.testing.assert_array_equal(snap_to_grid(x, [3, 0, 1, 1]), [0, 0, 0, 0, 1, 3, 3, 3])
+    np.testing.assert_array_equal(snap_to_grid(x, [5]), [5]*len(x))
+    quantiles = snap_to_grid(np.arange(101), 5)
+    np.testing.assert_array_equal(np.unique(quantiles), [0, 25, 50, 75, 100])
+
+
+def test_partial_dependence_on_grid():
+    np.random.seed(1)
+    n = 5000
+    X = pd.DataFrame({'a': np.random.uniform(0, 10, n), 'b': np.random.random(n)})
+    y = X['a']**2 + X['b']
+    dense = partial_dependence(X, y, 'a', random_state=1)
+    assert len(dense)==8
+
+    for x_grid, max_nx in [(30, 30), (np.linspace(0, 10, 21), 21)]:
+        result = partial_dependence(X, y, 'a', x_grid=x_grid, random_state=1)
+        assert len(result)==9
+        pdpx, pdpy, ignored, x_snap_error = result[5:]
+        assert len(pdpx) <= max_nx
+        assert 0 < x_snap_error < 10 / max_nx
+        pdpy_true = pdpx**2 - pdpx[0]**2
+        assert np.max(np.abs(pdpy - pdpy_true)) < 5